@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+分析会话模块
+
+每个分析会话（实时收集的一个设备、一次导入、一次 ES 搜索）拥有独立的状态：
+绑定的规则集、事件追踪（事件顺序、事件组、最终检查统计）以及实时收集的进程和线程。
+会话之间不共享可变状态，因此导入可以与实时收集同时进行，互不影响；
+同一会话的分析、重置和切换规则集由会话自己的锁串行化，不需要全局锁。
+
+会话绑定一个不可变的 CompiledRuleset。配置更新时注册表发布新的规则集：
+新建的会话使用新规则集，实时收集会话切换到新规则集（保留已触发的事件），
+导入和搜索会话继续使用开始时的规则集直到结束。
+
+本模块不依赖 Flask 或 Socket.IO，事件通过 emit(event, data) 回调发送，
+行为触发、事件顺序违规和事件组事件都携带会话ID，客户端据此区分并发的会话。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from ep_py.behavior_engine import CompiledRuleset
+from ep_py.event_tracker import EventTracker
+
+
+class AnalysisSession:
+    """单个分析会话"""
+
+    def __init__(self, kind, platform, ruleset, emit, key=None, on_hit=None):
+        """
+        参数:
+            kind (str): 会话类型（'live'、'import'、'es'）
+            platform (str): 日志来源平台
+            ruleset (CompiledRuleset): 绑定的规则集
+            emit (callable): 事件发送函数 emit(event, data)
+            key (str, optional): 会话键，例如实时收集的 'android:<设备序列号>'，用于查找同一来源的会话
+            on_hit (callable, optional): 每次行为命中时调用 on_hit(behavior_name)，用于统计
+        """
+        self.id = f'{kind}-{uuid.uuid4().hex[:10]}'
+        self.kind = kind
+        self.platform = platform
+        self.key = key
+        self.ruleset = ruleset
+        self.tracker = EventTracker(ruleset.config, ruleset.version)
+        self.emit = emit
+        self.on_hit = on_hit
+        self.status = 'active'
+        self.created_at = time.time()
+        self.finished_at = None
+        self.history_session = None  # 当前使用的日志历史会话ID
+        self.lock = threading.RLock()
+
+        # 实时收集资源（只有 live 会话使用）
+        self.active = False      # 日志流控制标志
+        self.log_process = None  # 主日志进程
+        self.grep_process = None  # grep 过滤进程
+        self.threads = []        # 活跃线程列表
+
+    def rebind(self, ruleset):
+        """
+        切换到新的规则集
+
+        在会话锁内完成，正在分析的一行日志先按旧规则集处理完，之后的日志按新规则集处理，不会丢失日志。
+        已触发的事件和事件组进度迁移到新配置中仍然存在的行为，迁移后新完成的事件组会发送完成通知。
+        """
+        with self.lock:
+            if ruleset is self.ruleset:
+                return
+            self.ruleset = ruleset
+            notices = self.tracker.configure(ruleset.config, ruleset.version)
+            for event, data in notices:
+                if event != 'log':
+                    data['session'] = self.id
+                self.emit(event, data)
+
+    def analyze(self, log_message, results=None):
+        """
+        分析一行日志
+
+        参数:
+            log_message (str): 日志内容
+            results (list, optional): 已在其他进程中计算好的匹配结果（并行导入），为空时使用会话规则集匹配
+
+        返回:
+            bool: 是否为可能的错误行
+        """
+        with self.lock:
+            is_error = self.tracker.observe_line(log_message)
+            if results is None:
+                results = self.ruleset.matcher.match(log_message)
+            for result in results:
+                self.apply_result(result, log_message)
+            return is_error
+
+    def analyze_batch(self, log_messages):
+        """
+        按顺序分析一批日志（例如一页搜索结果），整批只获取一次会话锁
+
+        与逐行调用 analyze 的结果完全一致。
+
+        参数:
+            log_messages (list): 日志内容
+
+        返回:
+            int: 可能的错误行数
+        """
+        error_count = 0
+        with self.lock:
+            matcher = self.ruleset.matcher
+            for log_message in log_messages:
+                if self.tracker.observe_line(log_message):
+                    error_count += 1
+                for result in matcher.match(log_message):
+                    self.apply_result(result, log_message)
+        return error_count
+
+    def apply_result(self, result, log_message):
+        """
+        处理一个行为匹配结果（有状态部分）
+
+        按日志顺序更新事件顺序和事件组状态并发送行为触发事件。
+        顺序导入和并行导入都通过本方法处理命中结果，因此结果完全一致。
+
+        参数:
+            result (dict): BehaviorMatcher.match 返回的匹配结果
+            log_message (str): 日志消息
+        """
+        # 发送匹配、提取和验证过程中产生的系统日志
+        for message in result['messages']:
+            self.emit('log', {'platform': 'system', 'message': message})
+        if not result['matched']:
+            return
+
+        behavior_id = result['behaviorId']
+        behavior_name = result['behaviorName']
+        validation_results = result['validationResults']
+
+        # 按日志顺序检查事件顺序和事件组
+        for event, data in self.tracker.track(behavior_name):
+            if event != 'log':
+                data['session'] = self.id
+            self.emit(event, data)
+
+        # 只携带行为引用（规则集版本 + 行为索引）和本次命中的数据
+        behavior_data = {
+            'behaviorId': behavior_id,
+            'behaviorName': behavior_name,
+            'rulesetVersion': self.ruleset.version,
+            'log': log_message,
+            'extractedData': result['extractedData'],
+            'validationResults': validation_results,
+            'platform': self.platform,
+            'session': self.id,
+            'timestamp': time.time()
+        }
+
+        # 如果有验证错误，在日志消息中添加错误信息
+        if validation_results and not validation_results.get('isValid', True) and validation_results.get('error'):
+            behavior_data['log'] = f"{log_message}\n\n[JSON Schema验证失败]: {validation_results.get('error')}"
+
+        self.emit('behavior_triggered', behavior_data)
+        if self.on_hit:
+            self.on_hit(behavior_name)
+
+        if validation_results.get('error'):
+            self.emit('log', {
+                'platform': 'system',
+                'message': f'Validation error in behavior "{behavior_name or "unknown"}": {validation_results["error"]}'
+            })
+
+    def reset(self):
+        """清空已触发的事件列表、事件组状态和最终检查统计"""
+        with self.lock:
+            self.tracker.reset()
+
+    def final_check(self, error_count=None):
+        """
+        获取最终检查结果（统计已增量维护，可以随时调用）
+
+        参数:
+            error_count (int, optional): 可能的错误行数，默认使用会话的统计
+
+        返回:
+            dict: 检查结果，包含会话ID
+        """
+        with self.lock:
+            results = self.tracker.final_check(error_count)
+        results['session'] = self.id
+        return results
+
+    def report_final_check(self, error_count=None, **extra):
+        """
+        执行最终检查并通过会话的 emit 发送结果（导入、回放和 ES 搜索使用同一份报告）
+
+        缺少必要事件时先发送警告日志，然后发送 final_check_results 事件。
+
+        参数:
+            error_count (int, optional): 可能的错误行数，默认使用会话的统计
+            **extra: 附加到结果中的非空字段，例如 job_id、replay_id，客户端据此关联到对应的任务
+
+        返回:
+            dict: 检查结果，包含会话ID和会话类型
+        """
+        results = self.final_check(error_count)
+        results['kind'] = self.kind
+        results.update({key: value for key, value in extra.items() if value})
+        for detail in results['details']:
+            if detail['type'] == 'missing_required_events':
+                self.emit('log', {'platform': 'system', 'message': f'警告: 缺少必要事件: {", ".join(detail["events"])}'})
+        self.emit('final_check_results', results)
+        return results
+
+    def incomplete_group_notices(self):
+        """生成所有未完成事件组的通知 [(事件名, 数据), ...]"""
+        with self.lock:
+            notices = self.tracker.incomplete_group_notices()
+        for event, data in notices:
+            if event != 'log':
+                data['session'] = self.id
+        return notices
+
+    def event_order(self):
+        """
+        保留的已触发事件序列
+
+        返回:
+            tuple: (起始位置 order_base, 最近触发的事件列表)
+        """
+        with self.lock:
+            return self.tracker.order_base, list(self.tracker.triggered_events)
+
+    def to_dict(self):
+        """会话状态摘要"""
+        return {
+            'session': self.id,
+            'kind': self.kind,
+            'platform': self.platform,
+            'key': self.key,
+            'status': self.status,
+            'active': self.active,
+            'rulesetVersion': self.ruleset.version,
+            'historySession': self.history_session,
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at,
+            'lines': self.tracker.line_count,
+            'errors': self.tracker.error_count,
+            'triggeredEvents': self.tracker.triggered_count
+        }
+
+
+class AnalysisSessionRegistry:
+    """分析会话注册表，保存当前规则集和所有会话"""
+
+    def __init__(self, emit, ruleset=None, on_hit=None, max_finished=20):
+        """
+        参数:
+            emit (callable): 事件发送函数 emit(event, data)
+            ruleset (CompiledRuleset, optional): 初始规则集，默认为空规则集
+            on_hit (callable, optional): 传给每个会话的命中统计回调
+            max_finished (int): 保留的已结束会话数量
+        """
+        self.emit = emit
+        self.on_hit = on_hit
+        self.max_finished = max_finished
+        self.ruleset = ruleset or CompiledRuleset({'behaviors': []})
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, ruleset):
+        """
+        发布新的规则集：之后创建的会话使用新规则集，未结束的实时收集会话切换到新规则集
+        """
+        with self._lock:
+            self.ruleset = ruleset
+            live_sessions = [
+                session for session in self._sessions.values()
+                if session.kind == 'live' and session.status != 'finished'
+            ]
+        for session in live_sessions:
+            session.rebind(ruleset)
+
+    def create(self, kind, platform, key=None, ruleset=None, emit=None):
+        """
+        创建并注册会话
+
+        参数:
+            kind (str): 会话类型
+            platform (str): 日志来源平台
+            key (str, optional): 会话键
+            ruleset (CompiledRuleset, optional): 绑定的规则集，默认为当前规则集
+            emit (callable, optional): 会话使用的事件发送函数，默认为注册表的 emit
+
+        返回:
+            AnalysisSession: 新会话
+        """
+        with self._lock:
+            session = AnalysisSession(kind, platform, ruleset or self.ruleset, emit or self.emit,
+                                      key=key, on_hit=self.on_hit)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        """按ID获取会话，不存在时返回 None"""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def find(self, kind, key):
+        """查找指定类型和键的最近一个未结束会话，不存在时返回 None"""
+        with self._lock:
+            for session in reversed(self._sessions.values()):
+                if session.kind == kind and session.key == key and session.status != 'finished':
+                    return session
+        return None
+
+    def current(self):
+        """最近创建的未结束会话（没有时为最近创建的会话），不存在时返回 None"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in reversed(sessions):
+            if session.status != 'finished':
+                return session
+        return sessions[-1] if sessions else None
+
+    def list(self, kind=None):
+        """按创建顺序列出会话"""
+        with self._lock:
+            return [session for session in self._sessions.values() if kind is None or session.kind == kind]
+
+    def finish(self, session):
+        """标记会话结束，超过保留数量的已结束会话从注册表中移除"""
+        with self._lock:
+            session.status = 'finished'
+            session.finished_at = time.time()
+            finished = [item.id for item in self._sessions.values() if item.status == 'finished']
+            for session_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._sessions[session_id]
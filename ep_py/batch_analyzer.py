@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量日志分析命令行工具
+
+不需要启动服务器和浏览器，直接用行为配置（config.yaml、config_minigame.yaml 等）分析大量归档日志。
+使用与服务器相同的行为匹配引擎和事件追踪逻辑，不依赖 Flask 或 Socket.IO。
+
+每个文件由进程池中的一个工作进程完整处理（文件之间并行），工作进程直接写出该文件的报告：
+- json: 一个 JSON 对象，包含命中记录、验证失败、顺序违规、事件组和最终检查结果
+- jsonl: 每行一条记录（hit / validation_failure / order_violation / group_completed / summary），
+         边分析边写出，内存占用与文件大小无关，适合超大文件
+
+所有文件处理完成后在输出目录写出 summary.json，包含每个文件的摘要和汇总。
+支持纯文本（mmap 扫描）、gzip、zstd 和 zip 压缩包。
+
+示例:
+    python ep_py/batch_analyzer.py --config config.yaml --output-dir reports '/data/runs/**/*.log.gz'
+    python ep_py/batch_analyzer.py --config config_minigame.yaml --format jsonl --workers 16 /data/runs
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+# 添加父目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ep_py.behavior_engine import BehaviorMatcher, compute_ruleset_version, resolve_workers
+from ep_py.event_tracker import EventTracker
+from ep_py.log_sources import expand_log_paths, open_log_lines
+
+
+def report_name(path, report_format):
+    """根据日志文件路径生成报告文件名（路径分隔符替换为 __，避免不同目录的同名文件冲突）"""
+    name = os.path.abspath(path).strip(os.sep).replace(os.sep, '__')
+    return f'{name}.report.{report_format}'
+
+
+class _ReportWriter:
+    """报告写出器：jsonl 逐条写出，json 在结束时整体写出"""
+
+    def __init__(self, path, report_format, include_hits):
+        self.path = path
+        self.format = report_format
+        self.include_hits = include_hits
+        self.records = {'hits': [], 'validation_failures': [], 'order_violations': [], 'completed_groups': []}
+        self._file = open(path, 'w', encoding='utf-8') if report_format == 'jsonl' else None
+
+    def add(self, record_type, key, record):
+        if record_type == 'hit' and not self.include_hits:
+            return
+        if self._file:
+            self._file.write(json.dumps(dict(record, type=record_type), ensure_ascii=False, default=str) + '\n')
+        else:
+            self.records[key].append(record)
+
+    def close(self, summary):
+        if self._file:
+            self._file.write(json.dumps(dict(summary, type='summary'), ensure_ascii=False, default=str) + '\n')
+            self._file.close()
+        else:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(dict(summary, **self.records), f, ensure_ascii=False, indent=2, default=str)
+
+
+def analyze_file(path, config, options):
+    """
+    分析单个日志文件并写出报告（在工作进程中运行）
+
+    参数:
+        path (str): 日志文件路径
+        config (dict): 行为配置
+        options (dict): output_dir、format、include_hits、member
+
+    返回:
+        dict: 文件摘要（不含命中明细）
+    """
+    started = time.time()
+    summary = {'file': path, 'status': 'completed', 'report': None}
+    try:
+        matcher = BehaviorMatcher(config)
+        tracker = EventTracker(config, compute_ruleset_version(config))
+        report_path = os.path.join(options['output_dir'], report_name(path, options['format']))
+        writer = _ReportWriter(report_path, options['format'], options['include_hits'])
+        hit_counts = {}
+        config_errors = set()
+        validation_failures = 0
+        order_violations = 0
+
+        with open(path, 'rb') as f:
+            lines, bytes_read, source_info = open_log_lines(f, options.get('member'), use_mmap=True)
+            for line_number, line in enumerate(lines, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                tracker.observe_line(line)
+                for result in matcher.match(line):
+                    if not result['matched']:
+                        config_errors.update(result['messages'])
+                        continue
+                    name = result['behaviorName']
+                    hit_counts[name] = hit_counts.get(name, 0) + 1
+                    hit = {
+                        'line': line_number,
+                        'behaviorId': result['behaviorId'],
+                        'behaviorName': name,
+                        'log': line,
+                        'extractedData': result['extractedData'],
+                        'validationResults': result['validationResults']
+                    }
+                    writer.add('hit', 'hits', hit)
+
+                    # 提取器或行为级验证失败
+                    errors = [
+                        {'extractor': extractor, 'error': data['error']}
+                        for extractor, data in result['extractedData'].items() if data.get('error')
+                    ]
+                    if result['validationResults'].get('error'):
+                        errors.append({'extractor': None, 'error': result['validationResults']['error']})
+                    if errors:
+                        validation_failures += 1
+                        writer.add('validation_failure', 'validation_failures',
+                                   {'line': line_number, 'behaviorName': name, 'errors': errors, 'log': line})
+
+                    for event, data in tracker.track(name):
+                        if event == 'event_order_violation':
+                            order_violations += 1
+                            writer.add('order_violation', 'order_violations', dict(
+                                data['violation'], line=line_number,
+                                group_name=data['group_name'], group_index=data['group_index']))
+                        elif event == 'event_group_completed':
+                            writer.add('group_completed', 'completed_groups', {
+                                'line': line_number, 'group_id': data['group_id'], 'group_name': data['group_name']})
+            byte_count = bytes_read()
+
+        final_check = tracker.final_check()
+        elapsed = time.time() - started
+        summary.update({
+            'report': report_path,
+            'source': source_info,
+            'lines': tracker.line_count,
+            'bytes': byte_count,
+            'elapsed': round(elapsed, 3),
+            'lines_per_sec': round(tracker.line_count / elapsed, 1) if elapsed > 0 else 0.0,
+            'error_count': tracker.error_count,
+            'hit_counts': hit_counts,
+            'validation_failures': validation_failures,
+            'order_violations': order_violations,
+            'incomplete_groups': next((detail['groups'] for detail in final_check['details']
+                                       if detail['type'] == 'incomplete_groups'), []),
+            'config_errors': sorted(config_errors),
+            'final_check': final_check
+        })
+        writer.close(summary)
+    except Exception as e:
+        summary.update({'status': 'failed', 'error': str(e), 'elapsed': round(time.time() - started, 3)})
+    return summary
+
+
+def aggregate(summaries, elapsed):
+    """汇总所有文件的摘要"""
+    completed = [summary for summary in summaries if summary['status'] == 'completed']
+    hit_counts = {}
+    check_statuses = {}
+    for summary in completed:
+        for name, count in summary['hit_counts'].items():
+            hit_counts[name] = hit_counts.get(name, 0) + count
+        status = summary['final_check']['status']
+        check_statuses[status] = check_statuses.get(status, 0) + 1
+    lines = sum(summary['lines'] for summary in completed)
+    total_bytes = sum(summary['bytes'] for summary in completed)
+    return {
+        'files': len(summaries),
+        'completed': len(completed),
+        'failed': len(summaries) - len(completed),
+        'lines': lines,
+        'bytes': total_bytes,
+        'elapsed': round(elapsed, 3),
+        'lines_per_sec': round(lines / elapsed, 1) if elapsed > 0 else 0.0,
+        'bytes_per_sec': round(total_bytes / elapsed, 1) if elapsed > 0 else 0.0,
+        'error_count': sum(summary['error_count'] for summary in completed),
+        'validation_failures': sum(summary['validation_failures'] for summary in completed),
+        'order_violations': sum(summary['order_violations'] for summary in completed),
+        'check_statuses': check_statuses,
+        'hit_counts': hit_counts
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='离线批量日志行为分析工具')
+    parser.add_argument('paths', nargs='+', help='日志文件、目录或通配符模式（支持 **）')
+    parser.add_argument('--config', default='config.yaml', help='行为配置文件 (如 config.yaml、config_minigame.yaml)')
+    parser.add_argument('--output-dir', default='reports', help='报告输出目录')
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='jsonl', help='每个文件的报告格式')
+    parser.add_argument('--workers', type=int, default=0, help='工作进程数量，0 表示使用全部 CPU 核心')
+    parser.add_argument('--recursive', action='store_true', help='目录包含子目录')
+    parser.add_argument('--member', help='zip 压缩包中要分析的成员')
+    parser.add_argument('--no-hits', action='store_true', help='报告中不写出每条命中记录，只保留计数')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+
+    files, unmatched = expand_log_paths(args.paths, args.recursive)
+    for pattern in unmatched:
+        print(f'没有匹配的文件: {pattern}', file=sys.stderr)
+    if not files:
+        sys.exit(1)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'output_dir': args.output_dir,
+        'format': args.format,
+        'include_hits': not args.no_hits,
+        'member': args.member
+    }
+    workers = min(resolve_workers(args.workers), len(files))
+    print(f'分析 {len(files)} 个文件，{workers} 个进程，规则集 {compute_ruleset_version(config)}', file=sys.stderr)
+
+    started = time.time()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_file, path, config, options) for path in files]
+        for future in as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            if summary['status'] == 'completed':
+                print(f"[{len(summaries)}/{len(files)}] {summary['file']}: {summary['lines']} 行, "
+                      f"{summary['lines_per_sec']} 行/秒, {summary['final_check']['message']}", file=sys.stderr)
+            else:
+                print(f"[{len(summaries)}/{len(files)}] {summary['file']}: 失败 - {summary['error']}", file=sys.stderr)
+
+    order = {path: i for i, path in enumerate(files)}
+    summaries.sort(key=lambda summary: order[summary['file']])
+    report = {
+        'config': os.path.abspath(args.config),
+        'rulesetVersion': compute_ruleset_version(config),
+        'aggregate': aggregate(summaries, time.time() - started),
+        'files': summaries
+    }
+    summary_path = os.path.join(args.output_dir, 'summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(json.dumps(report['aggregate'], ensure_ascii=False, indent=2))
+    print(f'报告已写出: {summary_path}', file=sys.stderr)
+
+    # 有文件分析失败时返回非零退出码，便于定时任务判断
+    if report['aggregate']['failed']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+"""
+行为匹配引擎模块
+
+把行为分析拆分为两部分：
+- 无状态部分（本模块）：行为正则匹配、数据提取和数据验证。每行日志的结果只取决于该行内容和规则集，
+  可以在任意进程中并行计算。正则表达式在规则集加载时编译一次。
+- 有状态部分（ep_py.event_tracker / ep_py.analysis_session）：事件顺序检查和事件组检查，
+  必须按日志原始顺序逐个处理命中结果。
+
+服务器（实时收集、导入）、ES 搜索服务和命令行工具都通过 CompiledRuleset 使用同一套匹配逻辑，
+同一行日志在任何入口得到的结果完全一致。
+
+并行导入时，日志按行边界切分为块，由进程池中的工作进程计算每块的命中结果，
+主进程按原始顺序回放命中结果，因此与顺序导入的结果完全一致。
+进程池由 MatchPoolRegistry 按规则集长期保留，同一规则集的导入复用已启动的工作进程。
+
+匹配结果是按行为顺序排列的列表，每一项为:
+    {
+        'behaviorId': int,          # 行为在配置中的索引
+        'behaviorName': str,
+        'matched': bool,            # False 表示行为的正则表达式无效，只需要报告 messages
+        'messages': list,           # 处理过程中产生的系统日志，按产生顺序排列
+        'extractedData': dict,
+        'validationResults': dict
+    }
+"""
+
+import copy
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from jsonschema import validate, ValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+
+# 从日志中提取 JSON 片段（支持一层嵌套的对象或数组）
+JSON_FRAGMENT_PATTERN = re.compile(r'({[^{}]*(?:{[^{}]*}[^{}]*)*}|\[[^\[\]]*(?:\[[^\[\]]*\][^\[\]]*)*\])')
+
+# 并行导入时每个块包含的行数
+DEFAULT_CHUNK_LINES = 5000
+
+
+def compute_ruleset_version(config):
+    """
+    计算规则集版本：配置内容规范化 JSON 的 SHA-1 前 12 位，配置不变时版本号不变
+    """
+    canonical = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def _note_module_field(json_obj, messages, prefix):
+    """记录 JSON 对象中 module 字段的值和类型（调试信息）"""
+    if messages is not None and isinstance(json_obj, dict) and 'properties' in json_obj \
+            and isinstance(json_obj['properties'], dict) and 'module' in json_obj['properties']:
+        module_value = json_obj['properties']['module']
+        messages.append(f'{prefix}: 值={module_value}, 类型={type(module_value).__name__}')
+
+
+class _JsonSchemaValidator:
+    """
+    预编译的 jsonSchema 验证器（与 jsonschema.validate 使用相同的验证器类和错误选择）
+
+    Schema 本身的有效性检查（check_schema）开销较大，在首次验证时执行一次，
+    因此编译大型配置时不需要逐个检查；Schema 无效时每次验证都抛出 SchemaError，与原来的行为一致。
+    """
+
+    __slots__ = ('schema', 'cls', 'validator', 'checked')
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.cls = validator_for(schema)
+        self.validator = self.cls(schema)
+        self.checked = False
+
+    def best_error(self, instance):
+        """返回最相关的验证错误，验证通过时返回 None"""
+        if not self.checked:
+            self.cls.check_schema(self.schema)
+            self.checked = True
+        return best_match(self.validator.iter_errors(instance))
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_canonical_schema(canonical):
+    return _JsonSchemaValidator(json.loads(canonical))
+
+
+def compile_json_schema(schema):
+    """
+    预编译 JSON Schema 验证器，内容相同的 Schema 共用同一个验证器
+
+    参数:
+        schema (dict): JSON Schema
+
+    返回:
+        _JsonSchemaValidator
+    """
+    try:
+        canonical = json.dumps(schema, sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return _JsonSchemaValidator(schema)
+    return _compile_canonical_schema(canonical)
+
+
+def _json_schema_validator(validation_rules):
+    """预编译验证规则中的 jsonSchema，没有时返回 None"""
+    if isinstance(validation_rules, dict) and isinstance(validation_rules.get('jsonSchema'), dict):
+        return compile_json_schema(validation_rules['jsonSchema'])
+    return None
+
+
+def validate_data_by_type(data, data_type, validation_rules=None, messages=None, schema_validator=None):
+    """
+    根据指定类型和规则验证数据
+
+    支持多种数据类型的验证，包括 JSON、数字、布尔值和文本。
+    可以应用额外的验证规则，如 JSON Schema、数值范围、字符串长度等。
+
+    参数:
+        data: 需要验证的原始数据
+        data_type (str): 数据类型 ('json', 'number', 'boolean', 'text')
+        validation_rules (dict, optional): 额外的验证规则
+        messages (list, optional): 收集验证过程中产生的系统日志
+        schema_validator (optional): compile_json_schema 预编译的 jsonSchema 验证器，为空时每次编译
+
+    返回:
+        tuple: (是否有效, 解析后的数据, 错误信息)
+            - (True, parsed_data, None): 验证通过
+            - (False, None, error_message): 验证失败
+
+    支持的验证规则:
+        - jsonSchema: JSON 数据的 Schema 验证
+        - numberRange: 数值范围验证 (min, max)
+        - stringLength: 字符串长度验证 (min, max)
+    """
+    note = messages.append if messages is not None else (lambda message: None)
+    try:
+        if data_type == 'json':
+            # JSON 数据类型处理
+            if isinstance(data, str):
+                parsed_data = json.loads(data)  # 解析 JSON 字符串
+            else:
+                parsed_data = data
+
+            # 应用 JSON Schema 验证（如果提供）
+            if validation_rules and 'jsonSchema' in validation_rules:
+                note(f'开始进行JSON Schema验证: {json.dumps(parsed_data, ensure_ascii=False)[:100]}...')
+
+                # 检查是否有module字段，并记录其类型
+                if 'properties' in parsed_data and 'module' in parsed_data['properties']:
+                    module_value = parsed_data['properties']['module']
+                    note(f'JSON Schema验证前检查: module字段值={module_value}, 类型={type(module_value).__name__}')
+
+                    # 检查schema中module字段的定义
+                    if 'properties' in validation_rules['jsonSchema'] and \
+                       'properties' in validation_rules['jsonSchema']['properties'] and \
+                       'module' in validation_rules['jsonSchema']['properties']['properties']['properties']:
+                        module_schema = validation_rules['jsonSchema']['properties']['properties']['properties']['module']
+                        note(f'Schema中module字段定义: {json.dumps(module_schema, ensure_ascii=False)}')
+
+                try:
+                    if schema_validator is not None:
+                        error = schema_validator.best_error(parsed_data)
+                        if error is not None:
+                            raise error
+                    else:
+                        validate(instance=parsed_data, schema=validation_rules['jsonSchema'])
+                    note('JSON Schema验证通过')
+                except ValidationError as e:
+                    error_path = '.'.join(str(p) for p in e.path)
+                    error_message = f'JSON Schema验证失败: 路径 {error_path}, 错误: {e.message}'
+                    note(error_message)
+                    return False, None, error_message
+            return True, parsed_data, None
+
+        elif data_type == 'number':
+            # 数字类型处理
+            num_data = float(data)
+
+            # 应用数值范围验证（如果提供）
+            if validation_rules and 'numberRange' in validation_rules:
+                range_rules = validation_rules['numberRange']
+                # 检查最小值
+                if 'min' in range_rules and num_data < range_rules['min']:
+                    return False, None, f"Number {num_data} is below minimum {range_rules['min']}"
+                # 检查最大值
+                if 'max' in range_rules and num_data > range_rules['max']:
+                    return False, None, f"Number {num_data} is above maximum {range_rules['max']}"
+            return True, num_data, None
+
+        elif data_type == 'boolean':
+            # 布尔类型处理
+            if isinstance(data, str):
+                # 字符串转布尔值，支持多种表示方式
+                bool_data = data.lower() in ('true', '1', 'yes', 'on')
+            else:
+                bool_data = bool(data)  # 直接转换为布尔值
+            return True, bool_data, None
+
+        elif data_type == 'text':
+            # 文本类型处理
+            str_data = str(data)  # 转换为字符串
+            # 应用字符串长度验证（如果提供）
+            if validation_rules and 'stringLength' in validation_rules:
+                length_rules = validation_rules['stringLength']
+                # 检查最小长度
+                if 'min' in length_rules and len(str_data) < length_rules['min']:
+                    return False, None, f"String length {len(str_data)} is below minimum {length_rules['min']}"
+                # 检查最大长度
+                if 'max' in length_rules and len(str_data) > length_rules['max']:
+                    return False, None, f"String length {len(str_data)} is above maximum {length_rules['max']}"
+            return True, str_data, None
+
+        else:
+            # 未知类型，直接返回原数据
+            return True, data, None
+
+    except json.JSONDecodeError as e:
+        return False, None, f"Invalid JSON format: {str(e)}"
+    except ValueError as e:
+        return False, None, f"Invalid {data_type} format: {str(e)}"
+    except ValidationError as e:
+        return False, None, f"JSON schema validation failed: {e.message}"
+    except Exception as e:
+        return False, None, f"Validation error: {str(e)}"
+
+
+class _CompiledExtractor:
+    """预编译的数据提取器"""
+
+    __slots__ = ('name', 'pattern', 'regex', 'error', 'regex_error', 'data_type', 'validation', 'has_validation',
+                 'schema_validator')
+
+    def __init__(self, extractor):
+        self.name = extractor.get('name', 'unknown')
+        self.pattern = extractor.get('pattern')
+        self.data_type = extractor.get('dataType', 'text')  # 默认为文本类型
+        self.validation = extractor.get('validation')
+        self.has_validation = 'validation' in extractor
+        self.schema_validator = _json_schema_validator(self.validation)
+        self.regex = None
+        self.error = None
+        self.regex_error = None  # 正则编译错误原文，用于配置验证报告
+        try:
+            self.regex = re.compile(self.pattern, re.IGNORECASE)
+        except (re.error, TypeError) as e:
+            self.regex_error = str(e)
+            self.error = f'Invalid regex pattern in extractor "{self.name}": {self.pattern} - {str(e)}'
+
+
+class _CompiledBehavior:
+    """预编译的行为"""
+
+    __slots__ = ('behavior_id', 'name', 'regex', 'error', 'regex_error', 'extractors', 'has_extractors',
+                 'validation', 'has_validation', 'data_type', 'schema_validator')
+
+    def __init__(self, behavior_id, behavior):
+        self.behavior_id = behavior_id
+        self.name = behavior.get('name', '')
+        self.has_extractors = 'extractors' in behavior
+        self.extractors = [_CompiledExtractor(extractor) for extractor in behavior.get('extractors') or []]
+        self.validation = behavior.get('validation')
+        self.has_validation = 'validation' in behavior
+        self.schema_validator = _json_schema_validator(self.validation)
+        self.data_type = behavior.get('dataType', 'text')
+        self.regex = None
+        self.error = None
+        self.regex_error = None  # 正则编译错误原文，用于配置验证报告
+        try:
+            self.regex = re.compile(behavior['pattern'], re.IGNORECASE)
+        except (re.error, KeyError, TypeError) as e:
+            self.regex_error = str(e)
+            self.error = f'Invalid regex pattern in behavior "{behavior.get("name", "unknown")}": {behavior.get("pattern")} - {str(e)}'
+
+
+def extract_data(log_message, extractors, messages=None):
+    """
+    使用预编译的提取器从日志消息中提取结构化数据
+
+    参数:
+        log_message (str): 待解析的日志消息
+        extractors (list): _CompiledExtractor 列表
+        messages (list, optional): 收集提取过程中产生的系统日志
+
+    返回:
+        dict: 提取的数据字典，包含每个提取器的结果
+    """
+    note = messages.append if messages is not None else (lambda message: None)
+    extracted_data = {}
+    for extractor in extractors:
+        if extractor.error:
+            note(extractor.error)
+            continue
+        match = extractor.regex.search(log_message)
+        if not match:
+            continue
+
+        # 提取原始数据：优先使用第一个捕获组，否则使用整个匹配
+        raw_data = match.group(1) if match.groups() else match.group(0)
+        data_type = extractor.data_type
+
+        # 对于JSON类型，尝试从日志中提取JSON部分
+        if data_type == 'json':
+            try:
+                json_obj = json.loads(raw_data)
+                raw_data = json.dumps(json_obj)  # 规范化JSON字符串
+                _note_module_field(json_obj, messages, '检测到module字段')
+            except json.JSONDecodeError:
+                # 如果直接解析失败，尝试使用正则表达式提取JSON部分
+                json_match = JSON_FRAGMENT_PATTERN.search(raw_data)
+                if json_match:
+                    try:
+                        json_obj = json.loads(json_match.group(0))
+                        raw_data = json.dumps(json_obj)  # 规范化JSON字符串
+                        _note_module_field(json_obj, messages, '检测到module字段')
+                    except json.JSONDecodeError as e:
+                        note(f'Failed to parse JSON in extractor "{extractor.name}": {str(e)}')
+
+        # 验证提取的数据类型
+        note(f'开始验证数据类型: {data_type}')
+        if extractor.has_validation:
+            note(f'发现验证规则: {json.dumps(extractor.validation, ensure_ascii=False)[:100]}...')
+
+        is_valid, parsed_data, error = validate_data_by_type(raw_data, data_type, extractor.validation, messages,
+                                                             extractor.schema_validator)
+
+        if is_valid:
+            note(f'数据验证成功: {extractor.name}')
+            extracted_data[extractor.name] = {
+                'value': parsed_data,
+                'type': data_type,
+                'raw': raw_data
+            }
+        else:
+            note(f'数据验证失败: {extractor.name}, 错误: {error}')
+            extracted_data[extractor.name] = {
+                'value': None,
+                'type': data_type,
+                'raw': raw_data,
+                'error': error
+            }
+    return extracted_data
+
+
+class BehaviorMatcher:
+    """按规则集编译的无状态行为匹配器"""
+
+    def __init__(self, config):
+        """
+        参数:
+            config (dict): 行为配置（包含 behaviors 列表）
+        """
+        self.behaviors = [
+            _CompiledBehavior(behavior_id, behavior)
+            for behavior_id, behavior in enumerate((config or {}).get('behaviors') or [])
+            if behavior.get('enabled', True)
+        ]
+
+    def match(self, log_message):
+        """
+        匹配一行日志
+
+        参数:
+            log_message (str): 日志内容
+
+        返回:
+            list: 匹配结果（见模块说明），没有命中时为空列表
+        """
+        results = []
+        for behavior in self.behaviors:
+            if behavior.error:
+                results.append({
+                    'behaviorId': behavior.behavior_id,
+                    'behaviorName': behavior.name,
+                    'matched': False,
+                    'messages': [behavior.error]
+                })
+                continue
+            match = behavior.regex.search(log_message)
+            if not match:
+                continue
+
+            messages = []
+            # 提取结构化数据
+            extracted_data = {}
+            if behavior.has_extractors:
+                extracted_data = extract_data(log_message, behavior.extractors, messages)
+
+            # 验证提取的数据
+            validation_results = {}
+            if behavior.has_validation and extracted_data:
+                # 使用第一个提取器的原始数据进行验证
+                main_data = list(extracted_data.values())[0].get('raw')
+                if main_data:
+                    is_valid, parsed_data, error = validate_data_by_type(
+                        main_data, behavior.data_type, behavior.validation, messages, behavior.schema_validator)
+                    validation_results = {
+                        'isValid': is_valid,
+                        'parsedData': parsed_data,
+                        'error': error,
+                        'dataType': behavior.data_type
+                    }
+
+            results.append({
+                'behaviorId': behavior.behavior_id,
+                'behaviorName': behavior.name,
+                'matched': True,
+                'messages': messages,
+                'extractedData': extracted_data,
+                'validationResults': validation_results
+            })
+        return results
+
+
+def find_pattern_errors(config, matcher=None):
+    """
+    检查配置中行为和提取器的正则表达式是否有效
+
+    参数:
+        config (dict): 行为配置
+        matcher (BehaviorMatcher, optional): 由同一配置编译的匹配器，直接使用其中的编译结果，
+                                             只有未启用（匹配器中没有）的行为需要单独编译
+
+    返回:
+        list: 错误描述，全部有效时为空列表
+    """
+    compiled = {behavior.behavior_id: behavior for behavior in matcher.behaviors} if matcher else {}
+    errors = []
+    for i, behavior in enumerate((config or {}).get('behaviors') or []):
+        name = behavior.get('name', 'unknown')
+        if i in compiled:
+            regex_errors = [compiled[i].regex_error] + [extractor.regex_error for extractor in compiled[i].extractors]
+        else:
+            regex_errors = [_regex_error(behavior.get('pattern'))] + [
+                _regex_error(extractor.get('pattern')) for extractor in behavior.get('extractors') or []]
+        if regex_errors[0]:
+            errors.append(f"Behavior {i+1} '{name}': Invalid regex pattern '{behavior.get('pattern')}' - {regex_errors[0]}")
+        for j, extractor in enumerate(behavior.get('extractors') or []):
+            if regex_errors[j + 1]:
+                errors.append(f"Behavior {i+1} '{name}', Extractor {j+1} '{extractor.get('name', 'unknown')}': Invalid regex pattern '{extractor.get('pattern')}' - {regex_errors[j + 1]}")
+    return errors
+
+
+def _regex_error(pattern):
+    """编译正则表达式，返回错误描述，有效时返回 None"""
+    try:
+        re.compile(pattern, re.IGNORECASE)
+    except (re.error, TypeError) as e:
+        return str(e)
+    return None
+
+
+def load_ruleset(path):
+    """
+    从 YAML 配置文件加载并编译规则集（命令行工具和独立运行的服务使用）
+
+    参数:
+        path (str): 配置文件路径，例如 config.yaml、config_minigame.yaml
+
+    返回:
+        CompiledRuleset: 编译后的规则集
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return CompiledRuleset(yaml.safe_load(f) or {'behaviors': []})
+
+
+class CompiledRuleset:
+    """
+    编译后的不可变规则集：配置快照、版本号和匹配器
+
+    分析会话绑定一个 CompiledRuleset，配置更新时创建新的实例并整体替换，
+    已经绑定旧实例的会话不受影响。
+    """
+
+    __slots__ = ('config', 'version', 'matcher')
+
+    def __init__(self, config):
+        """
+        参数:
+            config (dict): 行为配置，保存深拷贝，之后修改原配置不会影响规则集
+        """
+        config = config or {'behaviors': []}
+        try:
+            # JSON 往返复制比 deepcopy 快一个数量级，配置来自 YAML/JSON，内容不变
+            config = json.loads(json.dumps(config, ensure_ascii=False))
+        except (TypeError, ValueError):
+            config = copy.deepcopy(config)
+        object.__setattr__(self, 'config', config)
+        object.__setattr__(self, 'version', compute_ruleset_version(config))
+        object.__setattr__(self, 'matcher', BehaviorMatcher(config))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledRuleset is immutable')
+
+    def behavior_names(self):
+        """按配置顺序返回行为名称列表"""
+        return [behavior.get('name', '') for behavior in self.config.get('behaviors', [])]
+
+
+# 工作进程中的匹配器，由进程池初始化函数创建
+_worker_matcher = None
+
+
+def _init_worker(config):
+    global _worker_matcher
+    _worker_matcher = BehaviorMatcher(config)
+
+
+def _match_chunk(lines):
+    """工作进程：匹配一个块，只返回有结果的行 [(块内行号, 匹配结果), ...]"""
+    match = _worker_matcher.match
+    hits = []
+    for index, line in enumerate(lines):
+        results = match(line)
+        if results:
+            hits.append((index, results))
+    return hits
+
+
+def resolve_workers(workers):
+    """解析工作进程数量：0 或负数表示使用全部 CPU 核心"""
+    workers = int(workers or 0)
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def create_match_pool(config, workers=0):
+    """
+    创建匹配进程池，每个工作进程按 config 编译一次匹配器
+
+    工作进程使用 spawn 方式启动：服务器在多线程中创建进程池，fork 会复制其他线程持有的锁。
+    spawn 的工作进程会以 __mp_main__ 重新导入主模块，主模块在 __mp_main__ 下需要跳过初始化
+    （见 server.init_server）。
+    """
+    return ProcessPoolExecutor(max_workers=resolve_workers(workers), mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(config,))
+
+
+class MatchPoolRegistry:
+    """
+    按规则集复用的匹配进程池
+
+    每个规则集（和工作进程数量）一个长期运行的进程池，工作进程只在第一次使用时启动，
+    之后同一规则集的导入直接复用，不再承担进程启动和规则编译的开销。
+    发布新规则集后旧规则集的进程池不再保留，最后一个使用者释放时关闭。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}     # (规则集版本, 工作进程数量) -> {'pool': 进程池, 'users': 使用者数量}
+        self._version = None  # 当前发布的规则集版本
+
+    def publish(self, version):
+        """发布新规则集：关闭其他版本中没有使用者的进程池"""
+        with self._lock:
+            self._version = version
+            retired = [key for key, entry in self._pools.items() if key[0] != version and not entry['users']]
+            pools = [self._pools.pop(key)['pool'] for key in retired]
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def acquire(self, ruleset, workers=0):
+        """
+        获取规则集的进程池，使用结束后必须调用 release
+
+        参数:
+            ruleset (CompiledRuleset): 会话绑定的规则集（可以是热更新前的旧版本）
+            workers (int): 工作进程数量，0 表示使用全部 CPU 核心
+
+        返回:
+            ProcessPoolExecutor: 进程池
+        """
+        key = (ruleset.version, resolve_workers(workers))
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                entry = self._pools[key] = {'pool': create_match_pool(ruleset.config, key[1]), 'users': 0}
+            entry['users'] += 1
+            return entry['pool']
+
+    def release(self, pool, discard=False):
+        """
+        释放进程池，不属于当前规则集的进程池在最后一个使用者释放时关闭
+
+        参数:
+            pool (ProcessPoolExecutor): acquire 返回的进程池
+            discard (bool): 进程池已损坏（工作进程异常退出），不再分配给之后的导入
+        """
+        with self._lock:
+            key = next((key for key, entry in self._pools.items() if entry['pool'] is pool), None)
+            if key is None:
+                return
+            entry = self._pools[key]
+            entry['users'] -= 1
+            if discard:
+                del self._pools[key]
+            elif entry['users'] or key[0] == self._version:
+                return
+            else:
+                del self._pools[key]
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """关闭所有进程池"""
+        with self._lock:
+            pools = [entry['pool'] for entry in self._pools.values()]
+            self._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_parallel_matches(lines, config, workers=0, chunk_lines=DEFAULT_CHUNK_LINES, pool=None):
+    """
+    使用进程池并行匹配日志，按原始顺序逐行产出结果
+
+    日志按 chunk_lines 行切分为块提交给进程池，同时最多有 workers * 2 个块在处理中，
+    内存占用与文件大小无关。生成器被提前关闭时（例如导入被取消），尚未开始的块会被取消。
+
+    参数:
+        lines (iterable): 日志行（已去除首尾空白的非空行）
+        config (dict): 行为配置，每个工作进程按该配置编译一次匹配器（指定 pool 时不使用）
+        workers (int): 工作进程数量，0 表示使用全部 CPU 核心
+        chunk_lines (int): 每个块的行数
+        pool (ProcessPoolExecutor, optional): 已按规则集创建的进程池（MatchPoolRegistry.acquire），
+                                             不指定时创建临时进程池并在结束时关闭
+
+    返回:
+        generator: 逐行产出 (日志行, 匹配结果列表)
+    """
+    workers = resolve_workers(workers)
+    owned = pool is None
+    if owned:
+        pool = create_match_pool(config, workers)
+    pending = deque()
+    iterator = iter(lines)
+
+    def submit_next():
+        chunk = []
+        for line in iterator:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                break
+        if chunk:
+            pending.append((chunk, pool.submit(_match_chunk, chunk)))
+        return bool(chunk)
+
+    try:
+        while len(pending) < workers * 2 and submit_next():
+            pass
+        while pending:
+            chunk, future = pending.popleft()
+            hits = dict(future.result())
+            submit_next()
+            for index, line in enumerate(chunk):
+                yield line, hits.get(index, ())
+    finally:
+        if owned:
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for _, future in pending:
+                future.cancel()
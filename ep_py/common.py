@@ -1,10 +1,15 @@
+import heapq
 import json
 import logging
 import os
+import queue
 import re
 import subprocess
+import tempfile
+import threading
 import urllib.parse
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import boto3
@@ -743,7 +748,44 @@ class EsUtil:
             client_config=Config(connect_timeout=60, read_timeout=60)
         )
 
-    def search(self, query, index_name, process_batch=None):
+    def search(self, query, index_name, process_batch=None, on_total=None, slices=None, queue_size=None,
+               pagination='scroll', cursor=None, on_cursor=None, keep_alive='1m', tiebreaker='_id',
+               windows=None, window_buffer=None, time_field='@timestamp'):
+        """
+        执行查询并通过 scroll 读取所有结果
+
+        参数:
+            query (dict): 查询
+            index_name (str): 索引名称
+            process_batch (callable, optional): 每页结果调用一次 process_batch(hits)，结果不再保留在内存中；
+                                                返回 False 时停止读取并清除 scroll 上下文
+            on_total (callable, optional): 收到第一页后调用 on_total(总命中数)
+            slices (int, optional): 大于 1 时使用 sliced scroll，每个分片由独立线程并行读取（聚合查询不分片）
+            queue_size (int, optional): 分片读取时等待处理的最大页数，默认为分片数的两倍
+            pagination (str): 'scroll'（默认）或 'pit'：使用 point in time + search_after 分页，不占用 scroll 上下文
+            cursor (dict, optional): pit 模式下从 on_cursor 保存的游标继续读取
+            on_cursor (callable, optional): pit 模式下每页处理完成后调用 on_cursor(游标)，游标可以序列化为 JSON
+            keep_alive (str): scroll 或 point in time 的保留时间（pit 模式）
+            tiebreaker (str): pit 模式下追加在排序最后的唯一字段，保证排序稳定
+            windows (int, optional): 大于 1 时把查询的时间范围拆分为多个时间窗口并行读取，结果按时间升序交给 process_batch
+                                     （查询需要有 time_field 的 gte/gt 和 lte/lt 范围条件，否则按普通 scroll 读取）
+            window_buffer (int, optional): 每个时间窗口在内存中缓冲的最大页数，超过的页暂存到临时文件，默认 4
+            time_field (str): 时间窗口模式使用的时间字段
+
+        返回:
+            list: 未指定 process_batch 时为所有命中文档；有聚合结果时为 {'aggregations', 'total_hits'}；
+                  查询失败时为 {}
+        """
+        aggregated = 'aggs' in query or 'aggregations' in query
+        if pagination == 'pit' and not aggregated:
+            return self._search_pit(query, index_name, process_batch, on_total, cursor, on_cursor, keep_alive, tiebreaker)
+        if windows and windows > 1 and not aggregated:
+            result = self._search_windows(query, index_name, process_batch, on_total, windows, window_buffer, time_field)
+            if result is not None:
+                return result
+        if slices and slices > 1 and not aggregated:
+            return self._search_sliced(query, index_name, process_batch, on_total, slices, queue_size)
+
         try:
             search_result = self.search_client.search(index=index_name, body=query, scroll='1m', size=self.search_count, request_timeout=60)
         except Exception as e:
@@ -759,20 +801,23 @@ class EsUtil:
 
         def process_and_collect(hits):
             if process_batch:
-                process_batch(hits)
-            else:
-                all_hits.extend(hits)
+                return process_batch(hits) is not False
+            all_hits.extend(hits)
+            return True
+
+        if on_total:
+            on_total(total_hits)
 
         # Process the first batch
         with tqdm(total=total_hits, desc="Downloading", unit="docs") as pbar:
             first_batch = search_result.get('hits', {}).get('hits', [])
-            process_and_collect(first_batch)
+            more = process_and_collect(first_batch)
             pbar.update(len(first_batch))
 
             # Start scrolling if there's a scroll_id
             if scroll_id:
                 try:
-                    while True:
+                    while more:
                         scroll_result = self.search_client.scroll(scroll_id=scroll_id, scroll='1m', request_timeout=60)
                         scroll_id = scroll_result.get('_scroll_id')
                         hits_in_batch = scroll_result.get('hits', {}).get('hits', [])
@@ -780,7 +825,7 @@ class EsUtil:
                         if not hits_in_batch:
                             break
                         
-                        process_and_collect(hits_in_batch)
+                        more = process_and_collect(hits_in_batch)
                         pbar.update(len(hits_in_batch))
 
                         if not scroll_id:
@@ -805,6 +850,420 @@ class EsUtil:
 
         return all_hits
 
+    @staticmethod
+    def pit_sort(query, tiebreaker='_id'):
+        """
+        pit 模式使用的排序：查询自身的排序（默认 @timestamp 升序），最后追加唯一字段作为 tiebreaker
+
+        返回:
+            list: 排序条件
+        """
+        sort = query.get('sort') or [{'@timestamp': 'asc'}]
+        sort = [sort] if isinstance(sort, (str, dict)) else list(sort)
+        fields = [item if isinstance(item, str) else next(iter(item)) for item in sort]
+        if tiebreaker not in fields:
+            sort.append({tiebreaker: 'asc'})
+        return sort
+
+    def _search_pit(self, query, index_name, process_batch, on_total, cursor, on_cursor, keep_alive, tiebreaker):
+        """
+        使用 point in time + search_after 分页读取（见 search）
+
+        游标只记录排序和最后一条文档的排序值，不引用 point in time：读取结束或中断时删除 point in time，
+        从游标继续时创建新的 point in time，暂停期间集群上不保留任何上下文。
+        """
+        sort = self.pit_sort(query, tiebreaker)
+        search_after = None
+        fetched = 0
+        if cursor:
+            if cursor.get('pagination') != 'pit' or cursor.get('index') != index_name or cursor.get('sort') != sort:
+                raise ValueError('Cursor does not match the index or sort of this query')
+            search_after = cursor.get('search_after')
+            fetched = cursor.get('fetched', 0)
+
+        try:
+            pit_id = self.search_client.create_pit(index=index_name, params={'keep_alive': keep_alive})['pit_id']
+        except Exception as e:
+            logging.error(f"Error creating point in time on {index_name}: {e}")
+            return {}
+
+        body = {key: value for key, value in query.items() if key not in ('sort', 'size', 'from')}
+        body.update({'sort': sort, 'size': self.search_count, 'track_total_hits': True})
+        all_hits = []
+        try:
+            with tqdm(total=None, initial=fetched, desc="Downloading (pit)", unit="docs") as pbar:
+                while True:
+                    body['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+                    if search_after is not None:
+                        body['search_after'] = search_after
+                    try:
+                        result = self.search_client.search(body=body, request_timeout=60)
+                    except Exception as e:
+                        logging.error(f"Error executing ES search: {e}")
+                        if pbar.total is None:
+                            logging.error(f"Failed query: {json.dumps(body, indent=2)}")
+                            return {}
+                        break
+                    # point in time ID 可能在每次请求后变化
+                    pit_id = result.get('pit_id', pit_id)
+                    if pbar.total is None:
+                        body.pop('track_total_hits')
+                        pbar.total = result.get('hits', {}).get('total', {}).get('value', 0)
+                        pbar.refresh()
+                        if on_total:
+                            on_total(pbar.total)
+
+                    hits = result.get('hits', {}).get('hits', [])
+                    if not hits:
+                        break
+                    if process_batch:
+                        more = process_batch(hits) is not False
+                    else:
+                        all_hits.extend(hits)
+                        more = True
+                    pbar.update(len(hits))
+                    search_after = hits[-1]['sort']
+                    fetched += len(hits)
+                    if on_cursor:
+                        on_cursor({
+                            'pagination': 'pit',
+                            'index': index_name,
+                            'sort': sort,
+                            'search_after': search_after,
+                            'fetched': fetched
+                        })
+                    if not more or len(hits) < self.search_count:
+                        break
+        finally:
+            try:
+                self.search_client.delete_pit(body={'pit_id': [pit_id]})
+                logging.debug(f"Deleted point in time: {pit_id}")
+            except Exception as e:
+                if 'AuthorizationException' not in str(e):
+                    logging.error(f"Error deleting point in time: {e}")
+        return all_hits
+
+    def _scroll_slice(self, query, index_name, slice_id, slices, pages, stop):
+        """
+        读取一个 scroll 分片，每页放入队列 pages: ('page', 分片ID, hits, 分片总数或 None)
+
+        队列已满时等待（背压），stop 被设置时停止读取。结束时清除 scroll 上下文并放入 ('done', 分片ID, 错误)。
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        body = dict(query, slice={'id': slice_id, 'max': slices})
+        scroll_id = None
+        error = None
+        try:
+            result = self.search_client.search(index=index_name, body=body, scroll='1m', size=self.search_count, request_timeout=60)
+            scroll_id = result.get('_scroll_id')
+            total = result.get('hits', {}).get('total', {}).get('value', 0)
+            hits = result.get('hits', {}).get('hits', [])
+            if put(('page', slice_id, hits, total)):
+                while hits and scroll_id and not stop.is_set():
+                    result = self.search_client.scroll(scroll_id=scroll_id, scroll='1m', request_timeout=60)
+                    scroll_id = result.get('_scroll_id')
+                    hits = result.get('hits', {}).get('hits', [])
+                    if not hits or not put(('page', slice_id, hits, None)):
+                        break
+        except Exception as e:
+            logging.error(f"Error during scroll of slice {slice_id}/{slices}: {e}")
+            error = e
+        finally:
+            if scroll_id:
+                try:
+                    self.search_client.clear_scroll(scroll_id=scroll_id)
+                    logging.debug(f"Cleared scroll context of slice {slice_id}: {scroll_id}")
+                except Exception as e:
+                    if 'AuthorizationException' not in str(e):
+                        logging.error(f"Error clearing scroll context: {e}")
+            # 完成标记必须送达，消费端以此判断所有分片都已结束
+            pages.put(('done', slice_id, error))
+
+    def _search_sliced(self, query, index_name, process_batch, on_total, slices, queue_size=None):
+        """
+        使用 sliced scroll 并行读取（见 search）
+
+        每个分片在线程池中独立 scroll，所有分片的页通过有界队列交给调用线程，process_batch 只在调用线程中执行，
+        不需要考虑线程安全；页的顺序在分片之间是交错的。总命中数在所有分片返回第一页后汇总，之前到达的页暂存。
+        """
+        pages = queue.Queue(maxsize=max(1, queue_size or slices * 2))
+        stop = threading.Event()
+        totals = {}
+        held = []
+        all_hits = []
+        failed = 0
+        running = slices
+
+        def process_and_collect(hits):
+            if process_batch:
+                return process_batch(hits) is not False
+            all_hits.extend(hits)
+            return True
+
+        executor = ThreadPoolExecutor(max_workers=slices, thread_name_prefix='es-slice')
+        try:
+            for slice_id in range(slices):
+                executor.submit(self._scroll_slice, query, index_name, slice_id, slices, pages, stop)
+            with tqdm(total=None, desc=f"Downloading ({slices} slices)", unit="docs") as pbar:
+                while running:
+                    item = pages.get()
+                    if item[0] == 'done':
+                        running -= 1
+                        if item[2] is not None:
+                            failed += 1
+                            totals.setdefault(item[1], 0)
+                    else:
+                        _, slice_id, hits, total = item
+                        if total is not None:
+                            totals[slice_id] = total
+                        held.append(hits)
+                    if pbar.total is None:
+                        if len(totals) < slices and running:
+                            continue
+                        pbar.total = sum(totals.values())
+                        pbar.refresh()
+                        if on_total:
+                            on_total(pbar.total)
+                    for hits in held:
+                        if stop.is_set():
+                            break
+                        if hits and not process_and_collect(hits):
+                            stop.set()
+                        pbar.update(len(hits))
+                    held = []
+        finally:
+            # 提前结束（process_batch 出错）时继续取出队列中的页，让所有分片线程清除 scroll 上下文后退出
+            stop.set()
+            while running:
+                if pages.get()[0] == 'done':
+                    running -= 1
+            executor.shutdown(wait=True)
+
+        if failed == slices:
+            return {}
+        return all_hits
+
+    def count(self, query, index_name):
+        """查询的命中文档数（_count API），失败时返回 None"""
+        try:
+            return self.search_client.count(index=index_name, body={'query': query.get('query', {'match_all': {}})},
+                                            request_timeout=60)['count']
+        except Exception as e:
+            logging.error(f"Error executing ES count: {e}")
+            return None
+
+    def plan_windows(self, normalized, index_name, lo, hi, windows, time_field='@timestamp', min_width=1000):
+        """
+        按文档数把时间范围 [lo, hi]（毫秒闭区间）拆分为时间窗口
+
+        从整个时间范围开始，用 _count 统计后反复把文档最多的窗口对半拆分，直到每个窗口不超过目标值的四分之一
+        （最多 windows * 4 个，宽度小于 min_width 毫秒的窗口不再拆分），再把相邻的窗口合并为 windows 个，
+        每个约为总数的 1 / windows。文档集中的时间段得到更窄的窗口，各窗口的文档数大致相同。没有文档的窗口不读取。
+
+        参数:
+            normalized (dict): 时间范围替换为占位符的查询（es_cache.split_time_range）
+
+        返回:
+            tuple: (总文档数, [(窗口开始, 窗口结束, 文档数), ...] 按时间排序)，统计失败时为 (None, [])
+        """
+        from ep_py.es_cache import build_range_query
+
+        def count(a, b):
+            return self.count(build_range_query(normalized, a, b, time_field), index_name)
+
+        total = count(lo, hi)
+        if total is None:
+            return None, []
+        target = max(1, -(-total // windows))
+        fine = max(1, target // 4)
+        # 按文档数从多到少拆分：(-文档数, 开始, 结束)
+        heap = [(-total, lo, hi)]
+        done = []
+        while heap and len(heap) + len(done) < windows * 4:
+            n, a, b = heapq.heappop(heap)
+            if -n <= fine or b - a < min_width:
+                done.append((n, a, b))
+                continue
+            mid = (a + b) // 2
+            left = count(a, mid)
+            if left is None:
+                done.append((n, a, b))
+                continue
+            heapq.heappush(heap, (-left, a, mid))
+            heapq.heappush(heap, (-max(0, -n - left), mid + 1, b))
+        leaves = sorted((a, b, -n) for n, a, b in heap + done)
+
+        # 按累计文档数把相邻的窗口分成 windows 组，每组约为总数的 1 / windows
+        planned = []
+        group = None
+        before = 0
+        for a, b, n in leaves:
+            index = min(windows - 1, int((before + n / 2) * windows / total)) if total else 0
+            if planned and group == index:
+                planned[-1] = (planned[-1][0], b, planned[-1][2] + n)
+            else:
+                planned.append((a, b, n))
+                group = index
+            before += n
+        return total, [window for window in planned if window[2] > 0]
+
+    def _scroll_window(self, query, index_name, buffer, stop):
+        """读取一个时间窗口（查询按时间升序排序），每页放入窗口缓冲区，结束时清除 scroll 上下文并关闭缓冲区"""
+        scroll_id = None
+        try:
+            result = self.search_client.search(index=index_name, body=query, scroll='1m', size=self.search_count, request_timeout=60)
+            scroll_id = result.get('_scroll_id')
+            hits = result.get('hits', {}).get('hits', [])
+            while hits and not stop.is_set():
+                buffer.put(hits)
+                if not scroll_id:
+                    break
+                result = self.search_client.scroll(scroll_id=scroll_id, scroll='1m', request_timeout=60)
+                scroll_id = result.get('_scroll_id')
+                hits = result.get('hits', {}).get('hits', [])
+        except Exception as e:
+            logging.error(f"Error during scroll of time window: {e}")
+            buffer.error = e
+        finally:
+            if scroll_id:
+                try:
+                    self.search_client.clear_scroll(scroll_id=scroll_id)
+                except Exception as e:
+                    if 'AuthorizationException' not in str(e):
+                        logging.error(f"Error clearing scroll context: {e}")
+            buffer.close()
+
+    def _search_windows(self, query, index_name, process_batch, on_total, windows, window_buffer=None, time_field='@timestamp'):
+        """
+        按时间窗口并行读取（见 search）
+
+        时间窗口由 plan_windows 按文档数划分，最多 windows 个窗口同时读取，每个窗口按时间升序 scroll。
+        各窗口的时间范围互不重叠且按时间排列，多路归并只需按窗口顺序依次输出：当前窗口读完后输出下一个窗口，
+        此时后面的窗口已经在并行读取，结果整体按时间升序，依赖事件顺序的行为分析不受影响。
+        还没轮到输出的窗口在内存中最多缓冲 window_buffer 页，其余的页暂存到临时文件，读取不会因为等待输出而停下，
+        内存占用与结果大小无关。process_batch 只在调用线程中执行。
+
+        返回:
+            list: 同 search；查询中没有可拆分的时间范围时返回 None，由调用方按普通 scroll 读取；
+                  任何一个时间窗口读取失败时停止读取并返回 {}（结果不完整，与全部失败一样处理）
+        """
+        from ep_py.es_cache import build_range_query, split_time_range
+
+        split = split_time_range(query, time_field)
+        if split is None:
+            logging.info(f"Query has no explicit {time_field} range, falling back to a single scroll")
+            return None
+        normalized, lo, hi = split
+        total, planned = self.plan_windows(normalized, index_name, lo, hi, windows, time_field)
+        if total is None:
+            return {}
+        logging.info(f"Fetching {total} docs in {len(planned)} time windows ({windows} concurrent)")
+        if on_total:
+            on_total(total)
+
+        all_hits = []
+        stop = threading.Event()
+        buffers = [_WindowBuffer(window_buffer or 4) for _ in planned]
+        executor = ThreadPoolExecutor(max_workers=windows, thread_name_prefix='es-window')
+        try:
+            # 窗口按时间顺序提交，先输出的窗口先开始读取
+            for (a, b, _), buffer in zip(planned, buffers):
+                executor.submit(self._scroll_window, build_range_query(normalized, a, b, time_field), index_name, buffer, stop)
+            with tqdm(total=total, desc=f"Downloading ({len(planned)} windows)", unit="docs") as pbar:
+                for number, buffer in enumerate(buffers, 1):
+                    while True:
+                        hits = buffer.get()
+                        if hits is None:
+                            break
+                        pbar.update(len(hits))
+                        if process_batch:
+                            if process_batch(hits) is False:
+                                return all_hits
+                        else:
+                            all_hits.extend(hits)
+                    if buffer.error is not None:
+                        # 后面的窗口不再输出，缺少一段时间的结果会让依赖事件顺序的分析得出错误的结论
+                        logging.error(f"Time window {number}/{len(buffers)} failed, result is incomplete")
+                        return {}
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for buffer in buffers:
+                buffer.discard()
+
+        return all_hits
+
+
+class _WindowBuffer:
+    """
+    时间窗口的页缓冲区：内存中最多保存 limit 页，超过的页按顺序写入临时文件
+
+    写入端（读取线程）从不阻塞；读取端按写入顺序取出页。
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.error = None
+        self._cond = threading.Condition()
+        self._memory = deque()
+        self._spooled = deque()  # 临时文件中尚未取出的页 (偏移, 长度)
+        self._spool = None
+        self._closed = False
+
+    def put(self, hits):
+        with self._cond:
+            if self._spooled or len(self._memory) >= self.limit:
+                if self._spool is None:
+                    self._spool = tempfile.TemporaryFile()
+                data = json.dumps(hits, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                self._spool.seek(0, os.SEEK_END)
+                self._spooled.append((self._spool.tell(), len(data)))
+                self._spool.write(data)
+            else:
+                self._memory.append(hits)
+            self._cond.notify_all()
+
+    def close(self):
+        """读取结束"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get(self):
+        """取出下一页，读取结束且没有剩余的页时返回 None"""
+        with self._cond:
+            while not self._memory and not self._spooled and not self._closed:
+                self._cond.wait()
+            if self._memory:
+                return self._memory.popleft()
+            if self._spooled:
+                offset, length = self._spooled.popleft()
+                self._spool.seek(offset)
+                hits = json.loads(self._spool.read(length))
+                if not self._spooled:
+                    # 暂存的页已全部取出，之后的页重新从文件开头写入
+                    self._spool.seek(0)
+                    self._spool.truncate()
+                return hits
+            return None
+
+    def discard(self):
+        """释放未取出的页和临时文件"""
+        with self._cond:
+            self._memory.clear()
+            self._spooled.clear()
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+
 
 if __name__ == '__main__':
     import logging
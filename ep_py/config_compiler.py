@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+配置编译模块
+
+配置从文本到可发布的规则集只处理一次：
+1. 解析 YAML（只有从文件加载时）
+2. 结构验证：config_schema.json 在首次使用时读取并编译为验证器，之后直接复用，文件修改后自动重新编译
+3. 编译：CompiledRuleset 编译所有行为和提取器的正则表达式以及 jsonSchema 验证器
+4. 正则验证：直接读取第 3 步的编译结果，不再重复编译
+
+通过验证的 ConfigCompilation.ruleset 直接发布，匹配时使用的就是验证时编译的对象。
+每个阶段记录耗时（毫秒），验证报告包含错误和耗时，便于定位大型配置的瓶颈。
+"""
+
+import json
+import os
+import threading
+import time
+
+import yaml
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+from ep_py.behavior_engine import CompiledRuleset, find_pattern_errors
+from ep_py.config_watcher import file_signature
+
+
+SCHEMA_PATH = 'config_schema.json'
+
+_schema_cache = {}  # 绝对路径 -> (文件签名, 验证器)
+_schema_lock = threading.Lock()
+
+
+def get_schema_validator(path=SCHEMA_PATH):
+    """
+    获取预编译的配置结构验证器
+
+    参数:
+        path (str): Schema 文件路径
+
+    返回:
+        验证器实例，Schema 文件不存在时返回 None
+
+    异常:
+        ValueError / jsonschema.SchemaError: Schema 文件不是有效的 JSON Schema
+    """
+    path = os.path.abspath(path)
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    with _schema_lock:
+        cached = _schema_cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        cls = validator_for(schema)
+        cls.check_schema(schema)
+        validator = cls(schema)
+        _schema_cache[path] = (signature, validator)
+        return validator
+
+
+def validate_structure(config, path=SCHEMA_PATH):
+    """
+    使用预编译的验证器验证配置结构
+
+    参数:
+        config (dict): 需要验证的配置字典
+        path (str): Schema 文件路径
+
+    返回:
+        tuple: (是否有效, 错误信息)，Schema 文件不存在时跳过验证
+    """
+    try:
+        validator = get_schema_validator(path)
+        if validator is None:
+            print(f'Warning: {os.path.basename(path)} not found, skipping schema validation')
+            return True, None
+        error = best_match(validator.iter_errors(config))
+        if error is not None:
+            return False, f'Configuration validation error: {error.message}'
+        return True, None
+    except Exception as e:
+        return False, f'Schema validation error: {str(e)}'
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+class ConfigCompilation:
+    """配置编译结果：规则集、错误和各阶段耗时"""
+
+    def __init__(self):
+        self.ruleset = None        # CompiledRuleset，解析失败时为 None
+        self.parse_error = None    # YAML 读取或解析错误
+        self.schema_error = None   # 结构验证错误
+        self.pattern_errors = []   # 正则表达式错误
+        self.timings = {}          # 阶段 -> 耗时（毫秒）
+
+    @property
+    def valid(self):
+        return self.ruleset is not None and not (self.parse_error or self.schema_error or self.pattern_errors)
+
+    def error_message(self):
+        """第一个错误的描述，没有错误时返回 None"""
+        if self.parse_error:
+            return self.parse_error
+        if self.schema_error:
+            return self.schema_error
+        if self.pattern_errors:
+            return 'Regex validation errors: ' + '; '.join(self.pattern_errors)
+        return None
+
+    def to_dict(self):
+        """验证报告"""
+        return {
+            'valid': self.valid,
+            'parseError': self.parse_error,
+            'schemaError': self.schema_error,
+            'patternErrors': self.pattern_errors,
+            'rulesetVersion': self.ruleset.version if self.ruleset else None,
+            'behaviors': len(self.ruleset.config.get('behaviors') or []) if self.ruleset else 0,
+            'timings': self.timings
+        }
+
+
+def compile_config(config, schema_path=SCHEMA_PATH, compilation=None):
+    """
+    验证并编译配置
+
+    结构验证失败时仍然编译，一次报告所有错误。
+
+    参数:
+        config (dict): 行为配置
+        schema_path (str): Schema 文件路径
+        compilation (ConfigCompilation, optional): 继续填写的编译结果（compile_config_file 使用）
+
+    返回:
+        ConfigCompilation: 编译结果，valid 为 True 时可以直接发布 ruleset
+    """
+    result = compilation or ConfigCompilation()
+    started = time.perf_counter()
+
+    stage = time.perf_counter()
+    is_valid, error_message = validate_structure(config, schema_path)
+    result.schema_error = None if is_valid else error_message
+    result.timings['schema'] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    result.ruleset = CompiledRuleset(config)
+    result.timings['compile'] = _elapsed_ms(stage)
+
+    stage = time.perf_counter()
+    result.pattern_errors = find_pattern_errors(result.ruleset.config, result.ruleset.matcher)
+    result.timings['patterns'] = _elapsed_ms(stage)
+
+    result.timings['total'] = round(result.timings.get('parse', 0) + _elapsed_ms(started), 3)
+    return result
+
+
+def compile_config_file(path, schema_path=SCHEMA_PATH):
+    """
+    读取、验证并编译配置文件（不修改任何共享状态，可以在后台线程中执行）
+
+    参数:
+        path (str): 配置文件路径
+        schema_path (str): Schema 文件路径
+
+    返回:
+        ConfigCompilation: 编译结果
+    """
+    result = ConfigCompilation()
+    stage = time.perf_counter()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        result.parse_error = f'Error reading or parsing {os.path.basename(path)}: {e}'
+        result.timings['parse'] = result.timings['total'] = _elapsed_ms(stage)
+        return result
+    result.timings['parse'] = _elapsed_ms(stage)
+    if not isinstance(config, dict) or not isinstance(config.get('behaviors'), list):
+        result.parse_error = 'Invalid configuration format. Must contain "behaviors" array.'
+        result.timings['total'] = result.timings['parse']
+        return result
+    return compile_config(config, schema_path, result)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+配置文件监视模块
+
+按修改时间轮询监视配置文件（config.yaml 或通过 CONFIG_FILE 指定的其他配置），
+文件变化并在一个轮询间隔内保持不变后调用回调重新加载，避免读到编辑器写了一半的文件。
+
+轮询只调用 os.stat，开销可以忽略；读取、验证和编译新规则集都在监视线程中完成，
+不会阻塞日志读取线程。
+"""
+
+import os
+import threading
+
+
+DEFAULT_SETTINGS = {
+    'enabled': True,   # 是否监视配置文件
+    'interval': 1.0    # 轮询间隔（秒）
+}
+
+
+def file_signature(path):
+    """
+    文件签名（修改时间、大小），文件不存在时返回 None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigWatcher:
+    """配置文件监视器"""
+
+    def __init__(self, on_change, settings=None):
+        """
+        参数:
+            on_change (callable): 文件变化后调用 on_change(path)，在监视线程中执行
+            settings (dict, optional): 监视配置，见 DEFAULT_SETTINGS
+        """
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._signatures = {}  # 路径 -> 已加载内容的文件签名
+        self._pending = {}     # 路径 -> 检测到变化但尚未稳定的文件签名
+        self._running = False
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """
+        更新监视配置
+
+        参数:
+            settings (dict, optional): globalSettings.configWatch 配置
+        """
+        settings = settings or {}
+        self.enabled = bool(settings.get('enabled', DEFAULT_SETTINGS['enabled']))
+        self.interval = max(0.1, float(settings.get('interval', DEFAULT_SETTINGS['interval'])))
+
+    def watch(self, path):
+        """
+        开始监视文件（重复调用无副作用），以当前文件内容为基准
+
+        参数:
+            path (str): 配置文件路径
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._signatures:
+                self._signatures[path] = file_signature(path)
+
+    def mark_loaded(self, path):
+        """记录文件的当前签名为已加载（服务器自己写入配置文件后调用，避免重复加载）"""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._signatures[path] = file_signature(path)
+            self._pending.pop(path, None)
+
+    def paths(self):
+        """正在监视的文件列表"""
+        with self._lock:
+            return list(self._signatures)
+
+    def poll(self):
+        """
+        检查一次所有文件
+
+        文件签名变化后先记录为待定，下一次检查签名不变时才认为写入完成。
+        文件被删除时不触发（编辑器先删除再重命名保存时文件会短暂不存在）。
+
+        返回:
+            list: 需要重新加载的文件路径
+        """
+        changed = []
+        with self._lock:
+            for path, loaded in self._signatures.items():
+                signature = file_signature(path)
+                if signature is None or signature == loaded:
+                    self._pending.pop(path, None)
+                    continue
+                if self._pending.get(path) == signature:
+                    del self._pending[path]
+                    self._signatures[path] = signature
+                    changed.append(path)
+                else:
+                    self._pending[path] = signature
+        return changed
+
+    def start(self, socketio):
+        """
+        启动监视线程（重复调用无副作用）
+
+        参数:
+            socketio: Flask-SocketIO 实例，用于创建后台任务和休眠
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+
+        def run():
+            while self._running:
+                socketio.sleep(self.interval)
+                if not self.enabled:
+                    continue
+                for path in self.poll():
+                    try:
+                        self.on_change(path)
+                    except Exception as e:
+                        print(f'Error reloading {path}: {e}')
+
+        socketio.start_background_task(run)
+
+    def stop(self):
+        """停止监视线程"""
+        self._running = False
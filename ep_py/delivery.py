@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+分级投递模块
+
+为每个 Socket.IO 客户端维护按优先级划分的投递通道（lane），
+保证行为分析结果不会排在大量原始日志之后：
+
+- analysis: 行为分析事件（behavior_triggered、event_order_violation、
+            event_group_completed、final_check_results 等）
+- system:   系统消息和状态事件
+- raw:      原始日志行，以 log_batch 批量发送，压力过大时最先被丢弃；
+            批次中附带投递策略（delivery_policy）抑制的行数
+
+调度线程按权重轮询各通道：每一轮先发送最多 weights['analysis'] 个分析事件，
+再发送 weights['system'] 个系统事件，最后发送 weights['raw'] 个原始日志批次。
+每个通道都会统计从入队（分析完成）到实际发送的延迟。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+
+# 通道发送顺序（优先级从高到低）
+LANES = ('analysis', 'system', 'raw')
+
+# 事件名称到通道的映射，未列出的事件进入 system 通道
+EVENT_LANES = {
+    'behavior_triggered': 'analysis',
+    'event_order_violation': 'analysis',
+    'event_group_completed': 'analysis',
+    'event_group_incomplete': 'analysis',
+    'final_check_results': 'analysis',
+}
+
+DEFAULT_SETTINGS = {
+    'weights': {'analysis': 8, 'system': 4, 'raw': 1},
+    'rawBatchSize': 200,
+    'maxPending': 10000,
+    'flushInterval': 0.05,
+}
+
+
+class _ClientLanes:
+    """单个客户端的待发送队列"""
+
+    def __init__(self):
+        self.lanes = {lane: deque() for lane in LANES}
+        self.dropped = {lane: 0 for lane in LANES}
+        self.pending_dropped = 0  # 尚未在 log_batch 中报告的丢弃数量
+
+    def pending(self):
+        return sum(len(queue) for queue in self.lanes.values())
+
+
+class _LaneStats:
+    """单个通道的延迟统计"""
+
+    def __init__(self, sample_size=1024):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def record(self, latency_ms):
+        self.count += 1
+        self.total_ms += latency_ms
+        if latency_ms > self.max_ms:
+            self.max_ms = latency_ms
+        self.samples.append(latency_ms)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3)
+
+        return {
+            'emitted': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(self.max_ms, 3),
+        }
+
+
+class DeliveryDispatcher:
+    """
+    按客户端、按优先级投递 Socket.IO 事件
+
+    提供与 socketio.emit 相同的 emit(event, data, to=None) 接口，
+    可以直接替代 SocketIO 实例传给其他模块使用。
+    """
+
+    def __init__(self, socketio, settings=None):
+        """
+        参数:
+            socketio: Flask-SocketIO 实例，用于实际发送事件
+            settings (dict, optional): 投递配置，见 DEFAULT_SETTINGS
+        """
+        self.socketio = socketio
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._clients = {}
+        self._rooms = {}  # 房间名称 -> 客户端 sid 集合
+        self._stats = {lane: _LaneStats() for lane in LANES}
+        self._running = False
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """
+        更新投递配置（权重、批次大小、队列上限）
+
+        参数:
+            settings (dict, optional): globalSettings.delivery 配置
+        """
+        settings = settings or {}
+        weights = dict(DEFAULT_SETTINGS['weights'])
+        weights.update({lane: max(1, int(value)) for lane, value in (settings.get('weights') or {}).items() if lane in LANES})
+        self.weights = weights
+        self.raw_batch_size = max(1, int(settings.get('rawBatchSize', DEFAULT_SETTINGS['rawBatchSize'])))
+        self.max_pending = max(1, int(settings.get('maxPending', DEFAULT_SETTINGS['maxPending'])))
+        self.flush_interval = float(settings.get('flushInterval', DEFAULT_SETTINGS['flushInterval']))
+
+    def start(self):
+        """启动调度线程（重复调用无副作用）"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        """停止调度线程"""
+        self._running = False
+        self._wakeup.set()
+
+    def add_client(self, sid):
+        """注册新连接的客户端"""
+        with self._lock:
+            self._clients.setdefault(sid, _ClientLanes())
+
+    def remove_client(self, sid):
+        """移除已断开的客户端及其待发送队列"""
+        with self._lock:
+            self._clients.pop(sid, None)
+            for room in [room for room, members in self._rooms.items() if sid in members]:
+                self._leave(sid, room)
+
+    def join_room(self, sid, room):
+        """
+        将客户端加入房间，之后 emit(..., to=room) 的事件发送给房间中的所有客户端
+
+        返回:
+            bool: 客户端已连接
+        """
+        with self._lock:
+            if sid not in self._clients:
+                return False
+            self._rooms.setdefault(room, set()).add(sid)
+            return True
+
+    def leave_room(self, sid, room):
+        """将客户端移出房间"""
+        with self._lock:
+            self._leave(sid, room)
+
+    def _leave(self, sid, room):
+        members = self._rooms.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._rooms[room]
+
+    @staticmethod
+    def lane_for(event, data):
+        """
+        确定事件所属的通道
+
+        平台不是 system 的 log 事件视为原始日志行。
+        """
+        if event == 'log':
+            if isinstance(data, dict) and data.get('platform') != 'system':
+                return 'raw'
+            return 'system'
+        return EVENT_LANES.get(event, 'system')
+
+    def emit(self, event, data, to=None):
+        """
+        将事件放入对应通道等待发送
+
+        参数:
+            event (str): Socket.IO 事件名称
+            data: 事件数据
+            to (str, optional): 目标客户端 sid 或房间名称，为空时发送给所有客户端
+        """
+        lane = self.lane_for(event, data)
+        item = (event, data, time.monotonic())
+        with self._lock:
+            if to in self._rooms:
+                targets = [self._clients[sid] for sid in self._rooms[to] if sid in self._clients]
+            elif to is not None:
+                targets = [self._clients[to]] if to in self._clients else []
+            else:
+                targets = list(self._clients.values())
+            for client in targets:
+                client.lanes[lane].append(item)
+                if client.pending() > self.max_pending:
+                    self._shed(client)
+        if targets:
+            self._wakeup.set()
+
+    def wait_for_capacity(self, threshold=None, timeout=None, active=None, room=None):
+        """
+        等待客户端的原始日志队列降到阈值以下
+
+        批量产生日志的生产者（例如 Elasticsearch 搜索结果）在每批之后调用，
+        按客户端的实际接收速度推进，而不是让队列超过上限后丢弃原始日志。
+
+        参数:
+            threshold (int, optional): 原始日志队列阈值，默认为队列上限的一半
+            timeout (float, optional): 最长等待时间（秒），默认一直等待
+            active (callable, optional): 返回 False 时停止等待（例如生产者已被取消）
+            room (str, optional): 只统计该房间中的客户端（生产者的事件只发送到该房间时），
+                                  其他客户端（例如查看实时设备日志的慢速页面）不影响等待；默认统计所有客户端
+
+        返回:
+            bool: 队列已降到阈值以下（超时或调度线程未运行时返回 False）
+        """
+        threshold = self.max_pending // 2 if threshold is None else threshold
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                if room is None:
+                    clients = list(self._clients.values())
+                else:
+                    clients = [self._clients[sid] for sid in self._rooms.get(room, ()) if sid in self._clients]
+                backlog = max((len(client.lanes['raw']) for client in clients), default=0)
+            if backlog <= threshold:
+                return True
+            if not self._running or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            if active is not None and not active():
+                return False
+            self._wakeup.set()
+            time.sleep(self.flush_interval)
+
+    def _shed(self, client):
+        """队列超过上限时丢弃最旧的原始日志，其次是系统消息，分析事件从不丢弃"""
+        for lane in ('raw', 'system'):
+            queue = client.lanes[lane]
+            while queue and client.pending() > self.max_pending:
+                queue.popleft()
+                client.dropped[lane] += 1
+                if lane == 'raw':
+                    client.pending_dropped += 1
+            if client.pending() <= self.max_pending:
+                return
+
+    def _run(self):
+        """调度线程主循环"""
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception as e:
+                logging.error(f"投递调度失败: {e}")
+
+    def _drain(self):
+        """按权重轮询发送所有客户端的待发送事件，直到队列清空"""
+        while self._running:
+            with self._lock:
+                clients = list(self._clients.items())
+            sent = 0
+            for sid, client in clients:
+                for lane in LANES:
+                    for _ in range(self.weights[lane]):
+                        if lane == 'raw':
+                            batch = self._take_raw_batch(client)
+                            if batch is None:
+                                break
+                            self._send(sid, 'log_batch', batch[0], lane, batch[1])
+                        else:
+                            with self._lock:
+                                queue = client.lanes[lane]
+                                item = queue.popleft() if queue else None
+                            if item is None:
+                                break
+                            self._send(sid, item[0], item[1], lane, item[2])
+                        sent += 1
+            if not sent:
+                return
+
+    def _take_raw_batch(self, client):
+        """从 raw 通道取出一个批次，返回 (batch_data, 最早入队时间)"""
+        with self._lock:
+            queue = client.lanes['raw']
+            if not queue:
+                return None
+            count = min(len(queue), self.raw_batch_size)
+            items = [queue.popleft() for _ in range(count)]
+            dropped = client.pending_dropped
+            client.pending_dropped = 0
+        lines = [item[1] for item in items]
+        # 汇总投递策略附加在各行上的抑制计数（限速、采样、仅行为模式）
+        suppressed = {}
+        for line in lines:
+            for reason, count in (line.get('suppressed') or {}).items():
+                suppressed[reason] = suppressed.get(reason, 0) + count
+        batch = {
+            'lines': lines,
+            'dropped': dropped,
+            'suppressed': suppressed
+        }
+        return batch, items[0][2]
+
+    def _send(self, sid, event, data, lane, enqueued_at):
+        self.socketio.emit(event, data, to=sid)
+        self._stats[lane].record((time.monotonic() - enqueued_at) * 1000)
+
+    def get_stats(self):
+        """
+        获取投递统计信息
+
+        返回:
+            dict: 每个通道的延迟统计、当前待发送数量和丢弃数量
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            lanes = {}
+            for lane in LANES:
+                stats = self._stats[lane].snapshot()
+                stats['weight'] = self.weights[lane]
+                stats['pending'] = sum(len(client.lanes[lane]) for client in clients)
+                stats['dropped'] = sum(client.dropped[lane] for client in clients)
+                lanes[lane] = stats
+        return {
+            'clients': len(clients),
+            'rawBatchSize': self.raw_batch_size,
+            'maxPending': self.max_pending,
+            'lanes': lanes
+        }
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+原始日志投递策略模块
+
+位于日志分帧（read_log_stream / 导入）和 Socket.IO 投递之间，
+只决定一条原始日志是否发送给客户端，不影响行为分析——
+analyze_log_behavior 始终处理每一行日志。
+
+每个会话一个策略实例，支持：
+- 全局限速: 每秒最多投递的行数（令牌桶）
+- 按标签限速: 每个日志标签独立的令牌桶
+- 重复标签采样: 同一标签在一秒内超过阈值后，只投递每 N 行中的 1 行
+- 仅行为模式: 输入速率超过阈值时自动停止投递原始日志，只保留行为分析事件，
+              速率回落到恢复阈值以下时自动恢复
+
+被抑制的行按原因计数，随下一条被投递的日志一起报告给客户端。
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_POLICY = {
+    'maxLinesPerSecond': 0,        # 0 表示不限速
+    'perTagLinesPerSecond': 0,     # 0 表示不按标签限速
+    'perTagBurst': 0,              # 标签令牌桶容量，0 表示与速率相同
+    'sampleRepeatedTagsAfter': 0,  # 同一标签每秒超过该行数后开始采样，0 表示不采样
+    'sampleRate': 10,              # 采样时每 N 行投递 1 行
+    'behaviorsOnlyAbove': 0,       # 输入速率（行/秒）超过该值时切换到仅行为模式，0 表示不启用
+    'behaviorsOnlyRecoverBelow': 0  # 速率低于该值时恢复，0 表示取 behaviorsOnlyAbove 的一半
+}
+
+# Android / HarmonyOS: MM-DD HH:MM:SS.mmm PID TID LEVEL TAG: message
+_LOGCAT_TAG_PATTERN = re.compile(r'^\d{2}-\d{2}\s+\S+\s+\d+\s+\d+\s+[VDIWEFA]\s+([^:]+?)\s*:')
+# iOS idevicesyslog: Mon DD HH:MM:SS Device Process[pid] <Level>: message
+_SYSLOG_TAG_PATTERN = re.compile(r'\s([\w.\-]+)(?:\([^)]*\))?\[\d+\]')
+
+
+def extract_tag(message):
+    """
+    从日志行中提取标签（Android/HarmonyOS 的 TAG，iOS 的进程名）
+
+    返回:
+        str: 标签，无法识别时返回空字符串
+    """
+    match = _LOGCAT_TAG_PATTERN.match(message)
+    if match:
+        return match.group(1)
+    match = _SYSLOG_TAG_PATTERN.search(message[:200])
+    if match:
+        return match.group(1)
+    return ''
+
+
+class TokenBucket:
+    """令牌桶限速器"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """尝试取出一个令牌，成功返回 True"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class DeliveryPolicy:
+    """单个会话的原始日志投递策略"""
+
+    MAX_TRACKED_TAGS = 1024  # 单个会话最多跟踪的标签数量，超出时淘汰最久未出现的标签
+
+    def __init__(self, settings=None):
+        """
+        参数:
+            settings (dict, optional): 策略配置，见 DEFAULT_POLICY
+        """
+        self._lock = threading.Lock()
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """更新策略配置并重置限速状态"""
+        merged = dict(DEFAULT_POLICY)
+        merged.update({key: value for key, value in (settings or {}).items() if key in DEFAULT_POLICY})
+        with self._lock:
+            self.settings = merged
+            self.global_bucket = TokenBucket(merged['maxLinesPerSecond']) if merged['maxLinesPerSecond'] > 0 else None
+            self.tag_buckets = OrderedDict()
+            self.tag_counts = {}            # 当前一秒窗口内每个标签的行数
+            self.window_start = time.monotonic()
+            self.window_lines = 0           # 当前窗口的输入行数
+            self.input_rate = 0.0           # 上一个窗口的输入速率（行/秒）
+            self.behaviors_only = False
+            self.pending_suppressed = {}    # 尚未报告给客户端的抑制计数
+            self.total_suppressed = {}
+            self.total_admitted = 0
+
+    def _suppress(self, reason):
+        self.pending_suppressed[reason] = self.pending_suppressed.get(reason, 0) + 1
+        self.total_suppressed[reason] = self.total_suppressed.get(reason, 0) + 1
+
+    def _roll_window(self, now):
+        """
+        结束当前一秒窗口，更新输入速率和仅行为模式状态
+
+        返回:
+            dict or None: 模式切换或仅行为模式下需要报告的抑制信息
+        """
+        elapsed = now - self.window_start
+        self.input_rate = self.window_lines / elapsed if elapsed > 0 else 0.0
+        self.window_start = now
+        self.window_lines = 0
+        self.tag_counts.clear()
+
+        threshold = self.settings['behaviorsOnlyAbove']
+        if threshold <= 0:
+            return None
+        recover = self.settings['behaviorsOnlyRecoverBelow'] or threshold / 2
+        previous = self.behaviors_only
+        if not previous and self.input_rate > threshold:
+            self.behaviors_only = True
+        elif previous and self.input_rate < recover:
+            self.behaviors_only = False
+        if self.behaviors_only or previous != self.behaviors_only:
+            report = {
+                'mode': 'behaviors_only' if self.behaviors_only else 'normal',
+                'changed': previous != self.behaviors_only,
+                'input_rate': round(self.input_rate, 1),
+                'suppressed': self.pending_suppressed
+            }
+            self.pending_suppressed = {}
+            return report
+        return None
+
+    def admit(self, message, now=None):
+        """
+        判断一条原始日志是否应该投递
+
+        参数:
+            message (str): 日志内容
+            now (float, optional): 当前 monotonic 时间，便于批量调用时复用
+
+        返回:
+            tuple: (是否投递, 随本行报告的抑制计数或 None, 窗口报告或 None)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            report = None
+            if now - self.window_start >= 1.0:
+                report = self._roll_window(now)
+            self.window_lines += 1
+            settings = self.settings
+
+            if self.behaviors_only:
+                self._suppress('behaviors_only')
+                return False, None, report
+
+            tag = None
+            if settings['sampleRepeatedTagsAfter'] > 0 or settings['perTagLinesPerSecond'] > 0:
+                tag = extract_tag(message)
+
+            if settings['sampleRepeatedTagsAfter'] > 0:
+                count = self.tag_counts.get(tag, 0) + 1
+                self.tag_counts[tag] = count
+                over = count - settings['sampleRepeatedTagsAfter']
+                if over > 0 and over % max(1, settings['sampleRate']) != 0:
+                    self._suppress('sampled')
+                    return False, None, report
+
+            if settings['perTagLinesPerSecond'] > 0:
+                bucket = self.tag_buckets.get(tag)
+                if bucket is None:
+                    bucket = TokenBucket(settings['perTagLinesPerSecond'], settings['perTagBurst'] or None)
+                    self.tag_buckets[tag] = bucket
+                    if len(self.tag_buckets) > self.MAX_TRACKED_TAGS:
+                        self.tag_buckets.popitem(last=False)
+                else:
+                    self.tag_buckets.move_to_end(tag)
+                if not bucket.take(now):
+                    self._suppress('tag_limit')
+                    return False, None, report
+
+            if self.global_bucket and not self.global_bucket.take(now):
+                self._suppress('rate_limit')
+                return False, None, report
+
+            self.total_admitted += 1
+            suppressed = None
+            if self.pending_suppressed:
+                suppressed = self.pending_suppressed
+                self.pending_suppressed = {}
+            return True, suppressed, report
+
+    def status(self):
+        """获取策略状态"""
+        with self._lock:
+            return {
+                'settings': dict(self.settings),
+                'mode': 'behaviors_only' if self.behaviors_only else 'normal',
+                'input_rate': round(self.input_rate, 1),
+                'admitted': self.total_admitted,
+                'suppressed': dict(self.total_suppressed)
+            }
+
+
+class DeliveryPolicyRegistry:
+    """按会话管理投递策略"""
+
+    def __init__(self, max_sessions=16):
+        self.defaults = {}
+        self.max_sessions = max_sessions
+        self._policies = OrderedDict()
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    def configure(self, settings=None):
+        """
+        更新默认策略（globalSettings.delivery.policy），已有会话中没有单独覆盖的配置会同步更新
+        """
+        with self._lock:
+            self.defaults = dict(settings or {})
+            for session_id, policy in self._policies.items():
+                merged = dict(self.defaults)
+                merged.update(self._overrides.get(session_id, {}))
+                policy.configure(merged)
+
+    def get(self, session_id):
+        """获取会话的投递策略，不存在时按默认配置创建"""
+        with self._lock:
+            policy = self._policies.get(session_id)
+            if policy is None:
+                merged = dict(self.defaults)
+                merged.update(self._overrides.get(session_id, {}))
+                policy = DeliveryPolicy(merged)
+                self._policies[session_id] = policy
+                while len(self._policies) > self.max_sessions:
+                    evicted, _ = self._policies.popitem(last=False)
+                    self._overrides.pop(evicted, None)
+            else:
+                self._policies.move_to_end(session_id)
+            return policy
+
+    def override(self, session_id, settings):
+        """
+        为单个会话设置策略覆盖配置
+
+        异常:
+            ValueError: 包含未知的配置项，或配置值不是非负整数
+            TypeError: 配置值无法转换为整数
+        """
+        overrides = {}
+        for key, value in (settings or {}).items():
+            if key not in DEFAULT_POLICY:
+                raise ValueError(f'未知的投递策略配置项: {key}')
+            overrides[key] = int(value)
+            if overrides[key] < 0:
+                raise ValueError(f'投递策略配置项 {key} 不能为负数: {value}')
+        with self._lock:
+            self._overrides[session_id] = overrides
+        policy = self.get(session_id)
+        merged = dict(self.defaults)
+        merged.update(self._overrides[session_id])
+        policy.configure(merged)
+        return policy.status()
+
+    def status(self):
+        """获取所有会话的策略状态"""
+        with self._lock:
+            policies = list(self._policies.items())
+        return {session_id: policy.status() for session_id, policy in policies}
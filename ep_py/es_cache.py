@@ -0,0 +1,623 @@
+# -*- coding: utf-8 -*-
+"""
+Elasticsearch 查询结果缓存模块
+
+同一个查询（同一用户ID、只把 end_time 往后移）反复执行时，只从 Elasticsearch 读取缓存中还没有的时间段。
+
+缓存条目由索引和去掉时间范围后的规范化查询确定，每个条目保存若干互不重叠的时间段（segment），
+时间段是毫秒精度的闭区间 [lo, hi]。请求的时间范围与已缓存的时间段比较后拆分为:
+    已缓存的部分      直接从磁盘读取
+    正在读取的部分    其他请求正在从 ES 读取同一时间段时共享同一次读取，不重复下载
+    缺失的部分        按时间字段升序从 ES 读取，写入磁盘后加入缓存
+各部分按时间顺序依次交给调用方，结果与直接查询整个时间范围一样按时间排序。
+
+结束时间距离当前时间不到 settleSeconds 的部分可能还有日志没有写入 ES，这部分每次都重新读取，不写入缓存。
+
+目录结构:
+    <directory>/<条目键>/meta.json           条目信息（索引、规范化查询、时间段列表及每个时间段的页索引）
+    <directory>/<条目键>/<时间段ID>.pages    时间段数据：每页命中文档是一个 gzip 压缩的 JSON 数组，依次追加
+    <directory>/<条目键>/<时间段ID>.part     正在读取的时间段，读取完整后改名为 .pages
+
+页索引记录每页的偏移、长度、文档数和首末时间戳，读取时跳过请求范围以外的页。
+超过 maxBytes 时删除最久未使用的时间段，写入时间超过 maxAge 的时间段不再使用。
+"""
+
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+DEFAULT_SETTINGS = {
+    'enabled': True,                    # 是否缓存搜索结果
+    'directory': 'es_cache',            # 缓存目录
+    'maxBytes': 1024 * 1024 * 1024,     # 缓存的最大字节数，超过时删除最久未使用的时间段
+    'maxAge': 7 * 24 * 3600,            # 时间段写入后的最长使用时间（秒）
+    'settleSeconds': 300                # 距当前时间不到该秒数的日志不写入缓存（ES 可能还在写入）
+}
+
+TIME_FIELD = '@timestamp'
+RANGE_PLACEHOLDER = '__cached_time_range__'
+RANGE_OPERATORS = ('gte', 'gt', 'lte', 'lt', 'format')
+
+
+def to_millis(value, round_up=False):
+    """
+    把时间转换为毫秒时间戳
+
+    参数:
+        value: ISO 格式字符串（没有时区时按 UTC，与 ES 一致）或毫秒时间戳
+        round_up (bool): 有亚毫秒部分时向上取整（下界）还是向下取整（上界）
+
+    返回:
+        int: 毫秒时间戳，无法解析（例如 now-1h 等日期表达式）时返回 None
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        millis = float(value)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        millis = parsed.timestamp() * 1000
+    else:
+        return None
+    return math.ceil(millis) if round_up else math.floor(millis)
+
+
+def split_time_range(query, time_field=TIME_FIELD):
+    """
+    取出查询中时间字段的范围条件
+
+    返回:
+        tuple: (范围条件替换为占位符的查询, 最早时间, 最晚时间)，时间为毫秒闭区间；
+               查询中没有或有多个时间范围、范围不完整或无法解析时返回 None
+    """
+    found = []
+
+    def replace(node):
+        if isinstance(node, dict):
+            if set(node) == {'range'} and isinstance(node['range'], dict) and time_field in node['range']:
+                found.append(node['range'][time_field])
+                return RANGE_PLACEHOLDER
+            return {key: replace(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [replace(value) for value in node]
+        return node
+
+    normalized = replace({key: value for key, value in query.items() if key not in ('sort', 'size')})
+    if len(found) != 1 or not isinstance(found[0], dict) or set(found[0]) - set(RANGE_OPERATORS):
+        return None
+    bounds = found[0]
+    # 只支持默认格式和毫秒时间戳（build_range_query 生成的查询）
+    if bounds.get('format', 'epoch_millis') != 'epoch_millis':
+        return None
+    if 'gte' in bounds:
+        lo = to_millis(bounds['gte'], round_up=True)
+    elif 'gt' in bounds:
+        lo = to_millis(bounds['gt'])
+        lo = lo + 1 if lo is not None else None
+    else:
+        return None
+    if 'lte' in bounds:
+        hi = to_millis(bounds['lte'])
+    elif 'lt' in bounds:
+        hi = to_millis(bounds['lt'], round_up=True)
+        hi = hi - 1 if hi is not None else None
+    else:
+        return None
+    if lo is None or hi is None:
+        return None
+    return normalized, lo, hi
+
+
+def build_range_query(normalized, lo, hi, time_field=TIME_FIELD):
+    """把占位符替换为毫秒闭区间 [lo, hi]，按时间字段升序排序"""
+    def replace(node):
+        if node == RANGE_PLACEHOLDER:
+            return {'range': {time_field: {'gte': lo, 'lte': hi, 'format': 'epoch_millis'}}}
+        if isinstance(node, dict):
+            return {key: replace(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [replace(value) for value in node]
+        return node
+
+    query = replace(copy.deepcopy(normalized))
+    query['sort'] = [{time_field: {'order': 'asc'}}]
+    query['track_total_hits'] = True
+    return query
+
+
+def hit_time(hit, time_field=TIME_FIELD):
+    """命中文档的毫秒时间戳：优先使用排序值，其次解析 _source 中的时间字段"""
+    sort = hit.get('sort')
+    if sort and isinstance(sort[0], (int, float)) and not isinstance(sort[0], bool):
+        return int(sort[0])
+    return to_millis(hit.get('_source', {}).get(time_field))
+
+
+def read_page(f, page):
+    """读取一页命中文档，page 为页索引项 [偏移, 长度, 文档数, 最早时间, 最晚时间]"""
+    f.seek(page[0])
+    return json.loads(gzip.decompress(f.read(page[1])))
+
+
+def page_within(page, lo, hi):
+    """整页都在 [lo, hi] 内"""
+    return page[3] is not None and lo <= page[3] and page[4] <= hi
+
+
+def page_hits(f, page, lo, hi, time_field=TIME_FIELD):
+    """
+    读取一页中落在 [lo, hi] 内的命中文档，整页都在范围以外时不读取文件
+
+    没有时间戳的文档保留在结果中。
+    """
+    if page[3] is not None and (page[4] < lo or page[3] > hi):
+        return []
+    hits = read_page(f, page)
+    if page_within(page, lo, hi):
+        return hits
+    times = [hit_time(hit, time_field) for hit in hits]
+    return [hit for hit, t in zip(hits, times) if t is None or lo <= t <= hi]
+
+
+class _Segment:
+    """缓存中已读取完整的时间段"""
+
+    def __init__(self, segment_id, lo, hi, pages, path, created=None, last_used=None):
+        self.id = segment_id
+        self.lo = lo
+        self.hi = hi
+        self.pages = pages
+        self.path = path
+        self.created = created or time.time()
+        self.last_used = last_used or self.created
+
+    @property
+    def hits(self):
+        return sum(page[2] for page in self.pages)
+
+    @property
+    def bytes(self):
+        return sum(page[1] for page in self.pages)
+
+    def to_dict(self):
+        return {'id': self.id, 'lo': self.lo, 'hi': self.hi, 'created': self.created,
+                'lastUsed': self.last_used, 'pages': self.pages}
+
+
+class _Entry:
+    """一个缓存条目：同一索引和规范化查询的所有时间段"""
+
+    def __init__(self, key, directory, index_name, normalized):
+        self.key = key
+        self.directory = directory
+        self.index_name = index_name
+        self.normalized = normalized
+        self.segments = []
+
+    def write_meta(self):
+        """原子写入 meta.json"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'meta.json')
+        meta = {'index': self.index_name, 'query': self.normalized,
+                'segments': [segment.to_dict() for segment in self.segments]}
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+
+class _Fetch:
+    """
+    从 ES 读取一个时间段
+
+    读取线程把每页写入文件并追加页索引，订阅的请求从文件按页读取；
+    所有订阅者都已停止时读取随之停止。cache 为 False 时（未稳定的时间段）读取结束后删除文件。
+    """
+
+    def __init__(self, entry, lo, hi, cache, windows=None):
+        self.entry = entry
+        self.lo = lo
+        self.hi = hi
+        self.cache = cache
+        self.windows = windows
+        self.id = uuid.uuid4().hex[:12]
+        os.makedirs(entry.directory, exist_ok=True)
+        self.path = os.path.join(entry.directory, self.id + '.part')
+        self.file = open(self.path, 'wb')
+        self.pages = []
+        self.total = None
+        self.finished = False
+        self.failed = False
+        self.abandoned = False  # 所有订阅者都已停止，读取即将结束，新的请求不再共享
+        self.subscribers = 0
+
+
+class EsQueryCache:
+    """
+    Elasticsearch 查询结果的磁盘缓存
+
+    search 的参数和回调与 EsUtil.search 相同，可以直接替代 EsUtil.search 使用；
+    聚合查询、没有明确时间范围的查询和缓存关闭时直接调用 EsUtil.search。
+    """
+
+    def __init__(self, es_util, settings=None, time_field=TIME_FIELD):
+        """
+        参数:
+            es_util (EsUtil): 读取缺失时间段使用的 ES 客户端
+            settings (dict, optional): 缓存配置，见 DEFAULT_SETTINGS
+            time_field (str): 时间字段
+        """
+        self.es_util = es_util
+        self.time_field = time_field
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._entries = {}
+        self._fetches = {}  # 条目键 -> 正在读取并将写入缓存的 _Fetch 列表
+        self.directory = None
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """
+        更新缓存配置，目录改变时重新加载缓存索引
+
+        参数:
+            settings (dict, optional): globalSettings.esSearch.cache 配置
+        """
+        settings = settings or {}
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update({key: value for key, value in settings.items() if key in DEFAULT_SETTINGS})
+        with self._lock:
+            self.enabled = bool(merged['enabled'])
+            self.max_bytes = max(0, int(merged['maxBytes']))
+            self.max_age = max(0.0, float(merged['maxAge']))
+            self.settle_seconds = max(0.0, float(merged['settleSeconds']))
+            if merged['directory'] != self.directory:
+                self.directory = merged['directory']
+                self._load()
+            self._evict()
+
+    def _load(self):
+        """从缓存目录加载所有条目，删除未完成的 .part 文件和不属于任何时间段的文件"""
+        self._entries = {}
+        if not os.path.isdir(self.directory):
+            return
+        for key in os.listdir(self.directory):
+            directory = os.path.join(self.directory, key)
+            try:
+                with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            entry = _Entry(key, directory, meta.get('index'), meta.get('query'))
+            for item in meta.get('segments', []):
+                path = os.path.join(directory, item['id'] + '.pages')
+                pages = item.get('pages', [])
+                if os.path.exists(path) and os.path.getsize(path) == sum(page[1] for page in pages):
+                    entry.segments.append(_Segment(item['id'], item['lo'], item['hi'], pages, path,
+                                                   item.get('created'), item.get('lastUsed')))
+            known = {segment.id + '.pages' for segment in entry.segments} | {'meta.json'}
+            for name in os.listdir(directory):
+                if name not in known:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+            entry.segments.sort(key=lambda segment: segment.lo)
+            self._entries[key] = entry
+
+    def _evict(self):
+        """删除过期的时间段，总大小超过上限时删除最久未使用的时间段（读取中的文件句柄不受影响）"""
+        now = time.time()
+        segments = [(entry, segment) for entry in self._entries.values() for segment in entry.segments]
+        expired = [item for item in segments if self.max_age and now - item[1].created > self.max_age]
+        remaining = sorted((item for item in segments if item not in expired), key=lambda item: item[1].last_used)
+        total = sum(segment.bytes for _, segment in remaining)
+        while remaining and total > self.max_bytes:
+            entry, segment = remaining.pop(0)
+            expired.append((entry, segment))
+            total -= segment.bytes
+        touched = set()
+        for entry, segment in expired:
+            entry.segments.remove(segment)
+            touched.add(entry)
+            try:
+                os.remove(segment.path)
+            except OSError:
+                pass
+        for entry in touched:
+            if entry.segments or self._fetches.get(entry.key):
+                entry.write_meta()
+            else:
+                del self._entries[entry.key]
+                shutil.rmtree(entry.directory, ignore_errors=True)
+
+    def status(self):
+        """缓存状态：条目数、时间段数、总大小和正在读取的时间段数"""
+        with self._lock:
+            segments = [segment for entry in self._entries.values() for segment in entry.segments]
+            return {
+                'enabled': self.enabled,
+                'directory': self.directory,
+                'entries': len(self._entries),
+                'segments': len(segments),
+                'hits': sum(segment.hits for segment in segments),
+                'bytes': sum(segment.bytes for segment in segments),
+                'fetching': sum(len(fetches) for fetches in self._fetches.values())
+            }
+
+    def clear(self):
+        """删除所有已缓存的时间段（正在读取的时间段不受影响）"""
+        with self._lock:
+            for entry in list(self._entries.values()):
+                for segment in entry.segments:
+                    try:
+                        os.remove(segment.path)
+                    except OSError:
+                        pass
+                entry.segments = []
+                if self._fetches.get(entry.key):
+                    entry.write_meta()
+                else:
+                    del self._entries[entry.key]
+                    shutil.rmtree(entry.directory, ignore_errors=True)
+
+    def search(self, query, index_name, process_batch=None, on_total=None, on_plan=None, windows=None, **kwargs):
+        """
+        执行查询，已缓存的时间段从磁盘读取，缺失的时间段从 ES 读取并写入缓存
+
+        参数:
+            query (dict): 查询，时间范围条件为 {"range": {"@timestamp": {"gte"/"gt": ..., "lte"/"lt": ...}}}
+            index_name (str): 索引名称
+            process_batch (callable, optional): 每页结果调用一次 process_batch(hits)，返回 False 时停止读取
+            on_total (callable, optional): 开始读取前调用 on_total(总命中数)
+            on_plan (callable, optional): 开始读取前调用 on_plan({'cached', 'shared', 'fetched'})，
+                                          分别为从缓存、共享读取和新读取的时间段数
+            windows (int, optional): 大于 1 时缺失的时间段按时间窗口并行读取（EsUtil.search 的 windows 参数）
+            **kwargs: 不使用缓存时传给 EsUtil.search 的其他参数
+
+        返回:
+            list: 未指定 process_batch 时为所有命中文档，否则为空列表
+
+        异常:
+            RuntimeError: 缺失时间段的读取失败或不完整；不使用缓存时 EsUtil.search 查询失败或结果不完整
+        """
+        aggregated = 'aggs' in query or 'aggregations' in query
+        split = None if aggregated or not self.enabled else split_time_range(query, self.time_field)
+        if split is None:
+            result = self.es_util.search(query, index_name, process_batch=process_batch, on_total=on_total,
+                                         windows=windows, time_field=self.time_field, **kwargs)
+            if result == {}:
+                raise RuntimeError('Elasticsearch 查询失败或结果不完整')
+            return result
+        normalized, lo, hi = split
+
+        all_hits = []
+        if process_batch is None:
+            process_batch = all_hits.extend
+        if hi < lo:
+            if on_total:
+                on_total(0)
+            return all_hits
+
+        parts, started = self._plan(index_name, normalized, lo, hi, windows)
+        try:
+            for fetch in started:
+                threading.Thread(target=self._run_fetch, args=(fetch,), name=f'es-cache-{fetch.id}', daemon=True).start()
+            if on_plan:
+                on_plan({
+                    'cached': sum(1 for part in parts if isinstance(part[0], _Segment)),
+                    'shared': sum(1 for part in parts if isinstance(part[0], _Fetch) and part[0] not in started),
+                    'fetched': len(started)
+                })
+            if on_total:
+                on_total(sum(self._count(part, index_name) for part in parts))
+            while parts:
+                source, part_lo, part_hi, f = parts[0]
+                if isinstance(source, _Segment):
+                    more = self._stream_segment(source, f, part_lo, part_hi, process_batch)
+                else:
+                    more = self._stream_fetch(source, f, part_lo, part_hi, process_batch)
+                self._release(parts.pop(0))
+                if not more:
+                    break
+        finally:
+            for part in parts:
+                self._release(part)
+        return all_hits
+
+    def _plan(self, index_name, normalized, lo, hi, windows=None):
+        """
+        把请求的时间范围拆分为已缓存、正在读取和需要新读取的部分，并打开各部分的文件
+
+        返回:
+            tuple: ([(来源, 最早时间, 最晚时间, 文件), ...] 按时间排序, 新创建的 _Fetch 列表)
+        """
+        key = hashlib.sha1(json.dumps({'index': index_name, 'query': normalized}, sort_keys=True,
+                                      ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+        settled = to_millis(time.time() * 1000 - self.settle_seconds * 1000)
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, os.path.join(self.directory, key), index_name, normalized)
+            fetching = [fetch for fetch in self._fetches.get(key, []) if not fetch.abandoned]
+            covered = sorted(entry.segments + fetching, key=lambda source: source.lo)
+            plan = []
+            cursor = lo
+            for source in covered:
+                if source.hi < cursor:
+                    continue
+                if source.lo > hi:
+                    break
+                if source.lo > cursor:
+                    plan.append((None, cursor, source.lo - 1))
+                plan.append((source, max(source.lo, cursor), min(source.hi, hi)))
+                cursor = source.hi + 1
+                if cursor > hi:
+                    break
+            if cursor <= hi:
+                plan.append((None, cursor, hi))
+
+            sources = []
+            for source, part_lo, part_hi in plan:
+                if source is not None:
+                    sources.append((source, part_lo, part_hi))
+                elif part_lo > settled:
+                    sources.append((_Fetch(entry, part_lo, part_hi, False, windows), part_lo, part_hi))
+                elif part_hi > settled:
+                    sources.append((_Fetch(entry, part_lo, settled, True, windows), part_lo, settled))
+                    sources.append((_Fetch(entry, settled + 1, part_hi, False, windows), settled + 1, part_hi))
+                else:
+                    sources.append((_Fetch(entry, part_lo, part_hi, True, windows), part_lo, part_hi))
+
+            parts, started = [], []
+            now = time.time()
+            try:
+                for source, part_lo, part_hi in sources:
+                    if isinstance(source, _Segment):
+                        source.last_used = now
+                    else:
+                        if source.subscribers == 0:
+                            started.append(source)
+                            if source.cache:
+                                self._fetches.setdefault(key, []).append(source)
+                        source.subscribers += 1
+                    parts.append((source, part_lo, part_hi, open(source.path, 'rb')))
+            except OSError:
+                for source, _, _, f in parts:
+                    f.close()
+                    if isinstance(source, _Fetch):
+                        source.subscribers -= 1
+                raise
+            if entry.segments:
+                entry.write_meta()
+            return parts, started
+
+    def _release(self, part):
+        """关闭部分的文件，共享读取的订阅者减一"""
+        source, _, _, f = part
+        f.close()
+        if isinstance(source, _Fetch):
+            with self._lock:
+                source.subscribers -= 1
+
+    def _count(self, part, index_name):
+        """部分中的命中文档数"""
+        source, lo, hi, f = part
+        if isinstance(source, _Segment):
+            # 只有跨越范围边界的页需要读取
+            return sum(page[2] if page_within(page, lo, hi) else len(page_hits(f, page, lo, hi, self.time_field))
+                       for page in source.pages)
+        if (source.lo, source.hi) != (lo, hi):
+            # 共享的读取比请求的范围大，单独统计请求范围内的文档数
+            count = self.es_util.count(build_range_query(source.entry.normalized, lo, hi, self.time_field), index_name)
+            if count is not None:
+                return count
+        with self._changed:
+            while source.total is None and not source.finished:
+                self._changed.wait()
+            return source.total or 0
+
+    def _stream_segment(self, segment, f, lo, hi, process_batch):
+        for page in segment.pages:
+            if page[3] is not None and page[3] > hi:
+                break
+            hits = page_hits(f, page, lo, hi, self.time_field)
+            if hits and process_batch(hits) is False:
+                return False
+        return True
+
+    def _stream_fetch(self, fetch, f, lo, hi, process_batch):
+        index = 0
+        while True:
+            with self._changed:
+                while len(fetch.pages) <= index and not fetch.finished:
+                    self._changed.wait()
+                if len(fetch.pages) <= index:
+                    if fetch.failed:
+                        raise RuntimeError(f'Elasticsearch 读取时间段 {fetch.lo}-{fetch.hi} 失败或不完整')
+                    return True
+                page = fetch.pages[index]
+            index += 1
+            hits = page_hits(f, page, lo, hi, self.time_field)
+            if hits and process_batch(hits) is False:
+                return False
+
+    def _run_fetch(self, fetch):
+        """读取线程：按时间升序读取时间段，每页写入文件后通知订阅者"""
+        fetched = 0
+
+        def on_total(total):
+            with self._changed:
+                fetch.total = total
+                self._changed.notify_all()
+
+        def write_page(hits):
+            nonlocal fetched
+            with self._lock:
+                if fetch.subscribers <= 0:
+                    fetch.abandoned = True
+                    return False
+            data = gzip.compress(json.dumps(hits, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            offset = fetch.file.tell()
+            fetch.file.write(data)
+            fetch.file.flush()
+            times = [t for t in (hit_time(hit, self.time_field) for hit in hits) if t is not None]
+            fetched += len(hits)
+            with self._changed:
+                fetch.pages.append([offset, len(data), len(hits), min(times, default=None), max(times, default=None)])
+                self._changed.notify_all()
+            return True
+
+        query = build_range_query(fetch.entry.normalized, fetch.lo, fetch.hi, self.time_field)
+        try:
+            result = self.es_util.search(query, fetch.entry.index_name, process_batch=write_page, on_total=on_total,
+                                         windows=fetch.windows, time_field=self.time_field)
+            complete = not isinstance(result, dict) and fetch.total is not None and fetched >= fetch.total
+        except Exception as e:
+            logging.error(f"读取缓存时间段失败: {e}")
+            complete = False
+        finally:
+            fetch.file.close()
+
+        with self._changed:
+            fetch.finished = True
+            fetch.failed = not complete
+            if fetch.cache:
+                fetches = self._fetches.get(fetch.entry.key, [])
+                if fetch in fetches:
+                    fetches.remove(fetch)
+                if not fetches:
+                    self._fetches.pop(fetch.entry.key, None)
+            if complete and fetch.cache and self._entries.get(fetch.entry.key) is fetch.entry:
+                path = os.path.join(fetch.entry.directory, fetch.id + '.pages')
+                os.replace(fetch.path, path)
+                fetch.entry.segments.append(_Segment(fetch.id, fetch.lo, fetch.hi, fetch.pages, path))
+                fetch.entry.segments.sort(key=lambda segment: segment.lo)
+                fetch.entry.write_meta()
+                logging.info(f"缓存时间段 {fetch.lo}-{fetch.hi}: {fetched} 条记录")
+                self._evict()
+            else:
+                # 未稳定、被放弃或失败的时间段不写入缓存，订阅者已打开的文件句柄仍然可以读取
+                try:
+                    os.remove(fetch.path)
+                except OSError:
+                    pass
+                if fetch.entry.key in self._entries and not fetch.entry.segments and not self._fetches.get(fetch.entry.key):
+                    del self._entries[fetch.entry.key]
+                    shutil.rmtree(fetch.entry.directory, ignore_errors=True)
+            self._changed.notify_all()
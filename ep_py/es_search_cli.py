@@ -23,9 +23,11 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 class SimpleSocketIO:
     """简单的SocketIO模拟类，用于命令行模式"""
     
-    def __init__(self, request_id=None):
+    def __init__(self, request_id=None, ruleset=None):
         self.messages = []
         self.request_id = request_id or '-'
+        # 行为触发事件只携带行为索引，输出时附带完整的行为定义，供没有 /api/ruleset 的调用方渲染
+        self.ruleset = ruleset
     
     def emit(self, event, data):
         """模拟SocketIO的emit方法"""
@@ -34,8 +36,10 @@ class SimpleSocketIO:
             print(message)
             self.messages.append(message)
         elif event == 'behavior_triggered':
-            import json as _json
-            print("__BEHAVIOR__ " + _json.dumps(data, ensure_ascii=False))
+            behaviors = self.ruleset.config.get('behaviors', []) if self.ruleset else []
+            if 'behavior' not in data and 0 <= data.get('behaviorId', -1) < len(behaviors):
+                data = dict(data, behavior=behaviors[data['behaviorId']])
+            print("__BEHAVIOR__ " + json.dumps(data, ensure_ascii=False))
         elif event == 'es_search_progress':
             progress = data.get('progress', 0) * 100
             processed = data.get('processed', 0)
@@ -80,7 +84,7 @@ def main():
             return 1
         
         # 创建SocketIO模拟器
-        socketio = SimpleSocketIO(request_id=args.request_id)
+        socketio = SimpleSocketIO(request_id=args.request_id, ruleset=search_service.sessions.ruleset)
         
         if args.mode == 'cli':
             print(f"开始Elasticsearch搜索...")
@@ -90,7 +94,7 @@ def main():
             print(f"时间范围: {args.start_time} 至 {args.end_time}")
             print("-" * 50)
         
-        # 执行搜索
+        # 执行搜索并等待任务结束
         result = search_service.search_logs(
             index_name=args.index,
             user_key=args.user_key,
@@ -102,23 +106,27 @@ def main():
             query_template=args.query_template,
             log_param=args.log_param
         )
+        job = search_service.get(result['job_id'])
+        job.wait()
+        success = job.status == 'completed'
+        message = job.message or job.error or result['message']
         
         if args.mode == 'cli':
             print("-" * 50)
-            print(f"搜索结果: {result['message']}")
+            print(f"搜索结果: {message}")
         
         # 输出JSON结果
         if args.output == 'json':
             final_result = {
-                'success': result['success'],
-                'message': result['message'],
-                'total_hits': search_service.total_hits,
-                'processed': search_service.processed_count,
-                'search_status': search_service.get_search_status()
+                'success': success,
+                'message': message,
+                'total_hits': job.total_hits,
+                'processed': job.processed,
+                'search_status': job.to_dict()
             }
             print(json.dumps(final_result, ensure_ascii=False, indent=2))
         
-        return 0 if result['success'] else 1
+        return 0 if success else 1
         
     except Exception as e:
         error_result = {
@@ -3,102 +3,331 @@
 Elasticsearch搜索服务模块
 
 提供从Elasticsearch搜索日志并进行行为分析的功能
+
+行为分析使用与服务器相同的行为引擎：每次搜索创建一个 'es' 分析会话，
+绑定注册表当前的规则集（服务器中随 /config 更新），匹配、提取、验证、事件顺序和事件组检查与导入完全一致。
+搜索结果按 @timestamp 升序读取，每页作为一批交给会话分析；搜索完成后发送与导入相同的最终检查报告（final_check_results），
+不需要再把日志下载后通过 /import-log 重新导入。
+
+每次搜索是一个独立的任务（EsSearchJob）：有自己的任务ID、进度、取消标志和事件通道。
+任务在有上限的工作线程中运行，共享同一个 ES 客户端；超过上限的任务排队等待。
+在服务器中，任务的事件（原始日志、进度、行为触发和完成报告）只发送到任务的 Socket.IO 房间 es-search:<任务ID>。
+
+搜索结果经过查询结果缓存（EsQueryCache）：重复执行相同查询、只移动时间范围时，只从 ES 读取缓存中没有的时间段。
 """
 
 import json
 import logging
 import threading
 import time
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
-from flask_socketio import emit
 
 from ep_py.es_query_builder import ESQueryBuilder
 from ep_py.common import EsUtil
-import yaml
+from ep_py.es_cache import EsQueryCache
+from ep_py.analysis_session import AnalysisSessionRegistry
+from ep_py.behavior_engine import load_ruleset
 import os
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 默认同时运行的搜索任务数量
+DEFAULT_MAX_CONCURRENT = 2
+
+# 每页之后等待客户端接收积压日志的最长时间（秒），超时后继续读取，慢速客户端的原始日志由投递调度器丢弃
+CAPACITY_WAIT_TIMEOUT = 10
+
+
+class EsSearchJob:
+    """单个 Elasticsearch 搜索任务"""
+
+    def __init__(self, params, socketio, room=None):
+        """
+        参数:
+            params (dict): 搜索参数（index_name、user_key、user_value、start_time、end_time、platform、
+                           query_template、log_param）
+            socketio: 提供 emit(event, data[, to]) 的对象（服务器的投递调度器或命令行的输出模拟）
+            room (bool): 是否只向任务的房间发送事件（socketio 需要支持 emit 的 to 参数）
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.socketio = socketio
+        self.room = f'es-search:{self.id}' if room else None
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total_hits = 0
+        self.processed = 0
+        self.errors = 0         # 可能的错误行数（最终检查使用）
+        self.final_check = None  # 搜索完成后的最终检查结果
+        self.session_id = None  # 执行时使用的分析会话ID
+        self.message = None
+        self.error = None
+        self._cancel_event = threading.Event()
+        self._done = threading.Event()
+
+    def emit(self, event, data):
+        """发送任务事件（附带任务ID），有房间时只发送到房间"""
+        if isinstance(data, dict) and event != 'log':
+            data = dict(data, job_id=self.id)
+        if self.room:
+            self.socketio.emit(event, data, to=self.room)
+        else:
+            self.socketio.emit(event, data)
+
+    @property
+    def cancelled(self):
+        """是否已请求取消"""
+        return self._cancel_event.is_set()
+
+    @property
+    def active(self):
+        """任务正在运行且未被取消"""
+        return self.status == 'running' and not self._cancel_event.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """
+        获取任务进度
+
+        返回:
+            dict: 状态、已处理数量和总数
+        """
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'processed': self.processed,
+            'total': self.total_hits,
+            'progress': self.processed / self.total_hits if self.total_hits else (1.0 if self.finished_at else 0.0)
+        }
+
+    def to_dict(self):
+        """任务的完整状态"""
+        data = self.progress()
+        data.update({
+            'room': self.room,
+            'params': self.params,
+            'session': self.session_id,
+            'searching': self.status in ('queued', 'running'),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'message': self.message,
+            'error': self.error,
+            'errors': self.errors,
+            'final_check': self.final_check
+        })
+        return data
+
 
 class ElasticsearchSearchService:
     """Elasticsearch搜索服务类"""
     
-    def __init__(self, env='sandbox'):
+    def __init__(self, env='sandbox', sessions=None, max_concurrent=DEFAULT_MAX_CONCURRENT, max_finished=20):
         """
         初始化Elasticsearch搜索服务
         
         参数:
             env: 环境名称 (cn/sandbox/production)
+            sessions: 分析会话注册表（AnalysisSessionRegistry），提供共享的规则集；
+                      未提供时（命令行独立运行）从项目根目录的 config.yaml 加载规则集
+            max_concurrent: 同时运行的搜索任务数量上限
+            max_finished: 保留的已结束任务数量
         """
         try:
             self.es_util = EsUtil(env=env)
+            self.cache = EsQueryCache(self.es_util)
             self.query_builder = ESQueryBuilder('config/es_search_config.yaml')
-            # 加载行为配置
-            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            config_yaml = os.path.join(project_root, 'config.yaml')
-            self.behavior_config = {'behaviors': []}
-            if os.path.exists(config_yaml):
-                with open(config_yaml, 'r', encoding='utf-8') as f:
-                    self.behavior_config = yaml.safe_load(f) or {'behaviors': []}
-            self.search_active = False
-            self.search_progress = 0
-            self.processed_count = 0
-            self.total_hits = 0
-            self.current_thread = None
+            if sessions is None:
+                project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+                config_yaml = os.path.join(project_root, 'config.yaml')
+                sessions = AnalysisSessionRegistry(None, load_ruleset(config_yaml) if os.path.exists(config_yaml) else None)
+            self.sessions = sessions
+            self.max_concurrent = max(1, int(max_concurrent))
+            self.windows = 1  # 大于 1 时每个搜索的时间范围拆分为多个时间窗口并行读取
+            self.max_finished = max_finished
+            self._jobs = OrderedDict()
+            self._queue = deque()
+            self._running = 0
+            self._lock = threading.Lock()
             self.env = env
             logging.info(f"Elasticsearch搜索服务初始化完成，环境: {env}")
         except Exception as e:
             logging.error(f"Elasticsearch搜索服务初始化失败: {e}")
             raise
     
-    def search_logs(self, index_name, user_key, user_value, start_time, end_time, platform, socketio, query_template=None, log_param=None):
+    def configure(self, settings=None):
         """
-        执行Elasticsearch日志搜索
+        更新并发上限、时间窗口数和查询结果缓存配置（globalSettings.esSearch 配置），立即调度排队中的任务
+        
+        参数:
+            settings (dict, optional): {'maxConcurrent': int, 'windows': int, 'cache': dict}
+        """
+        settings = settings or {}
+        self.cache.configure(settings.get('cache'))
+        self.windows = max(1, int(settings.get('windows', self.windows)))
+        with self._lock:
+            self.max_concurrent = max(1, int(settings.get('maxConcurrent', self.max_concurrent)))
+        self._dispatch()
+    
+    def create_job(self, index_name, user_key, user_value, start_time, end_time, platform, socketio, query_template=None, log_param=None, room=False):
+        """
+        创建搜索任务（不启动），调用方可以先让客户端加入任务的房间，再通过 start_job 启动
         
         参数:
             index_name: Elasticsearch索引名称
-            user_id: 用户ID
+            user_key: 属性键（如 userId）
+            user_value: 属性值，/.../ 或包含正则字符时按正则匹配
             start_time: 开始时间 (ISO格式)
             end_time: 结束时间 (ISO格式)
             platform: 平台类型
             socketio: SocketIO实例用于实时通信
+            query_template: 查询模板，优先于默认模板
+            log_param: 日志匹配参数，用于内容搜索
+            room: 是否只向任务的房间发送事件
             
         返回:
-            dict: 搜索结果状态
+            EsSearchJob: 新任务
         """
-        if self.search_active:
-            return {
-                'success': False,
-                'message': '已有搜索任务正在进行中'
-            }
-        
-        # 启动搜索线程
-        self.current_thread = threading.Thread(
-            target=self._search_thread,
-            args=(index_name, user_key, user_value, start_time, end_time, platform, socketio, query_template, log_param)
-        )
-        self.current_thread.start()
+        params = {
+            'index_name': index_name,
+            'user_key': user_key,
+            'user_value': user_value,
+            'start_time': start_time,
+            'end_time': end_time,
+            'platform': platform,
+            'query_template': query_template,
+            'log_param': log_param
+        }
+        return EsSearchJob(params, socketio, room)
+    
+    def start_job(self, job):
+        """登记任务并在并发上限内启动，超过上限时排队"""
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._prune()
+            queued = self._running >= self.max_concurrent
+        if queued:
+            job.emit('es_search_progress', job.progress())
+        self._dispatch()
+        return job
+    
+    def search_logs(self, index_name, user_key, user_value, start_time, end_time, platform, socketio, query_template=None, log_param=None):
+        """
+        执行Elasticsearch日志搜索（创建并启动任务，事件发送给所有客户端）
         
+        参数见 create_job
+            
+        返回:
+            dict: 搜索结果状态，包含任务ID
+        """
+        job = self.start_job(self.create_job(index_name, user_key, user_value, start_time, end_time, platform, socketio,
+                                             query_template, log_param))
         return {
             'success': True,
-            'message': '搜索任务已启动'
+            'message': '搜索任务已启动',
+            'job_id': job.id
         }
     
-    def _search_thread(self, index_name, user_key, user_value, start_time, end_time, platform, socketio, query_template=None, log_param=None):
+    def get(self, job_id):
+        """获取任务，不存在时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def list(self):
+        """所有任务的状态，按提交顺序排列"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs]
+    
+    def cancel(self, job_id):
+        """
+        取消搜索任务：排队中的任务不再执行，运行中的任务在处理完当前文档后停止并清除 scroll 上下文
+        
+        返回:
+            bool: 任务存在且尚未结束
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ('queued', 'running'):
+                return False
+            job._cancel_event.set()
+            if job in self._queue:
+                self._queue.remove(job)
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                job._done.set()
+            else:
+                return True
+        job.emit('es_search_complete', {'success': False, 'message': '搜索已取消'})
+        return True
+    
+    def stop_search(self, job_id, timeout=5):
+        """停止搜索任务并等待其结束，返回任务是否存在且尚未结束"""
+        if not self.cancel(job_id):
+            return False
+        job = self.get(job_id)
+        if job is not None:
+            job.wait(timeout)
+        logging.info(f"Elasticsearch搜索任务 {job_id} 已停止")
+        return True
+    
+    def get_search_status(self, job_id):
+        """获取搜索任务的状态，任务不存在时返回 None"""
+        job = self.get(job_id)
+        return job.to_dict() if job else None
+    
+    def _prune(self):
+        """只保留最近 max_finished 个已结束的任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ('queued', 'running')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+    
+    def _dispatch(self):
+        """在并发上限内启动排队中的任务"""
+        while True:
+            with self._lock:
+                if self._running >= self.max_concurrent or not self._queue:
+                    return
+                job = self._queue.popleft()
+                job.status = 'running'
+                job.started_at = time.time()
+                self._running += 1
+            threading.Thread(target=self._run, args=(job,), name=f'es-search-{job.id}', daemon=True).start()
+    
+    def _run(self, job):
+        try:
+            self._search_thread(job)
+        finally:
+            with self._lock:
+                self._running -= 1
+            job._done.set()
+            self._dispatch()
+    
+    def _search_thread(self, job):
         """
         搜索执行线程
         """
-        self.search_active = True
-        self.search_progress = 0
-        self.processed_count = 0
+        params = job.params
+        index_name, user_key, user_value = params['index_name'], params['user_key'], params['user_value']
+        start_time, end_time, platform = params['start_time'], params['end_time'], params['platform']
+        query_template, log_param = params['query_template'], params['log_param']
+        session = None
         
         try:
-            logging.info(f"开始Elasticsearch搜索: index={index_name}, {user_key}={user_value}")
+            logging.info(f"开始Elasticsearch搜索: 任务={job.id}, index={index_name}, {user_key}={user_value}")
             
             # 发送开始搜索消息
-            socketio.emit('log', {
+            job.emit('log', {
                 'platform': 'system',
-                'message': f'开始Elasticsearch搜索: 索引={index_name}, {user_key}={user_value}, 时间范围={start_time} 至 {end_time}, 环境={self.env}'
+                'message': f'开始Elasticsearch搜索 (任务 {job.id}): 索引={index_name}, {user_key}={user_value}, 时间范围={start_time} 至 {end_time}, 环境={self.env}'
             })
             
             # 构建查询参数
@@ -137,129 +366,167 @@ class ElasticsearchSearchService:
                     "must_not": []
                 }
             }
-            try:
-                import json as _json
-                extra = socketio and True
-            except Exception:
-                extra = False
             
-            # 构建查询
+            # 构建查询；事件顺序和事件组检查依赖日志顺序，按时间升序读取
             query = self.query_builder.build_query(runtime_params=runtime_params, template_override=query_template or template_override)
+            query.setdefault('sort', [{'@timestamp': {'order': 'asc'}}])
             logging.info(f"构建的查询: {json.dumps(query, indent=2, ensure_ascii=False)}")
-            socketio.emit('log', {
+            job.emit('log', {
                 'platform': 'system',
                 'message': 'ES搜索查询配置:\n' + json.dumps(query, indent=2, ensure_ascii=False)
             })
             
             # 执行搜索
-            socketio.emit('log', {
+            job.emit('log', {
                 'platform': 'system',
                 'message': f'正在执行Elasticsearch查询: 使用索引={index_name}'
             })
             
-            results = self.es_util.search(query, index_name)
+            # 本次搜索的分析会话，绑定搜索开始时的规则集
+            session = self.sessions.create('es', platform, emit=job.emit)
+            job.session_id = session.id
             
-            if not results:
-                socketio.emit('log', {
+            def on_total(total):
+                job.total_hits = total
+                logging.info(f"搜索任务 {job.id} 命中 {total} 条记录")
+                job.emit('log', {
                     'platform': 'system',
-                    'message': '未找到匹配的日志数据'
+                    'message': f'搜索命中 {total} 条记录，逐页读取并进行行为分析...'
+                })
+            
+            def on_plan(plan):
+                if plan['cached'] or plan['shared']:
+                    job.emit('log', {
+                        'platform': 'system',
+                        'message': f"使用查询缓存: {plan['cached']} 个时间段从缓存读取，{plan['shared']} 个时间段与其他搜索共享，"
+                                   f"{plan['fetched']} 个时间段从ES读取"
+                    })
+            
+            # 每页结果读取后立即分析，内存占用以页大小为上限，第一页返回即可看到结果；
+            # 已缓存的时间段从磁盘读取，只有缺失的时间段访问ES
+            self.cache.search(
+                query,
+                index_name,
+                process_batch=lambda hits: self._process_hits(hits, job, session),
+                on_total=on_total,
+                on_plan=on_plan,
+                windows=self.windows
+            )
+            
+            if job.cancelled:
+                job.status = 'cancelled'
+                job.message = f'搜索已停止，处理了 {job.processed} 条日志'
+                job.emit('log', {
+                    'platform': 'system',
+                    'message': '搜索已停止'
+                })
+                job.emit('es_search_complete', {
+                    'success': False,
+                    'session': session.id,
+                    'total_hits': job.total_hits,
+                    'processed': job.processed,
+                    'message': job.message
                 })
                 return
             
-            self.total_hits = len(results)
-            logging.info(f"搜索完成，共找到 {self.total_hits} 条记录")
+            job.status = 'completed'
+            if not job.processed:
+                job.message = '未找到匹配的日志数据'
+            else:
+                job.message = f'搜索完成，处理了 {job.processed} 条日志'
             
-            socketio.emit('log', {
+            # 搜索完成
+            job.emit('log', {
                 'platform': 'system',
-                'message': f'搜索完成，共找到 {self.total_hits} 条记录，开始行为分析...'
+                'message': f'Elasticsearch搜索和行为分析完成，共处理 {job.processed} 条日志' if job.processed else job.message
             })
             
-            # 处理结果
-            for i, hit in enumerate(results):
-                if not self.search_active:
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': '搜索已停止'
-                    })
-                    break
-                
-                try:
-                    # 提取日志数据
-                    log_data = self._extract_log_data(hit)
-                    
-                    # 发送原始日志到前端
-                    socketio.emit('log', {
-                        'platform': 'elasticsearch',
-                        'message': f"[{log_data['timestamp']}] {log_data['level']} {log_data['module']} - {log_data['message']}"
-                    })
-                    
-                    # 应用行为分析
-                    self._analyze_log_with_behavior(log_data, platform, socketio)
-                    
-                    # 更新进度
-                    self.processed_count += 1
-                    self.search_progress = self.processed_count / self.total_hits
-                    
-                    # 每处理10条发送一次进度更新
-                    if self.processed_count % 10 == 0:
-                        socketio.emit('es_search_progress', {
-                            'processed': self.processed_count,
-                            'total': self.total_hits,
-                            'progress': self.search_progress
-                        })
-                    
-                    # 添加小延迟避免过载
-                    time.sleep(0.01)
-                    
-                except Exception as e:
-                    logging.error(f"处理日志数据失败: {e}")
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'处理日志数据失败: {str(e)}'
-                    })
-            
-            # 搜索完成
-            socketio.emit('log', {
+            # 与导入相同的最终检查：必要事件、错误行、事件顺序和事件组完整性
+            job.final_check = session.report_final_check(job.errors)
+            job.emit('log', {
                 'platform': 'system',
-                'message': f'Elasticsearch搜索和行为分析完成，共处理 {self.processed_count} 条日志'
+                'message': f'最终检查结果: {job.final_check["message"]}'
             })
             
-            socketio.emit('es_search_complete', {
+            job.emit('es_search_complete', {
                 'success': True,
-                'total_hits': self.total_hits,
-                'processed': self.processed_count,
-                'message': f'搜索完成，处理了 {self.processed_count} 条日志'
+                'session': session.id,
+                'total_hits': job.total_hits,
+                'processed': job.processed,
+                'errors': job.errors,
+                'final_check': job.final_check,
+                'message': job.message
             })
             
         except Exception as e:
             logging.error(f"Elasticsearch搜索失败: {e}")
-            socketio.emit('log', {
+            job.status = 'failed'
+            job.error = str(e)
+            job.emit('log', {
                 'platform': 'system',
                 'message': f'Elasticsearch搜索失败: {str(e)}'
             })
-            socketio.emit('es_search_complete', {
+            job.emit('es_search_complete', {
                 'success': False,
                 'message': f'搜索失败: {str(e)}'
             })
         finally:
-            self.search_active = False
-            self.search_progress = 0
-    
-    def stop_search(self):
-        """停止搜索"""
-        self.search_active = False
-        if self.current_thread and self.current_thread.is_alive():
-            self.current_thread.join(timeout=5)
-        logging.info("Elasticsearch搜索已停止")
+            if session is not None:
+                self.sessions.finish(session)
+            job.finished_at = time.time()
     
-    def get_search_status(self):
-        """获取搜索状态"""
-        return {
-            'searching': self.search_active,
-            'progress': self.search_progress,
-            'processed': self.processed_count,
-            'total': self.total_hits
-        }
+    def _process_hits(self, hits, job, session):
+        """
+        发送并分析一页搜索结果
+        
+        原始日志逐行发送（服务器的投递调度器按批次合并发送），整页按顺序作为一批交给分析会话，每页之后报告一次进度。
+        socketio 提供 wait_for_capacity 时（服务器的投递调度器）等待客户端接收完积压的日志再读取下一页，
+        读取速度由客户端的实际接收速度决定（任务有房间时只等待房间中的客户端，任务之间互不影响）；最多等待 CAPACITY_WAIT_TIMEOUT 秒，停滞的客户端不会让搜索一直停住，
+        超时后继续读取，该客户端队列超过上限的原始日志被丢弃（分析事件不受影响）。
+        
+        参数:
+            hits: 一页命中文档
+            job: 搜索任务
+            session: 本次搜索的分析会话
+        
+        返回:
+            bool: 是否继续读取下一页（任务已取消时返回 False）
+        """
+        lines = []
+        for hit in hits:
+            if job.cancelled:
+                break
+            
+            try:
+                # 提取日志数据
+                log_data = self._extract_log_data(hit)
+                
+                # 发送原始日志到前端
+                job.emit('log', {
+                    'platform': 'elasticsearch',
+                    'message': f"[{log_data['timestamp']}] {log_data['level']} {log_data['module']} - {log_data['message']}"
+                })
+                
+                lines.append(self._format_log_for_analysis(log_data))
+            except Exception as e:
+                logging.error(f"处理日志数据失败: {e}")
+                job.emit('log', {
+                    'platform': 'system',
+                    'message': f'处理日志数据失败: {str(e)}'
+                })
+        
+        # 应用行为分析
+        job.errors += self._analyze_logs_with_behavior(lines, session, job)
+        job.processed += len(lines)
+        
+        # 更新进度
+        job.emit('es_search_progress', job.progress())
+        
+        wait_for_capacity = getattr(job.socketio, 'wait_for_capacity', None)
+        if wait_for_capacity and not wait_for_capacity(timeout=CAPACITY_WAIT_TIMEOUT, active=lambda: job.active,
+                                                     room=job.room) and job.active:
+            logging.warning(f"搜索任务 {job.id} 等待客户端接收日志超时，继续读取")
+        return job.active
     
     def _extract_log_data(self, hit):
         """
@@ -294,31 +561,27 @@ class ElasticsearchSearchService:
             'raw_data': json.dumps(source, ensure_ascii=False)
         }
     
-    def _analyze_log_with_behavior(self, log_data, platform, socketio):
+    def _analyze_logs_with_behavior(self, lines, session, job):
         """
-        使用现有行为分析逻辑处理日志
+        使用共享的行为引擎按顺序分析一批日志（匹配、提取、JSON Schema 验证、事件顺序和事件组）
         
         参数:
-            log_data: 日志数据
-            platform: 平台类型
-            socketio: SocketIO实例
+            lines: 格式化后的日志行（见 _format_log_for_analysis）
+            session: 本次搜索的分析会话
+            job: 搜索任务（事件发送对象）
+        
+        返回:
+            int: 可能的错误行数
         """
         try:
-            # 将日志数据格式化为现有分析函数所需的格式
-            formatted_log = self._format_log_for_analysis(log_data)
-            
-            # 这里可以调用现有的analyze_log_behavior函数
-            # 但由于该函数在server.py中，我们需要将分析逻辑提取出来或在这里重新实现
-            
-            # 简化版的行为分析 - 可以扩展为调用完整的分析逻辑
-            self._perform_basic_analysis(formatted_log, platform, socketio)
-            
+            return session.analyze_batch(lines)
         except Exception as e:
             logging.error(f"行为分析失败: {e}")
-            socketio.emit('log', {
+            job.emit('log', {
                 'platform': 'system',
                 'message': f'行为分析失败: {str(e)}'
             })
+            return 0
     
     def _format_log_for_analysis(self, log_data):
         """
@@ -345,35 +608,18 @@ class ElasticsearchSearchService:
             formatted_log += f" {props_str}"
         
         return formatted_log
-    
-    def _perform_basic_analysis(self, formatted_log, platform, socketio):
-        behaviors = self.behavior_config.get('behaviors', [])
-        import re
-        for behavior in behaviors:
-            pattern = behavior.get('pattern')
-            if not pattern:
-                continue
-            try:
-                if re.search(pattern, formatted_log, re.I):
-                    socketio.emit('behavior_triggered', {
-                        'behavior': behavior,
-                        'log': formatted_log,
-                        'validationResults': None
-                    })
-            except re.error:
-                continue
 
 
 # 全局搜索服务实例
 es_search_service = None
 
 
-def get_es_search_service(env='sandbox'):
-    """获取Elasticsearch搜索服务实例"""
+def get_es_search_service(env='sandbox', sessions=None):
+    """获取Elasticsearch搜索服务实例（sessions 为服务器的分析会话注册表，见 ElasticsearchSearchService）"""
     global es_search_service
     if es_search_service is None:
         try:
-            es_search_service = ElasticsearchSearchService(env=env)
+            es_search_service = ElasticsearchSearchService(env=env, sessions=sessions)
         except Exception as e:
             logging.error(f"创建Elasticsearch搜索服务失败: {e}")
             return None
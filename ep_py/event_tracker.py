@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+事件追踪模块
+
+行为分析的有状态部分：事件顺序检查、事件组检查和最终检查。
+命中结果必须按日志原始顺序逐个交给 EventTracker.track 处理。
+
+最终检查需要的统计（错误行数、必要事件是否出现、顺序违规、事件组完成情况）都在处理过程中增量维护，
+final_check 可以随时调用且不需要保留日志行，耗时只与问题数量有关。
+
+本模块不依赖 Flask 或 Socket.IO，需要发送给客户端的事件以 (事件名, 数据) 列表的形式返回，
+由调用方决定如何投递（服务器通过 Socket.IO 发送，离线分析器写入报告）。
+"""
+
+# 会话保留的已触发事件序列长度上限：更早的事件只计入 order_base，长时间运行的会话内存不再增长
+ORDER_HISTORY = 1000
+# 单个 event_order_violation 携带的增量上限，超出时只发送末尾部分并要求客户端重新同步
+ORDER_DELTA_LIMIT = 200
+
+
+def is_error_line(line):
+    """判断日志行是否包含可能的错误（最终检查的错误统计规则）"""
+    return '[ERROR]' in line or 'Exception' in line or 'Error:' in line
+
+
+def _short_names(events):
+    """用组内前两个事件的名称生成分组名称"""
+    name = ", ".join([event[:10] + "..." if len(event) > 10 else event for event in events[:2]])
+    if len(events) > 2:
+        name += f" 等{len(events)}个事件"
+    return name
+
+
+def parse_event_order(raw):
+    """
+    解析 event_order 配置，支持分组
+
+    参数:
+        raw (list): 配置中的 event_order，元素为事件名（单独成组）或事件名列表（一个分组）
+
+    返回:
+        tuple: (分组列表（二维数组）, 扁平事件列表)
+    """
+    groups = []
+    flat = []
+    if raw and isinstance(raw, list):
+        for item in raw:
+            if isinstance(item, list):
+                # 这是一个分组，同时将分组中的事件添加到扁平列表中
+                groups.append(item)
+                flat.extend(item)
+            else:
+                # 单个事件，同时创建一个只包含这个事件的分组
+                flat.append(item)
+                groups.append([item])
+    return groups, flat
+
+
+def parse_event_groups(raw):
+    """
+    解析 event_group 配置
+
+    参数:
+        raw (list): 配置中的 event_group，元素为 {'name', 'events'} 或事件名列表（旧格式）
+
+    返回:
+        dict: 事件组状态 {group_id: {'events', 'triggered', 'completed', 'name'}}
+    """
+    status = {}
+    if raw and isinstance(raw, list):
+        for i, group in enumerate(raw):
+            if isinstance(group, dict) and 'events' in group:
+                events = group['events']
+                # 使用配置中的名称，如果没有则用组内事件名称生成
+                group_name = group['name'] if group.get('name') else "事件组: " + _short_names(events)
+            elif isinstance(group, list):
+                events = group
+                group_name = "事件组: " + _short_names(events)
+            else:
+                continue
+            status[f'group_{i}'] = {
+                'events': events,
+                'triggered': [],
+                'completed': False,
+                'name': group_name
+            }
+    return status
+
+
+class EventTracker:
+    """按日志顺序追踪事件顺序和事件组状态"""
+
+    def __init__(self, config=None, ruleset_version=None):
+        """
+        参数:
+            config (dict, optional): 行为配置（behaviors、event_order、event_group）
+            ruleset_version (str, optional): 规则集版本，包含在顺序违规事件中
+        """
+        self.triggered_events = []   # 最近触发的事件（只包含 event_order 中的事件，最多保留约 2 * ORDER_HISTORY 个）
+        self.order_base = 0          # triggered_events[0] 在完整触发序列中的位置（已丢弃的事件数）
+        self.order_sent_offset = 0   # 已通过 event_order_violation 发送到的完整触发序列位置
+        self._order_resync = False   # 序列被重新编号后，下一次违规事件要求客户端重新同步
+        self.seen_events = set()     # 已触发过的所有行为名称（用于必要事件检查）
+        self.line_count = 0          # 已分析的日志行数
+        self.error_count = 0         # 可能的错误行数
+        self.configure(config, ruleset_version)
+
+    def configure(self, config, ruleset_version=None):
+        """
+        应用新的规则集并迁移已有状态
+
+        已触发的事件和事件组进度只保留新配置中仍然存在的行为，
+        事件顺序统计按新分组重放已触发的事件重建，热更新配置不会丢失会话进度。
+
+        返回:
+            list: 迁移后新完成的事件组通知 [(事件名, 数据), ...]
+        """
+        config = config or {}
+        previous_completed = {
+            tuple(group_info['events']) for group_info in getattr(self, 'group_status', {}).values()
+            if group_info['completed']
+        }
+        behavior_names = {behavior.get('name') for behavior in config.get('behaviors', []) if behavior.get('name')}
+        self.seen_events &= behavior_names
+        triggered_events = [event for event in self.triggered_events if event in behavior_names]
+        if len(triggered_events) != len(self.triggered_events):
+            # 序列有删减时重新编号，下一次违规事件要求客户端从 /api/event-order 重新同步
+            self.triggered_events = triggered_events
+            self.order_base = 0
+            self.order_sent_offset = 0
+            self._order_resync = True
+
+        self.ruleset_version = ruleset_version
+        self.order_groups, self.order_events = parse_event_order(config.get('event_order', []))
+        self.group_status = parse_event_groups(config.get('event_group', []))
+        self.required_events = [
+            behavior.get('name') for behavior in config.get('behaviors', [])
+            if behavior.get('required', False) and behavior.get('name')
+        ]
+        # 查找表：事件所在的顺序分组、事件在分组中的位置（与 list.index 一致取第一次出现）、事件所属的事件组
+        self._order_event_set = set(self.order_events)
+        self._order_groups_by_event = {}
+        self._order_positions = []
+        for i, group in enumerate(self.order_groups):
+            positions = {}
+            for position, event in enumerate(group):
+                positions.setdefault(event, position)
+            self._order_positions.append(positions)
+            for event in positions:
+                self._order_groups_by_event.setdefault(event, []).append(i)
+        self._groups_by_event = {}
+        self._group_sizes = {}
+        for group_id, group_info in self.group_status.items():
+            self._group_sizes[group_id] = len(set(group_info['events']))
+            for event in set(group_info['events']):
+                self._groups_by_event.setdefault(event, []).append(group_id)
+        # 已触发的事件在新的分组下重新计算顺序统计
+        self._rebuild_order_state()
+
+        # 事件组进度由已触发过的行为恢复（事件组的 triggered 与 seen_events 中的组内事件一致）
+        events_out = []
+        for group_id, group_info in self.group_status.items():
+            group_info['triggered'] = [event for event in dict.fromkeys(group_info['events']) if event in self.seen_events]
+            if self._group_sizes[group_id] and len(group_info['triggered']) == self._group_sizes[group_id]:
+                group_info['completed'] = True
+                if tuple(group_info['events']) not in previous_completed:
+                    events_out.extend(self._group_completed_notices(group_id))
+        return events_out
+
+    def _rebuild_order_state(self):
+        """
+        根据 triggered_events 重建每个顺序分组的增量统计
+
+        分组内已触发的事件由 seen_events 恢复，不受序列保留上限影响；
+        最后触发的事件和顺序违规只能由保留的 triggered_events 重放，
+        早于 order_base 的违规在热更新配置后不再出现在最终检查中。
+        """
+        self._order_triggered = [set() for _ in self.order_groups]   # 分组内已触发的事件
+        self._order_last = [None] * len(self.order_groups)            # 分组内最后触发的事件
+        self._order_violations = [[] for _ in self.order_groups]      # 分组内的事件顺序违规（最终检查）
+        for event in self.triggered_events:
+            self._update_order_state(event)
+        for i, positions in enumerate(self._order_positions):
+            self._order_triggered[i].update(event for event in positions if event in self.seen_events)
+
+    def _update_order_state(self, event):
+        """记录一次分组内的事件触发，与分组内上一个事件比较顺序"""
+        for i in self._order_groups_by_event.get(event, ()):
+            positions = self._order_positions[i]
+            last_event = self._order_last[i]
+            if last_event is not None and positions[last_event] > positions[event]:
+                self._order_violations[i].append({
+                    'group': i,
+                    'events': [last_event, event],
+                    'message': f'事件 "{event}" 应该在 "{last_event}" 之前触发'
+                })
+            self._order_last[i] = event
+            self._order_triggered[i].add(event)
+
+    def reset(self):
+        """清空已触发的事件列表、所有事件组状态和最终检查统计"""
+        self.triggered_events = []
+        self.order_base = 0
+        self.order_sent_offset = 0
+        self._order_resync = False
+        self.seen_events = set()
+        self.line_count = 0
+        self.error_count = 0
+        for group_info in self.group_status.values():
+            group_info['triggered'] = []
+            group_info['completed'] = False
+        self._rebuild_order_state()
+
+    @property
+    def triggered_count(self):
+        """完整触发序列的长度（包括已丢弃的事件）"""
+        return self.order_base + len(self.triggered_events)
+
+    def observe_line(self, line):
+        """
+        统计一行已分析的日志
+
+        返回:
+            bool: 是否为可能的错误行
+        """
+        self.line_count += 1
+        if is_error_line(line):
+            self.error_count += 1
+            return True
+        return False
+
+    def track(self, behavior_name):
+        """
+        处理一次行为命中
+
+        参数:
+            behavior_name (str): 命中的行为名称
+
+        返回:
+            list: 需要发送的事件 [(事件名, 数据), ...]，按发送顺序排列
+        """
+        events_out = []
+        if not behavior_name:
+            return events_out
+
+        self.seen_events.add(behavior_name)
+        if behavior_name in self._order_event_set:
+            # 找出当前事件所在的分组，只在分组内检查前面的事件是否都已触发
+            violation = None
+            for i in self._order_groups_by_event[behavior_name]:
+                group = self.order_groups[i]
+                group_triggered_events = self._order_triggered[i]
+                for expected_event in group[:self._order_positions[i][behavior_name]]:
+                    if expected_event not in group_triggered_events:
+                        violation = {
+                            'current_event': behavior_name,
+                            'missing_event': expected_event,
+                            'message': f'事件 "{behavior_name}" 在 "{expected_event}" 之前触发，违反了预期顺序',
+                            'group': group
+                        }
+                        break
+                if violation:
+                    break
+
+            # 将当前事件添加到已触发事件列表（用于事件顺序检查）
+            self.triggered_events.append(behavior_name)
+            self._update_order_state(behavior_name)
+            if len(self.triggered_events) > 2 * ORDER_HISTORY:
+                # 成批丢弃最早的事件，均摊后每次触发只需常数时间
+                dropped = len(self.triggered_events) - ORDER_HISTORY
+                del self.triggered_events[:dropped]
+                self.order_base += dropped
+
+            if violation:
+                violation_group = violation['group']
+                group_index = -1
+                for i, group in enumerate(self.order_groups):
+                    if group == violation_group:
+                        group_index = i
+                        break
+                group_name = "顺序组: " + _short_names(violation_group)
+
+                # 只发送自上次违规事件以来新增的已触发事件（增量，最多 ORDER_DELTA_LIMIT 个），
+                # 分组定义由客户端从对应版本的规则集中获取。
+                # 增量被截断时起始位置超过客户端已有的序列长度，客户端会从 /api/event-order 重新同步
+                order_offset = max(self.order_sent_offset, self.triggered_count - ORDER_DELTA_LIMIT)
+                order_delta = self.triggered_events[order_offset - self.order_base:]
+                events_out.append(('event_order_violation', {
+                    'violation': {
+                        'current_event': violation['current_event'],
+                        'missing_event': violation['missing_event'],
+                        'message': violation['message']
+                    },
+                    'rulesetVersion': self.ruleset_version,
+                    'order_offset': order_offset,  # order_delta 在完整触发序列中的起始位置
+                    'order_delta': order_delta,
+                    'order_resync': self._order_resync or order_offset > self.order_sent_offset,
+                    'group_name': group_name,
+                    'group_index': group_index
+                }))
+                self.order_sent_offset = self.triggered_count
+                self._order_resync = False
+                events_out.append(('log', {
+                    'platform': 'system',
+                    'message': f'事件顺序违规: {violation["message"]} (在{group_name})'
+                }))
+
+        # 检查当前事件所属的未完成事件组
+        for group_id in self._groups_by_event.get(behavior_name, ()):
+            group_info = self.group_status[group_id]
+            triggered = group_info['triggered']
+            if group_info['completed']:
+                continue
+            if behavior_name not in triggered:
+                triggered.append(behavior_name)
+                if len(triggered) == self._group_sizes[group_id]:
+                    group_info['completed'] = True
+                    events_out.extend(self._group_completed_notices(group_id))
+        return events_out
+
+    def _group_completed_notices(self, group_id):
+        """生成事件组完成的通知 [(事件名, 数据), ...]"""
+        group_info = self.group_status[group_id]
+        events = group_info['events']
+        group_name = group_info.get('name', f'事件组 {group_id}')
+        return [
+            ('event_group_completed', {
+                'group_id': group_id,
+                'group_name': group_name,
+                'events': events,
+                'message': f'{group_name} 已完成，所有事件均已触发'
+            }),
+            ('log', {
+                'platform': 'system',
+                'message': f'事件组完成: {group_name} 中的所有事件 ({", ".join(events)}) 均已触发'
+            })
+        ]
+
+    def incomplete_group_notices(self):
+        """
+        生成所有未完成事件组的通知（停止日志收集时发送）
+
+        返回:
+            list: [(事件名, 数据), ...]
+        """
+        events_out = []
+        for group_id, group_info in self.group_status.items():
+            if group_info['completed']:
+                continue
+            events = group_info['events']
+            triggered = group_info['triggered']
+            missing_events = [event for event in events if event not in triggered]
+            group_name = group_info.get('name', f'事件组 {group_id}')
+            message = f'{group_name} 未完成，缺少事件: {", ".join(missing_events)}'
+            events_out.append(('event_group_incomplete', {
+                'group_id': group_id,
+                'group_name': group_name,
+                'events': events,
+                'triggered': triggered,
+                'missing_events': missing_events,
+                'message': message
+            }))
+            events_out.append(('log', {'platform': 'system', 'message': message}))
+        return events_out
+
+    def final_check(self, error_count=None):
+        """
+        最终检查
+
+        检查以下内容：
+        1. 必要的事件是否都已触发
+        2. 是否存在可能的错误
+        3. 事件顺序是否符合预期
+        4. 事件组是否完整
+
+        所有统计都已在处理过程中增量维护，可以随时调用，不需要重新扫描日志或已触发的事件。
+
+        参数:
+            error_count (int, optional): 可能的错误行数，默认使用 observe_line 统计的数量
+
+        返回:
+            dict: 检查结果 {'status': 'success'|'warning', 'message': str, 'details': list}
+        """
+        if error_count is None:
+            error_count = self.error_count
+        results = {
+            'status': 'success',
+            'message': '最终检查通过，未发现问题',
+            'details': []
+        }
+
+        def add_problem(message, append):
+            if results['status'] == 'success':
+                results['status'] = 'warning'
+                results['message'] = message
+            else:
+                results['message'] += append
+
+        # 检查必要事件是否都已触发
+        missing_events = [event for event in self.required_events if event not in self.seen_events]
+        if missing_events:
+            add_problem(f'缺少必要事件: {", ".join(missing_events)}', '')
+            results['details'].append({'type': 'missing_required_events', 'events': missing_events})
+
+        # 检查是否存在可能的错误
+        if error_count > 0:
+            add_problem(f'发现 {error_count} 个可能的错误', f'，并且发现 {error_count} 个可能的错误')
+            results['details'].append({'type': 'error_logs', 'count': error_count})
+
+        # 检查事件顺序违规（按分组排列）
+        order_violations = [violation for violations in self._order_violations for violation in violations]
+        if order_violations:
+            add_problem(f'发现 {len(order_violations)} 个事件顺序违规',
+                        f'，并且发现 {len(order_violations)} 个事件顺序违规')
+            results['details'].append({'type': 'order_violations', 'violations': order_violations})
+
+        # 检查事件组完整性（只报告已部分触发的组）
+        incomplete_groups = []
+        for group_id, group_info in self.group_status.items():
+            if not group_info['completed'] and len(group_info['triggered']) > 0:
+                incomplete_groups.append({
+                    'group_id': group_id,
+                    'group_name': group_info.get('name', f'事件组 {group_id}'),
+                    'missing': [event for event in group_info['events'] if event not in group_info['triggered']],
+                    'triggered': list(group_info['triggered'])
+                })
+        if incomplete_groups:
+            add_problem(f'发现 {len(incomplete_groups)} 个不完整的事件组',
+                        f'，并且发现 {len(incomplete_groups)} 个不完整的事件组')
+            results['details'].append({'type': 'incomplete_groups', 'groups': incomplete_groups})
+
+        return results
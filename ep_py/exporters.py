@@ -4,13 +4,14 @@ import abc
 import csv
 import json
 import logging
+import os
 
 class BaseExporter(abc.ABC):
     """Exporter的抽象基类，定义了所有具体Exporter必须实现的接口。"""
 
     file_extension = ''
 
-    def __init__(self, file_path, fields):
+    def __init__(self, file_path, fields, append=False):
         self.file_path = file_path
         if isinstance(fields[0], dict):
             self.fields = [field['name'] for field in fields]
@@ -21,7 +22,8 @@ class BaseExporter(abc.ABC):
         self._file = None
         self._writer = None
         if self.file_path:
-            self._file = open(self.file_path, 'w', encoding='utf-8', newline='')
+            # 继续中断的导出时追加到已有文件
+            self._file = open(self.file_path, 'a' if append else 'w', encoding='utf-8', newline='')
 
     @abc.abstractmethod
     def write_header(self):
@@ -38,6 +40,12 @@ class BaseExporter(abc.ABC):
         for record in records:
             self.write_row(record)
 
+    def flush(self):
+        """将已写入的数据刷新到磁盘。"""
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
     def close(self):
         """关闭文件。"""
         if self._file:
@@ -48,8 +56,8 @@ class CsvExporter(BaseExporter):
 
     file_extension = 'csv'
 
-    def __init__(self, file_path, fields):
-        super().__init__(file_path, fields)
+    def __init__(self, file_path, fields, append=False):
+        super().__init__(file_path, fields, append)
         if self._file:
             self._writer = csv.DictWriter(self._file, fieldnames=self.fields)
 
@@ -90,8 +98,8 @@ class JsonlExporter(BaseExporter):
             self.write_row(record)
 
 
-def get_exporter(config, file_path=None):
-    """根据配置返回一个Exporter实例。"""
+def get_exporter(config, file_path=None, append=False):
+    """根据配置返回一个Exporter实例，append 为 True 时追加到已有文件。"""
     output_config = config.get('output', {})
     output_format = output_config.get('format', 'csv').lower()
     fields = output_config.get('fields')
@@ -100,9 +108,9 @@ def get_exporter(config, file_path=None):
         raise ValueError("Output fields must be defined in YAML config under 'output.fields'")
 
     if output_format == 'csv':
-        return CsvExporter(file_path, fields)
+        return CsvExporter(file_path, fields, append)
     elif output_format == 'jsonl':
-        return JsonlExporter(file_path, fields)
+        return JsonlExporter(file_path, fields, append)
     # 未来可以在这里添加对Parquet等其他格式的支持
     # elif output_format == 'parquet':
     #     return ParquetExporter(file_path, fields)
@@ -71,7 +71,11 @@ def get_output_path(config, ctx, file_extension, is_final=False):
 @click.option('--end-time', help="查询的结束时间 (YYYY-MM-DD HH:MM:SS)")
 @click.option('--output-path', help="输出文件的完整路径（可选）")
 @click.option('--dry-run', is_flag=True, help="只打印查询语句而不执行")
-def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
+@click.option('--slices', type=int, help="sliced scroll 并行分片数，覆盖任务配置中的 search.slices")
+@click.option('--windows', type=int, help="按时间窗口并行读取的窗口数（结果按时间排序），覆盖任务配置中的 search.windows")
+@click.option('--pagination', type=click.Choice(['scroll', 'pit']), help="分页方式，覆盖任务配置中的 search.pagination")
+@click.option('--cursor-file', help="pit 分页的进度文件：每页导出后保存游标，文件存在时从中断的位置继续导出")
+def main(config, env, days, hours, start_time, end_time, output_path, dry_run, slices, windows, pagination, cursor_file):
 
     # 加载任务配置
     with open(config, 'r', encoding='utf-8') as f:
@@ -120,9 +124,32 @@ def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
     query_builder = ESQueryBuilder(config)
     query = query_builder.build_query(runtime_params=runtime_params)
 
+    # 并行读取配置：search.slices 大于 1 时使用 sliced scroll，search.queue_size 为等待处理的最大页数
+    search_config = task_config.get('search') or {}
+    slices = slices or search_config.get('slices') or 1
+    queue_size = search_config.get('queue_size')
+    # search.windows 大于 1 时按时间窗口并行读取，导出结果保持时间顺序；search.window_buffer 为每个窗口在内存中缓冲的页数
+    windows = windows or search_config.get('windows') or 1
+    window_buffer = search_config.get('window_buffer')
+    # 分页方式：scroll（默认）或 pit（point in time + search_after，游标可以保存到 --cursor-file 以便暂停和继续）
+    pagination = pagination or search_config.get('pagination', 'scroll')
+    keep_alive = search_config.get('keep_alive', '1m')
+    tiebreaker = search_config.get('tiebreaker', '_id')
+    if cursor_file and pagination != 'pit':
+        raise click.UsageError("--cursor-file requires pit pagination (--pagination pit or search.pagination: pit)")
+
+    # 继续中断的导出：使用保存的查询（时间范围不随当前时间变化）、输出文件和游标
+    resume_state = None
+    if cursor_file and os.path.exists(cursor_file):
+        with open(cursor_file, 'r', encoding='utf-8') as f:
+            resume_state = json.load(f)
+        query = resume_state['query']
+        logging.info(f"Resuming export from {cursor_file}: {resume_state['cursor']['fetched']} records already exported")
+
     if dry_run:
         logging.info("--- DRY RUN ---")
         logging.info(f"Index: {query_builder.index_name}")
+        logging.info(f"Slices: {slices}, windows: {windows}, pagination: {pagination}")
         logging.info(f"Query: \n{json.dumps(query, indent=2, ensure_ascii=False)}")
         return
 
@@ -141,11 +168,15 @@ def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
         temp_exporter = get_exporter(task_config)
         file_extension = temp_exporter.file_extension
         output_path_val = get_output_path(task_config, args_like, file_extension, is_final=False)
-        exporter = get_exporter(task_config, output_path_val)
+        if resume_state:
+            output_path_val = resume_state['output_path']
+        exporter = get_exporter(task_config, output_path_val, append=bool(resume_state))
     else:
         output_format = output_config.get('format', 'csv').lower()
         file_extension = 'csv' if output_format == 'csv' else 'jsonl'
         output_path_val = get_output_path(task_config, args_like, file_extension, is_final=False)
+        if resume_state:
+            output_path_val = resume_state['output_path']
 
     final_output_path = get_output_path(task_config, args_like, file_extension, is_final=True)
 
@@ -162,7 +193,7 @@ def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
     # 执行查询并导出
     try:
         es_util = EsUtil(env=env)
-        if exporter:
+        if exporter and not resume_state:
             exporter.write_header()
         
         # 初始化后处理器
@@ -292,6 +323,9 @@ def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
                 first_hit_source = processed_hits[0].get('_source', {})
                 if first_hit_source:
                     dynamic_output_fields = list(first_hit_source.keys())
+                    if resume_state and resume_state.get('fields'):
+                        # 继续导出时沿用已写入文件头的字段
+                        dynamic_output_fields = resume_state['fields']
                     
                     # Create a temporary config with the dynamic fields
                     dynamic_task_config = task_config.copy()
@@ -299,16 +333,57 @@ def main(config, env, days, hours, start_time, end_time, output_path, dry_run):
                         dynamic_task_config['output'] = {}
                     dynamic_task_config['output']['fields'] = dynamic_output_fields
                     
-                    exporter = get_exporter(dynamic_task_config, output_path_val)
-                    exporter.write_header()
+                    appending = bool(resume_state and resume_state.get('fields'))
+                    exporter = get_exporter(dynamic_task_config, output_path_val, append=appending)
+                    if not appending:
+                        exporter.write_header()
 
             if exporter:
                 source_hits = [item.get('_source', {}) for item in processed_hits]
                 exporter.write_batch(source_hits)
                 logging.info(f"{len(source_hits)} records exported in this batch.")
 
+        export_state = {'total': None, 'cursor': resume_state['cursor'] if resume_state else None}
+
+        def save_cursor(cursor):
+            # 先把本页数据刷新到磁盘再保存游标，中断后继续时不会丢失或重复数据
+            if exporter:
+                exporter.flush()
+            export_state['cursor'] = cursor
+            state = {
+                'query': query,
+                'output_path': output_path_val,
+                'fields': exporter.fields if exporter and dynamic_fields else None,
+                'cursor': cursor
+            }
+            tmp_path = cursor_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, cursor_file)
+
         logging.info(f"Executing query:\n{json.dumps(query, indent=2)}")
-        es_util.search(query, query_builder.index_name, batch_processor_func)
+        es_util.search(
+            query,
+            query_builder.index_name,
+            batch_processor_func,
+            on_total=lambda total: export_state.update(total=total),
+            slices=slices,
+            queue_size=queue_size,
+            windows=windows,
+            window_buffer=window_buffer,
+            pagination=pagination,
+            cursor=export_state['cursor'],
+            on_cursor=save_cursor if cursor_file else None,
+            keep_alive=keep_alive,
+            tiebreaker=tiebreaker
+        )
+        if cursor_file:
+            fetched = export_state['cursor']['fetched'] if export_state['cursor'] else 0
+            if export_state['total'] is None or fetched < export_state['total']:
+                logging.warning(f"Export incomplete ({fetched}/{export_state['total']}). Run again with --cursor-file {cursor_file} to resume.")
+                return
+            if os.path.exists(cursor_file):
+                os.remove(cursor_file)
         logging.info(f"Raw data export completed. Output file: {output_path_val}")
 
         # 处理统计结果
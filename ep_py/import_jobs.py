@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+后台导入任务模块
+
+日志导入以后台任务的形式运行，HTTP 请求只负责创建任务并立即返回任务ID。
+任务按提交顺序排队，同时运行的任务数量受并发上限控制；
+运行中的任务定期通过 import_progress 事件报告进度（行数、字节数、行/秒、预计剩余时间），
+结束时通过 import_complete 事件报告最终状态和最终检查结果。
+
+多个文件可以作为一个批次提交（例如服务器本地目录导入），每个文件一个任务，
+批次中所有任务结束时发送 import_batch_complete 事件，包含每个文件的报告和汇总。
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+
+class ImportCancelled(Exception):
+    """导入任务被取消"""
+
+
+class ImportJob:
+    """单个导入任务"""
+
+    def __init__(self, filename, platform, source, total_bytes=None, options=None):
+        """
+        参数:
+            filename (str): 文件名
+            platform (str): 日志来源平台
+            source: 任务数据来源（二进制类文件对象，例如上传内容的临时文件），任务结束时关闭
+            total_bytes (int, optional): 数据总字节数，用于计算进度和剩余时间
+            options (dict, optional): 传给执行函数的额外参数
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.filename = filename
+        self.platform = platform
+        self.source = source
+        self.total_bytes = total_bytes
+        self.options = options or {}
+        self.batch_id = None    # 所属批次ID
+        self.session_id = None  # 执行时分配的日志历史会话ID
+        self.analysis_session_id = None  # 执行时使用的分析会话ID
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lines = 0
+        self.bytes = 0
+        self.error = None
+        self.result = None
+        self._cancel_event = threading.Event()
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self):
+        """是否已请求取消"""
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """已请求取消时抛出 ImportCancelled，供执行函数在处理循环中调用"""
+        if self._cancel_event.is_set():
+            raise ImportCancelled()
+
+    def close(self):
+        """释放任务数据来源（关闭临时文件）"""
+        source, self.source = self.source, None
+        if source is not None and hasattr(source, 'close'):
+            try:
+                source.close()
+            except Exception:
+                pass
+
+    def progress(self):
+        """
+        获取任务进度
+
+        返回:
+            dict: 行数、字节数、速率和预计剩余时间
+        """
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        lines_per_sec = self.lines / elapsed if elapsed > 0 else 0.0
+        bytes_per_sec = self.bytes / elapsed if elapsed > 0 else 0.0
+        eta = None
+        percent = None
+        if self.total_bytes:
+            percent = round(min(1.0, self.bytes / self.total_bytes), 4)
+            if bytes_per_sec > 0 and self.status == 'running':
+                eta = round(max(0, self.total_bytes - self.bytes) / bytes_per_sec, 1)
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'total_bytes': self.total_bytes,
+            'percent': percent,
+            'elapsed': round(elapsed, 2),
+            'lines_per_sec': round(lines_per_sec, 1),
+            'eta_seconds': eta
+        }
+
+    def to_dict(self):
+        """任务的完整状态"""
+        data = self.progress()
+        data.update({
+            'platform': self.platform,
+            'batch_id': self.batch_id,
+            'session': self.session_id,
+            'analysis_session': self.analysis_session_id,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'options': self.options,
+            'error': self.error,
+            'result': self.result
+        })
+        return data
+
+
+class ImportJobManager:
+    """导入任务队列和执行器"""
+
+    def __init__(self, runner, emit, max_concurrent=1, progress_interval=1.0, max_finished=50):
+        """
+        参数:
+            runner (callable): 执行函数 runner(job)，返回最终检查结果，
+                               处理过程中调用 job_manager.report(job, lines, bytes) 报告进度
+            emit (callable): 事件发送函数 emit(event, data)
+            max_concurrent (int): 同时运行的任务数量上限
+            progress_interval (float): import_progress 事件的最小发送间隔（秒）
+            max_finished (int): 保留的已结束任务数量
+        """
+        self.runner = runner
+        self.emit = emit
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.progress_interval = progress_interval
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._batches = OrderedDict()  # 批次ID -> 任务ID列表
+        self._reported_batches = set()  # 已发送 import_batch_complete 的批次
+        self._sequential_batches = set()  # 任务必须逐个按提交顺序运行的批次
+        self._running_batches = set()     # 顺序批次中有任务正在运行的批次
+        self._batch_callbacks = {}        # 批次ID -> 批次全部结束时的回调
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def configure(self, settings=None):
+        """
+        更新并发上限（globalSettings.imports 配置），立即调度排队中的任务
+
+        参数:
+            settings (dict, optional): {'maxConcurrent': int}
+        """
+        settings = settings or {}
+        with self._lock:
+            self.max_concurrent = max(1, int(settings.get('maxConcurrent', self.max_concurrent)))
+        self._dispatch()
+
+    def submit(self, filename, platform, source, total_bytes=None, options=None):
+        """
+        提交导入任务
+
+        返回:
+            ImportJob: 新创建的任务
+        """
+        job = ImportJob(filename, platform, source, total_bytes, options)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._prune()
+        self.emit('import_progress', job.progress())
+        self._dispatch()
+        return job
+
+    def submit_batch(self, entries, sequential=False, on_complete=None):
+        """
+        提交一批导入任务
+
+        参数:
+            entries (list): 每个文件的任务参数 [{'filename', 'platform', 'source', 'total_bytes', 'options'}, ...]
+            sequential (bool): 批次内的任务是否逐个按提交顺序运行（例如共享一个分析会话时），
+                               不同批次之间仍然受 max_concurrent 限制并发运行
+            on_complete (callable, optional): 批次全部结束（包括排队中被取消）时调用 on_complete(批次报告)
+
+        返回:
+            tuple: (批次ID, 任务列表)
+        """
+        batch_id = uuid.uuid4().hex[:12]
+        jobs = []
+        for entry in entries:
+            job = ImportJob(entry['filename'], entry['platform'], entry.get('source'),
+                            entry.get('total_bytes'), entry.get('options'))
+            job.batch_id = batch_id
+            jobs.append(job)
+        with self._lock:
+            self._batches[batch_id] = [job.id for job in jobs]
+            if sequential:
+                self._sequential_batches.add(batch_id)
+            if on_complete:
+                self._batch_callbacks[batch_id] = on_complete
+            while len(self._batches) > self.max_finished:
+                evicted, _ = self._batches.popitem(last=False)
+                self._reported_batches.discard(evicted)
+                self._sequential_batches.discard(evicted)
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._queue.append(job)
+            self._prune()
+        for job in jobs:
+            self.emit('import_progress', job.progress())
+        self._dispatch()
+        return batch_id, jobs
+
+    def batch(self, batch_id):
+        """
+        获取批次状态：每个文件的报告和汇总
+
+        返回:
+            dict or None: 批次不存在时返回 None
+        """
+        with self._lock:
+            job_ids = self._batches.get(batch_id)
+            if job_ids is None:
+                return None
+            jobs = [self._jobs[job_id] for job_id in job_ids if job_id in self._jobs]
+        files = [job.to_dict() for job in jobs]
+        statuses = {}
+        check_statuses = {}
+        missing_required = set()
+        started = [job.started_at for job in jobs if job.started_at]
+        finished = [job.finished_at for job in jobs if job.finished_at]
+        for job in jobs:
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+            if job.result:
+                check_status = job.result.get('status', 'unknown')
+                check_statuses[check_status] = check_statuses.get(check_status, 0) + 1
+                for detail in job.result.get('details', []):
+                    if detail.get('type') == 'missing_required_events':
+                        missing_required.update(detail.get('events', []))
+        done = all(job.status not in ('queued', 'running') for job in jobs)
+        elapsed = (max(finished) if done and finished else time.time()) - min(started) if started else 0.0
+        lines = sum(job.lines for job in jobs)
+        return {
+            'batch_id': batch_id,
+            'status': 'finished' if done else 'running',
+            'files': files,
+            'aggregate': {
+                'files': len(jobs),
+                'statuses': statuses,                  # 任务状态 -> 文件数
+                'check_statuses': check_statuses,      # 最终检查状态 -> 文件数
+                'lines': lines,
+                'bytes': sum(job.bytes for job in jobs),
+                'elapsed': round(elapsed, 2),
+                'lines_per_sec': round(lines / elapsed, 1) if elapsed > 0 else 0.0,
+                'missing_required_events': sorted(missing_required)  # 至少一个文件中缺失的必要事件
+            }
+        }
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接标记为已取消，运行中的任务在下一次检查时停止
+
+        返回:
+            bool: 任务存在且尚未结束时返回 True
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ('queued', 'running'):
+                return False
+            job._cancel_event.set()
+            if job.status == 'queued':
+                self._queue.remove(job)
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                queued_cancel = True
+            else:
+                queued_cancel = False
+        if queued_cancel:
+            job.close()
+            self.emit('import_complete', job.to_dict())
+            self._finish_batch(job)
+        return True
+
+    def get(self, job_id):
+        """获取任务，不存在时返回 None"""
+        return self._jobs.get(job_id)
+
+    def list(self):
+        """列出所有任务的状态，最新提交的在前"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def report(self, job, lines, bytes_read):
+        """
+        报告任务进度，按 progress_interval 节流发送 import_progress 事件，
+        同时检查取消请求
+
+        参数:
+            job (ImportJob): 任务
+            lines (int): 已处理的行数
+            bytes_read (int): 已读取的字节数
+        """
+        job.lines = lines
+        job.bytes = bytes_read
+        now = time.time()
+        if now - job._last_progress >= self.progress_interval:
+            job._last_progress = now
+            self.emit('import_progress', job.progress())
+        job.check_cancelled()
+
+    def _finish_batch(self, job):
+        """任务所属批次全部结束时发送 import_batch_complete 事件"""
+        if job.batch_id is None:
+            return
+        report = self.batch(job.batch_id)
+        if not report or report['status'] != 'finished':
+            return
+        with self._lock:
+            if job.batch_id in self._reported_batches:
+                return
+            self._reported_batches.add(job.batch_id)
+            on_complete = self._batch_callbacks.pop(job.batch_id, None)
+        self.emit('import_batch_complete', report)
+        if on_complete:
+            try:
+                on_complete(report)
+            except Exception as e:
+                logging.error(f"导入批次 {job.batch_id} 结束回调失败: {e}")
+
+    def _prune(self):
+        """只保留最近 max_finished 个已结束的任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ('queued', 'running')]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _dispatch(self):
+        """在并发上限内启动排队中的任务，顺序批次中已有任务运行时跳过该批次的其他任务"""
+        while True:
+            with self._lock:
+                if self._running >= self.max_concurrent:
+                    return
+                job = next((job for job in self._queue if job.batch_id not in self._running_batches), None)
+                if job is None:
+                    return
+                self._queue.remove(job)
+                if job.batch_id in self._sequential_batches:
+                    self._running_batches.add(job.batch_id)
+                job.status = 'running'
+                job.started_at = time.time()
+                self._running += 1
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        try:
+            self.emit('import_progress', job.progress())
+            job.result = self.runner(job)
+            job.status = 'completed'
+        except ImportCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            logging.error(f"导入任务 {job.id} 失败: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.close()
+            with self._lock:
+                self._running -= 1
+                self._running_batches.discard(job.batch_id)
+            self.emit('import_complete', job.to_dict())
+            self._finish_batch(job)
+            self._dispatch()
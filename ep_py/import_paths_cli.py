@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务器本地日志导入命令行接口
+
+让运行中的日志收集服务器直接导入其所在主机上的日志文件（例如 CI 生成的设备日志），
+等待批次完成后输出每个文件的报告和汇总。
+
+示例:
+    python ep_py/import_paths_cli.py --platform android /data/ci/logs/*.log
+    python ep_py/import_paths_cli.py --platform android --recursive --output json /data/ci/run-42
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import requests
+
+
+def format_report(report):
+    """把批次报告格式化为文本"""
+    lines = []
+    for item in report['files']:
+        result = item.get('result') or {}
+        check = f"{result.get('status', '-')}: {result.get('message', '')}" if result else (item.get('error') or '')
+        lines.append(f"[{item['status']}] {item['filename']} - {item['lines']} 行, "
+                     f"{item['elapsed']} 秒, {item['lines_per_sec']} 行/秒 - {check}")
+    aggregate = report['aggregate']
+    lines.append('')
+    lines.append(f"文件: {aggregate['files']} ({', '.join(f'{k}={v}' for k, v in aggregate['statuses'].items())})")
+    lines.append(f"最终检查: {', '.join(f'{k}={v}' for k, v in aggregate['check_statuses'].items()) or '-'}")
+    lines.append(f"总行数: {aggregate['lines']}, 总字节数: {aggregate['bytes']}, "
+                 f"用时: {aggregate['elapsed']} 秒, {aggregate['lines_per_sec']} 行/秒")
+    if aggregate['missing_required_events']:
+        lines.append(f"缺失的必要事件: {', '.join(aggregate['missing_required_events'])}")
+    return '\n'.join(lines)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='导入服务器本地的日志文件')
+    parser.add_argument('paths', nargs='+', help='服务器上的文件、目录或通配符模式（通配符请加引号，由服务器展开）')
+    parser.add_argument('--platform', required=True, choices=['android', 'ios', 'harmonyos'], help='平台类型')
+    parser.add_argument('--server', default='http://localhost:3000', help='日志收集服务器地址')
+    parser.add_argument('--recursive', action='store_true', help='目录包含子目录')
+    parser.add_argument('--parallel', action='store_true', help='使用多进程并行分析')
+    parser.add_argument('--member', help='zip 压缩包中要导入的成员')
+    parser.add_argument('--keep-tracking', action='store_true', help='不在每个文件开始前重置事件顺序和事件组状态')
+    parser.add_argument('--no-wait', action='store_true', help='创建批次后立即退出，不等待完成')
+    parser.add_argument('--interval', type=float, default=1.0, help='轮询间隔（秒）')
+    parser.add_argument('--output', choices=['json', 'text'], default='text', help='输出格式')
+    args = parser.parse_args()
+
+    server = args.server.rstrip('/')
+    response = requests.post(f'{server}/api/import/paths', json={
+        'paths': args.paths,
+        'platform': args.platform,
+        'recursive': args.recursive,
+        'parallel': args.parallel,
+        'member': args.member,
+        'resetTracking': not args.keep_tracking
+    })
+    data = response.json()
+    for error in data.get('errors', []):
+        print(f"跳过 {error['path']}: {error['error']}", file=sys.stderr)
+    if not data.get('success'):
+        print(f"导入失败: {data.get('message')}", file=sys.stderr)
+        sys.exit(1)
+
+    batch_id = data['batchId']
+    print(f"已创建导入批次 {batch_id}: {len(data['jobs'])} 个文件", file=sys.stderr)
+    if args.no_wait:
+        print(json.dumps(data, ensure_ascii=False) if args.output == 'json' else batch_id)
+        return
+
+    while True:
+        report = requests.get(f'{server}/api/import/batches/{batch_id}').json()
+        if report.get('status') == 'finished':
+            break
+        aggregate = report['aggregate']
+        print(f"进行中: {aggregate['lines']} 行, {aggregate['lines_per_sec']} 行/秒", file=sys.stderr)
+        time.sleep(args.interval)
+
+    if args.output == 'json':
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+
+    # 有文件导入失败时返回非零退出码，便于 CI 判断
+    if any(item['status'] != 'completed' for item in report['files']):
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+日志分帧模块
+
+把任意大小的字节块增量切分为完整的文本行，内存占用只与块大小和单行长度有关，
+用于流式上传、解压缩导入等不能一次性读入整个文件的场景。
+服务器本地文件通过 mmap 映射后直接在映射区上查找行边界，不经过读缓冲区。
+"""
+
+import mmap
+import os
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_LINE_BYTES = 1024 * 1024  # 单行超过该长度时强制切分，避免异常数据占满内存
+
+
+class LineFramer:
+    """增量行分帧器：接收字节块，输出完整的文本行"""
+
+    def __init__(self, encoding='utf-8', errors='replace', max_line_bytes=MAX_LINE_BYTES):
+        """
+        参数:
+            encoding (str): 文本编码
+            errors (str): 解码错误处理方式，默认 'replace' 以保留表情符号等字符
+            max_line_bytes (int): 单行最大字节数
+        """
+        self.encoding = encoding
+        self.errors = errors
+        self.max_line_bytes = max_line_bytes
+        self._pending = b''
+        self.bytes_fed = 0  # 已接收的字节数，用于进度统计
+
+    def _decode(self, raw):
+        if raw.endswith(b'\r'):
+            raw = raw[:-1]
+        return raw.decode(self.encoding, self.errors)
+
+    def feed(self, chunk):
+        """
+        接收一个字节块
+
+        参数:
+            chunk (bytes): 新读取的数据
+
+        返回:
+            list: 本次可以确定的完整行（不含换行符），不完整的尾部留到下一次
+        """
+        if not chunk:
+            return []
+        self.bytes_fed += len(chunk)
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            self._pending += chunk
+            if len(self._pending) > self.max_line_bytes:
+                line, self._pending = self._pending, b''
+                return [self._decode(line)]
+            return []
+        data = self._pending + chunk[:end] if self._pending else chunk[:end]
+        self._pending = chunk[end + 1:]
+        return [self._decode(line) for line in data.split(b'\n')]
+
+    def flush(self):
+        """
+        结束输入，返回最后一行（如果没有以换行符结尾）
+
+        返回:
+            list: 剩余的行
+        """
+        if not self._pending:
+            return []
+        line, self._pending = self._pending, b''
+        return [self._decode(line)]
+
+
+def iter_stream_lines(stream, chunk_size=DEFAULT_CHUNK_SIZE, framer=None):
+    """
+    从类文件对象中逐块读取并逐行产出
+
+    参数:
+        stream: 提供 read(size) 方法的二进制流
+        chunk_size (int): 每次读取的字节数
+        framer (LineFramer, optional): 使用外部传入的分帧器，便于读取进度
+
+    返回:
+        generator: 逐行产出的文本行
+    """
+    framer = framer or LineFramer()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield from framer.feed(chunk)
+    yield from framer.flush()
+
+
+class MappedLineScanner:
+    """
+    基于 mmap 的本地文件行扫描器
+
+    直接在映射区上查找换行符，只在解码时复制单行数据；
+    页面由操作系统按需加载和回收，内存占用与文件大小无关。
+    """
+
+    def __init__(self, fileobj, encoding='utf-8', errors='replace', max_line_bytes=MAX_LINE_BYTES):
+        """
+        参数:
+            fileobj: 以二进制模式打开的本地文件
+            encoding (str): 文本编码
+            errors (str): 解码错误处理方式
+            max_line_bytes (int): 单行最大字节数，超出时强制切分
+        """
+        self.fileobj = fileobj
+        self.encoding = encoding
+        self.errors = errors
+        self.max_line_bytes = max_line_bytes
+        self.size = os.fstat(fileobj.fileno()).st_size
+        self.position = 0  # 已扫描的字节数，用于进度统计
+
+    def __iter__(self):
+        if self.size == 0:
+            return
+        with mmap.mmap(self.fileobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            size = self.size
+            position = 0
+            while position < size:
+                end = mapped.find(b'\n', position, min(size, position + self.max_line_bytes + 1))
+                if end < 0:
+                    end = min(size, position + self.max_line_bytes)
+                    next_position = end
+                else:
+                    next_position = end + 1
+                if end > position and mapped[end - 1] == 0x0D:  # 去掉 \r
+                    line_end = end - 1
+                else:
+                    line_end = end
+                line = mapped[position:line_end].decode(self.encoding, self.errors)
+                position = next_position
+                self.position = position
+                yield line
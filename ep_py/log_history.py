@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+日志历史模块
+
+在服务器端按会话保存最近的日志记录，供新连接的客户端、断线重连和
+/api/logs 分页接口回放使用。
+
+每个会话是一个固定容量的环形缓冲区，记录带有会话内单调递增的游标（cursor）。
+客户端只需要记住最后收到的游标，就能从该位置继续获取后续记录。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _SessionBuffer:
+    """单个会话的环形缓冲区"""
+
+    def __init__(self, session_id, capacity):
+        self.session_id = session_id
+        self.capacity = capacity
+        self.records = [None] * capacity  # 预分配，按 cursor % capacity 定位
+        self.next_cursor = 1              # 下一条记录的游标，游标从 1 开始
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def oldest_cursor(self):
+        """缓冲区中仍然保留的最早游标"""
+        return max(1, self.next_cursor - self.capacity)
+
+    @property
+    def latest_cursor(self):
+        """最新一条记录的游标，没有记录时为 0"""
+        return self.next_cursor - 1
+
+    def append(self, platform, message):
+        cursor = self.next_cursor
+        self.records[cursor % self.capacity] = {
+            'cursor': cursor,
+            'session': self.session_id,
+            'platform': platform,
+            'message': message,
+            'time': time.time()
+        }
+        self.next_cursor += 1
+        self.updated_at = time.time()
+        return cursor
+
+    def info(self):
+        return {
+            'session': self.session_id,
+            'oldest_cursor': self.oldest_cursor,
+            'latest_cursor': self.latest_cursor,
+            'count': self.latest_cursor - self.oldest_cursor + 1 if self.latest_cursor else 0,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class LogHistory:
+    """按会话保存最近日志的历史存储"""
+
+    def __init__(self, max_records_per_session=50000, max_sessions=16):
+        """
+        参数:
+            max_records_per_session (int): 每个会话保留的最大记录数
+            max_sessions (int): 最多保留的会话数量，超出时淘汰最久未更新的会话
+        """
+        self.max_records_per_session = max_records_per_session
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, settings=None):
+        """
+        更新容量配置，只影响之后新建的会话
+
+        参数:
+            settings (dict, optional): globalSettings.history 配置
+        """
+        settings = settings or {}
+        self.max_records_per_session = max(1, int(settings.get('maxRecordsPerSession', self.max_records_per_session)))
+        self.max_sessions = max(1, int(settings.get('maxSessions', self.max_sessions)))
+
+    def append(self, session_id, platform, message):
+        """
+        追加一条日志记录
+
+        参数:
+            session_id (str): 会话ID
+            platform (str): 日志来源平台
+            message (str): 日志内容
+
+        返回:
+            int: 该记录在会话中的游标
+        """
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is None:
+                buffer = _SessionBuffer(session_id, self.max_records_per_session)
+                self._sessions[session_id] = buffer
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return buffer.append(platform, message)
+
+    def fetch(self, session_id, cursor=0, limit=500, text_filter=None):
+        """
+        分页获取游标之后的记录
+
+        参数:
+            session_id (str): 会话ID
+            cursor (int): 客户端最后收到的游标，返回游标大于它的记录
+            limit (int): 本页最多返回的记录数
+            text_filter (str, optional): 只返回包含该文本的记录（不区分大小写）
+
+        返回:
+            dict: {
+                'session': str,
+                'records': list,       # 本页记录
+                'next_cursor': int,    # 下一页请求应使用的游标
+                'has_more': bool,      # 是否还有更多记录
+                'oldest_cursor': int,  # 仍可获取的最早游标
+                'latest_cursor': int,
+                'truncated': bool      # 请求的游标已被环形缓冲区覆盖，部分记录已丢失
+            }
+        """
+        needle = text_filter.lower() if text_filter else None
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is None:
+                return {
+                    'session': session_id,
+                    'records': [],
+                    'next_cursor': cursor,
+                    'has_more': False,
+                    'oldest_cursor': 0,
+                    'latest_cursor': 0,
+                    'truncated': False
+                }
+            start = max(cursor + 1, buffer.oldest_cursor)
+            latest = buffer.latest_cursor
+            records = []
+            position = start
+            while position <= latest and len(records) < limit:
+                record = buffer.records[position % buffer.capacity]
+                if needle is None or needle in record['message'].lower():
+                    records.append(record)
+                position += 1
+            return {
+                'session': session_id,
+                'records': records,
+                'next_cursor': position - 1,
+                'has_more': position <= latest,
+                'oldest_cursor': buffer.oldest_cursor,
+                'latest_cursor': latest,
+                'truncated': cursor + 1 < buffer.oldest_cursor
+            }
+
+    def session_info(self, session_id):
+        """获取会话的游标范围，会话不存在时返回 None"""
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            return buffer.info() if buffer else None
+
+    def sessions(self):
+        """列出所有会话的游标范围，最近更新的在前"""
+        with self._lock:
+            return [buffer.info() for buffer in reversed(self._sessions.values())]
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+日志来源模块
+
+把上传的日志数据透明地转换为未压缩的二进制流，供 LineFramer 增量分帧：
+- 纯文本
+- gzip（.gz，支持多成员拼接）
+- zstd（.zst，需要安装可选依赖 zstandard）
+- zip 压缩包（例如 Android bugreport），可以指定要导入的成员，成员本身也可以是 gzip/zstd
+
+格式按文件头的魔数识别，不依赖文件扩展名。解压缩全程流式进行，不会把整个文件解压到内存。
+"""
+
+import fnmatch
+import glob
+import gzip
+import os
+import zipfile
+
+from ep_py.log_framing import LineFramer, MappedLineScanner, iter_stream_lines
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选支持
+    zstandard = None
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGIC = b'PK\x03\x04'
+
+# 未指定成员时按顺序匹配的成员名称模式（不区分大小写），同一模式匹配多个成员时选择最大的
+DEFAULT_MEMBER_PATTERNS = ('*logcat*', 'bugreport*.txt', '*.log', '*.txt', '*.gz', '*.zst')
+
+
+class LogSourceError(ValueError):
+    """日志来源无法解析（格式不支持、缺少依赖或找不到压缩包成员）"""
+
+
+class CountingReader:
+    """统计已读取字节数的读取器，用于按压缩数据计算导入进度"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def seekable(self):
+        return hasattr(self.stream, 'seek') and (not hasattr(self.stream, 'seekable') or self.stream.seekable())
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.stream.close()
+
+
+class _PrefixedReader:
+    """把已经读出的文件头放回流的开头（用于不可定位的流）"""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def close(self):
+        self.stream.close()
+
+
+def _sniff(stream):
+    """
+    读取文件头用于格式识别
+
+    返回:
+        tuple: (文件头, 可以从头读取的流)
+    """
+    seekable = hasattr(stream, 'seekable') and stream.seekable()
+    if seekable:
+        position = stream.tell()
+        prefix = stream.read(4)
+        stream.seek(position)
+        return prefix, stream
+    prefix = stream.read(4)
+    return prefix, _PrefixedReader(prefix, stream)
+
+
+def detect_format(prefix):
+    """
+    根据文件头识别格式
+
+    返回:
+        str: 'gzip'、'zstd'、'zip' 或 'plain'
+    """
+    if prefix.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if prefix.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    if prefix.startswith(ZIP_MAGIC):
+        return 'zip'
+    return 'plain'
+
+
+def list_archive_members(archive):
+    """
+    列出 zip 压缩包中的文件成员
+
+    参数:
+        archive (zipfile.ZipFile): 已打开的压缩包
+
+    返回:
+        list: [{'name': str, 'size': int, 'compressed_size': int}, ...]
+    """
+    return [
+        {'name': info.filename, 'size': info.file_size, 'compressed_size': info.compress_size}
+        for info in archive.infolist() if not info.is_dir()
+    ]
+
+
+def select_member(archive, member=None):
+    """
+    选择要导入的 zip 成员
+
+    参数:
+        archive (zipfile.ZipFile): 已打开的压缩包
+        member (str, optional): 成员名称或通配符模式；只给出文件名时也匹配子目录中的同名成员。
+                                未指定时按 DEFAULT_MEMBER_PATTERNS 自动选择
+
+    返回:
+        zipfile.ZipInfo: 选中的成员
+
+    异常:
+        LogSourceError: 没有匹配的成员
+    """
+    files = [info for info in archive.infolist() if not info.is_dir()]
+    if not files:
+        raise LogSourceError('Zip archive is empty.')
+
+    def matching(pattern):
+        pattern = pattern.lower()
+        return [
+            info for info in files
+            if fnmatch.fnmatch(info.filename.lower(), pattern)
+            or fnmatch.fnmatch(os.path.basename(info.filename).lower(), pattern)
+        ]
+
+    if member:
+        candidates = matching(member)
+    elif len(files) == 1:
+        candidates = files
+    else:
+        candidates = []
+        for pattern in DEFAULT_MEMBER_PATTERNS:
+            candidates = matching(pattern)
+            if candidates:
+                break
+    if not candidates:
+        names = ', '.join(info.filename for info in files[:20])
+        raise LogSourceError(f'No matching member in zip archive (member={member or "auto"}). Available: {names}')
+    return max(candidates, key=lambda info: info.file_size)
+
+
+def open_log_source(stream, member=None):
+    """
+    打开日志来源，返回未压缩的二进制流
+
+    参数:
+        stream: 二进制类文件对象；zip 压缩包要求可以定位（例如上传内容的临时文件）
+        member (str, optional): zip 压缩包中要导入的成员
+
+    返回:
+        tuple: (可逐块读取的二进制流, 来源信息 {'format': str, 'member': str or None})
+
+    异常:
+        LogSourceError: 格式不支持或找不到成员
+    """
+    prefix, stream = _sniff(stream)
+    source_format = detect_format(prefix)
+    info = {'format': source_format, 'member': None}
+
+    if source_format == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb'), info
+
+    if source_format == 'zstd':
+        if zstandard is None:
+            raise LogSourceError('zstd compressed logs require the optional "zstandard" package.')
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True), info
+
+    if source_format == 'zip':
+        if not (hasattr(stream, 'seekable') and stream.seekable()):
+            raise LogSourceError('Zip archives must be uploaded as a seekable file.')
+        archive = zipfile.ZipFile(stream)
+        selected = select_member(archive, member)
+        member_stream, member_info = open_log_source(archive.open(selected))
+        if member_info['format'] == 'zip':
+            raise LogSourceError(f'Nested zip archive "{selected.filename}" is not supported.')
+        info['member'] = selected.filename
+        info['member_format'] = member_info['format']
+        info['member_compressed_size'] = selected.compress_size
+        return member_stream, info
+
+    return stream, info
+
+
+def open_log_lines(stream, member=None, use_mmap=False):
+    """
+    打开日志来源并逐行读取
+
+    参数:
+        stream: 二进制类文件对象
+        member (str, optional): zip 压缩包中要导入的成员
+        use_mmap (bool): 未压缩的本地文件（有 fileno）直接通过 mmap 扫描
+
+    返回:
+        tuple: (逐行产出的生成器, 返回已读取原始字节数的函数, 来源信息)
+            压缩包只统计选中成员的数据，来源信息中的 member_compressed_size 为对应的总字节数
+
+    异常:
+        LogSourceError: 格式不支持或找不到成员
+    """
+    counter = CountingReader(stream)
+    decoded, info = open_log_source(counter, member)
+    if use_mmap and info['format'] == 'plain':
+        scanner = MappedLineScanner(stream)
+        info['mmap'] = True
+        return iter(scanner), lambda: scanner.position, info
+    if info['member']:
+        counter.bytes_read = 0
+    framer = LineFramer()
+
+    def lines():
+        yield from iter_stream_lines(decoded, framer=framer)
+        if info['format'] != 'plain':
+            info['uncompressed_bytes'] = framer.bytes_fed
+
+    return lines(), lambda: counter.bytes_read, info
+
+
+def expand_log_paths(patterns, recursive=False):
+    """
+    把文件、目录和通配符模式展开为文件列表
+
+    参数:
+        patterns (list): 文件、目录或通配符模式（支持 **）
+        recursive (bool): 目录是否包含子目录
+
+    返回:
+        tuple: (文件路径列表（按模式顺序，模式内排序）, 没有匹配到文件的模式列表)
+    """
+    files = []
+    unmatched = []
+    for pattern in patterns:
+        pattern = os.path.expanduser(str(pattern))
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        elif os.path.isdir(pattern):
+            if recursive:
+                matches = sorted(os.path.join(directory, name)
+                                 for directory, _, names in os.walk(pattern) for name in names)
+            else:
+                matches = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            matches = [pattern]
+        matches = [match for match in matches if not os.path.isdir(match)]
+        if not matches:
+            unmatched.append(pattern)
+        files.extend(matches)
+    return files, unmatched
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+日志回放模块
+
+把录制的会话、日志历史中的会话（例如导入的日志）或服务器本地日志文件重新送入完整的处理流程
+（分帧、行为分析、投递），用于调试行为配置，也用作新规则集的回归和性能测试。
+
+回放速度:
+- original: 按日志原来的时间间隔回放
+- N（数字）: N 倍速回放
+- max: 不等待，以最快速度回放
+
+时间间隔来自录制时的采集时间，或者日志行自带的时间戳（logcat/hilog、iOS syslog、ISO 格式）；
+没有时间戳的行紧跟上一行发送，时间倒退按间隔 0 处理，maxGap 可以压缩过长的空闲间隔。
+
+每个阶段的耗时分别统计（平均值、P50/P95/P99、最大值）：
+- read: 读取数据来源和分帧
+- analysis: 行为匹配、提取、验证和事件追踪
+- delivery: 历史记录、统计和投递
+- lag: 按时间回放时实际发送时间晚于计划时间的量
+
+本模块不依赖 Flask，数据来源和处理流程由调用方以回调的形式提供。
+"""
+
+import calendar
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+STAGES = ('read', 'analysis', 'delivery', 'lag')
+
+# 每处理该数量的行检查一次取消请求和进度报告间隔
+REPLAY_CHECK_LINES = 500
+
+_MONTHS = {name: i for i, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+# MM-DD HH:MM:SS.mmm（Android logcat、HarmonyOS hilog）
+_LOGCAT_TIME = re.compile(r'^(\d{2})-(\d{2})\s+(\d{2}):(\d{2}):(\d{2})\.(\d{1,6})')
+# Mon DD HH:MM:SS（iOS idevicesyslog）
+_SYSLOG_TIME = re.compile(r'^([A-Z][a-z]{2})\s+(\d{1,2})\s+(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?')
+# YYYY-MM-DD[T ]HH:MM:SS[.ffffff]（ES 搜索结果等）
+_ISO_TIME = re.compile(r'^\[?(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?')
+
+
+def parse_log_time(line):
+    """
+    解析日志行开头的时间戳
+
+    没有年份的格式按同一年计算，只用于计算相邻行的时间间隔。
+
+    返回:
+        float: 秒数，无法解析时返回 None
+    """
+    try:
+        match = _LOGCAT_TIME.match(line)
+        if match:
+            month, day, hour, minute, second, fraction = match.groups()
+            year = 2000
+        else:
+            match = _SYSLOG_TIME.match(line)
+            if match:
+                month_name, day, hour, minute, second, fraction = match.groups()
+                month, year = _MONTHS.get(month_name), 2000
+                if month is None:
+                    return None
+            else:
+                match = _ISO_TIME.match(line)
+                if not match:
+                    return None
+                year, month, day, hour, minute, second, fraction = match.groups()
+        seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, 0))
+    except ValueError:
+        return None
+    return seconds + (int(fraction) / 10 ** len(fraction) if fraction else 0.0)
+
+
+def parse_speed(value):
+    """
+    解析回放速度
+
+    参数:
+        value: 'original'、'max' 或大于 0 的倍数
+
+    返回:
+        float: 倍数，0 表示最大速度
+
+    异常:
+        ValueError: 速度无效
+    """
+    if value in (None, 'original'):
+        return 1.0
+    if value == 'max':
+        return 0.0
+    speed = float(value)
+    if speed <= 0:
+        raise ValueError('speed must be "original", "max" or a positive number')
+    return speed
+
+
+class StageLatency:
+    """单个阶段的耗时统计，百分位数由固定大小的蓄水池抽样计算"""
+
+    SAMPLE_SIZE = 4096
+
+    __slots__ = ('count', 'total', 'max', '_samples', '_random')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = []
+        self._random = random.Random(0)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self._samples) < self.SAMPLE_SIZE:
+            self._samples.append(seconds)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < self.SAMPLE_SIZE:
+                self._samples[slot] = seconds
+
+    def to_dict(self):
+        """耗时统计（毫秒）"""
+        samples = sorted(self._samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 4)
+
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 4) if self.count else 0.0,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 4)
+        }
+
+
+class ReplayClock:
+    """把日志时间换算为回放的计划发送时间（time.perf_counter）"""
+
+    def __init__(self, speed, max_gap=None):
+        """
+        参数:
+            speed (float): 倍数，0 表示最大速度
+            max_gap (float, optional): 相邻两行的最大间隔（日志时间，秒），超过时按该值计算
+        """
+        self.speed = speed
+        self.max_gap = max_gap
+        self.origin = None       # 第一行的发送时间
+        self.last_time = None    # 上一个有时间戳的日志时间
+        self.log_elapsed = 0.0   # 已回放的日志时间（压缩间隔之后）
+
+    def scheduled(self, log_time):
+        """
+        计算一行的计划发送时间
+
+        参数:
+            log_time (float): 日志时间，None 表示沿用上一行
+
+        返回:
+            float: 计划发送的 perf_counter 时间，最大速度时返回 None
+        """
+        if log_time is not None:
+            if self.last_time is not None:
+                gap = max(0.0, log_time - self.last_time)
+                if self.max_gap is not None:
+                    gap = min(gap, self.max_gap)
+                self.log_elapsed += gap
+            self.last_time = log_time
+        if not self.speed:
+            return None
+        if self.origin is None:
+            self.origin = time.perf_counter()
+        return self.origin + self.log_elapsed / self.speed
+
+
+class ReplayCancelled(Exception):
+    """回放被取消"""
+
+
+class ReplayJob:
+    """单个回放任务"""
+
+    def __init__(self, source, platform, speed=1.0, max_gap=None, options=None):
+        """
+        参数:
+            source (dict): 数据来源描述，例如 {'recording': id}、{'session': id}、{'path': str}
+            platform (str): 日志来源平台（录制中的记录自带平台时以记录为准）
+            speed (float): 倍数，0 表示最大速度
+            max_gap (float, optional): 压缩后的最大间隔（秒）
+            options (dict, optional): 传给执行函数的额外参数
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.platform = platform
+        self.speed = speed
+        self.max_gap = max_gap
+        self.options = options or {}
+        self.session_id = None           # 回放写入的日志历史会话ID
+        self.analysis_session_id = None  # 回放使用的分析会话ID
+        self.ruleset_version = None
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lines = 0
+        self.error_lines = 0
+        self.log_seconds = 0.0           # 已回放的日志时间
+        self.error = None
+        self.result = None
+        self.stages = {stage: StageLatency() for stage in STAGES}
+        self._cancel_event = threading.Event()
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """已请求取消时抛出 ReplayCancelled"""
+        if self._cancel_event.is_set():
+            raise ReplayCancelled()
+
+    def wait(self, seconds):
+        """等待到计划时间，期间请求取消时立即抛出 ReplayCancelled"""
+        if self._cancel_event.wait(seconds):
+            raise ReplayCancelled()
+
+    def progress(self):
+        """
+        获取回放进度
+
+        返回:
+            dict: 行数、速率和各阶段耗时
+        """
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'replay_id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'speed': self.speed or 'max',
+            'lines': self.lines,
+            'error_lines': self.error_lines,
+            'elapsed': round(elapsed, 2),
+            'lines_per_sec': round(self.lines / elapsed, 1) if elapsed > 0 else 0.0,
+            'log_seconds': round(self.log_seconds, 3),
+            'stages': {stage: latency.to_dict() for stage, latency in self.stages.items()}
+        }
+
+    def to_dict(self):
+        """回放任务的完整状态"""
+        data = self.progress()
+        data.update({
+            'platform': self.platform,
+            'max_gap': self.max_gap,
+            'session': self.session_id,
+            'analysis_session': self.analysis_session_id,
+            'rulesetVersion': self.ruleset_version,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'result': self.result
+        })
+        return data
+
+
+def run_replay(job, records, publish, analyze, on_progress=None):
+    """
+    按回放速度把记录送入处理流程
+
+    参数:
+        job (ReplayJob): 回放任务，行数、阶段耗时写入任务
+        records (iterable): (日志时间或 None, 平台, 日志行)，读取耗时计入 read 阶段
+        publish (callable): 投递阶段 publish(platform, line)
+        analyze (callable): 分析阶段 analyze(line)，返回是否为可能的错误行
+        on_progress (callable, optional): 定期调用 on_progress()，抛出异常时停止回放
+    """
+    clock = ReplayClock(job.speed, job.max_gap)
+    read, analysis, delivery, lag = (job.stages[stage] for stage in STAGES)
+    perf = time.perf_counter
+    iterator = iter(records)
+    try:
+        while True:
+            started = perf()
+            try:
+                log_time, platform, line = next(iterator)
+            except StopIteration:
+                break
+            read.add(perf() - started)
+            line = line.strip()
+            if not line:
+                continue
+
+            scheduled = clock.scheduled(log_time)
+            job.log_seconds = clock.log_elapsed
+            if scheduled is not None:
+                delay = scheduled - perf()
+                if delay > 0:
+                    job.wait(delay)
+                lag.add(max(0.0, perf() - scheduled))
+
+            started = perf()
+            publish(platform or job.platform, line)
+            published = perf()
+            if analyze(line):
+                job.error_lines += 1
+            analysis.add(perf() - published)
+            delivery.add(published - started)
+
+            job.lines += 1
+            if job.lines % REPLAY_CHECK_LINES == 0:
+                job.check_cancelled()
+                if on_progress:
+                    on_progress()
+    finally:
+        # 提前结束时关闭数据来源（生成器中打开的文件）
+        if hasattr(iterator, 'close'):
+            iterator.close()
+
+
+class ReplayManager:
+    """回放任务管理：每个任务在独立的后台线程中运行，定期报告进度"""
+
+    def __init__(self, runner, emit, progress_interval=1.0, max_finished=20):
+        """
+        参数:
+            runner (callable): 执行函数 runner(job)，返回值保存为任务结果
+            emit (callable): 事件发送函数 emit(event, data)
+            progress_interval (float): replay_progress 事件的最小间隔（秒）
+            max_finished (int): 保留的已结束任务数量
+        """
+        self.runner = runner
+        self.emit = emit
+        self.progress_interval = progress_interval
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """登记并启动回放任务"""
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        threading.Thread(target=self._run, args=(job,), name=f'replay-{job.id}', daemon=True).start()
+        return job
+
+    def get(self, replay_id):
+        with self._lock:
+            return self._jobs.get(replay_id)
+
+    def list(self):
+        """所有任务的状态，按提交顺序排列"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def cancel(self, replay_id):
+        """
+        请求取消回放任务
+
+        返回:
+            bool: 任务存在且尚未结束
+        """
+        job = self.get(replay_id)
+        if job is None or job.status not in ('queued', 'running'):
+            return False
+        job._cancel_event.set()
+        return True
+
+    def report(self, job):
+        """报告进度（按 progress_interval 节流）"""
+        now = time.time()
+        if now - job._last_progress >= self.progress_interval:
+            job._last_progress = now
+            self.emit('replay_progress', job.progress())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = self.runner(job)
+            job.status = 'completed'
+        except ReplayCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+        self.emit('replay_complete', job.to_dict())
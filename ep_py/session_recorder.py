@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""
+会话录制模块
+
+把实时收集的原始日志和分析事件（行为命中、事件顺序违规、事件组）按顺序写入磁盘，
+整天的设备压力测试也不会占用内存；录制的内容可以按序号或时间读取。
+
+目录结构（每个日志历史会话一个目录）:
+    <directory>/<会话ID>/recording.json        录制信息（平台、设备、开始/结束时间、记录数、字节数）
+    <directory>/<会话ID>/segment-000001.rec    数据段，只追加写入，超过 segmentBytes 后切换到新的数据段
+    <directory>/<会话ID>/segment-000001.idx    数据段的稀疏索引
+
+数据段由连续的帧组成：4 字节长度 + 4 字节 CRC32（大端）+ UTF-8 JSON 记录。
+记录包含会话内从 1 开始递增的序号 seq、采集时间 time 和类型 type（log / hit / event）。
+进程异常退出时最后一帧可能不完整，读取时在长度或校验不符的位置停止。
+
+索引在每个数据段的第一条记录和之后每 indexInterval 条记录写入一项：
+序号（8 字节）、时间（8 字节浮点）、帧在数据段中的偏移（8 字节），读取时按序号或时间二分查找定位。
+
+写入由后台线程完成：采集线程只把记录放入内存队列，不做序列化和磁盘操作；
+写入线程批量序列化和写入，并按 fsyncInterval / fsyncBytes 批量 fsync。
+队列超过 maxPending 时丢弃新记录并计数，磁盘变慢不会拖慢采集。
+"""
+
+import bisect
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+
+FRAME_HEADER = struct.Struct('>II')   # 记录长度、CRC32
+INDEX_ENTRY = struct.Struct('>QdQ')   # 序号、时间、帧偏移
+
+RECORD_TYPES = ('log', 'hit', 'event')
+
+DEFAULT_SETTINGS = {
+    'enabled': False,                   # 开始实时收集时默认是否录制（start-log 的 record 参数优先）
+    'directory': 'recordings',          # 录制目录
+    'segmentBytes': 64 * 1024 * 1024,   # 单个数据段的最大字节数
+    'indexInterval': 1000,              # 每隔多少条记录写入一个索引项
+    'fsyncInterval': 1.0,               # 两次 fsync 之间的最长时间（秒）
+    'fsyncBytes': 4 * 1024 * 1024,      # 写入该字节数后立即 fsync
+    'maxPending': 100000                # 写入队列的最大记录数，超过时丢弃新记录
+}
+
+# 写入线程没有被唤醒时检查队列的间隔（秒）
+WRITER_INTERVAL = 0.2
+
+
+def encode_frame(record):
+    """把记录编码为一帧"""
+    payload = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_frames(f):
+    """
+    从文件当前位置逐帧读取，遇到不完整或校验失败的帧时停止
+
+    产出:
+        tuple: (帧偏移, 记录)
+    """
+    while True:
+        offset = f.tell()
+        header = f.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        length, crc = FRAME_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield offset, json.loads(payload)
+
+
+def read_index(path):
+    """
+    读取数据段的稀疏索引
+
+    返回:
+        list: [(序号, 时间, 偏移), ...]，忽略末尾不完整的索引项
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return []
+    count = len(data) // INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(count)]
+
+
+class _Recording:
+    """单个会话的录制，文件只由写入线程访问"""
+
+    def __init__(self, root, session_id, info, settings):
+        self.directory = os.path.join(root, session_id)
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_bytes = settings['segmentBytes']
+        self.index_interval = settings['indexInterval']
+        self.info = dict(info or {}, session=session_id, startedAt=time.time(), endedAt=None,
+                         records=0, bytes=0, segments=0, firstTime=None, lastTime=None)
+        self.next_seq = 1
+        self.segment = None
+        self.index = None
+        self.segment_size = 0
+        self.since_index = 0
+        self.unsynced_bytes = 0
+        self.last_sync = time.monotonic()
+        self.write_info()
+
+    def write_info(self):
+        """原子写入 recording.json"""
+        path = os.path.join(self.directory, 'recording.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.info, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _open_segment(self):
+        self.info['segments'] += 1
+        name = f'segment-{self.info["segments"]:06d}'
+        self.segment = open(os.path.join(self.directory, name + '.rec'), 'ab')
+        self.index = open(os.path.join(self.directory, name + '.idx'), 'ab')
+        self.segment_size = self.segment.tell()
+        self.since_index = 0
+
+    def _close_segment(self):
+        if self.segment:
+            self.sync()
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+
+    def write(self, record_time, record_type, payload):
+        """写入一条记录"""
+        frame = encode_frame(dict(payload, seq=self.next_seq, time=record_time, type=record_type))
+        if self.segment and self.segment_size and self.segment_size + len(frame) > self.segment_bytes:
+            self._close_segment()
+        if self.segment is None:
+            self._open_segment()
+        if self.since_index == 0:
+            self.index.write(INDEX_ENTRY.pack(self.next_seq, record_time, self.segment_size))
+        self.since_index = (self.since_index + 1) % self.index_interval
+        self.segment.write(frame)
+        self.segment_size += len(frame)
+        self.unsynced_bytes += len(frame)
+        self.info['records'] += 1
+        self.info['bytes'] += len(frame)
+        if self.info['firstTime'] is None:
+            self.info['firstTime'] = record_time
+        self.info['lastTime'] = record_time
+        self.next_seq += 1
+
+    def flush(self):
+        """把缓冲写入操作系统（读取接口可以看到），不等待落盘"""
+        if self.segment:
+            self.segment.flush()
+            self.index.flush()
+
+    def sync(self):
+        """写入并 fsync 数据段和索引"""
+        if self.segment:
+            self.flush()
+            os.fsync(self.segment.fileno())
+            os.fsync(self.index.fileno())
+        self.unsynced_bytes = 0
+        self.last_sync = time.monotonic()
+
+    def close(self, dropped=0):
+        self._close_segment()
+        self.info['endedAt'] = time.time()
+        self.info['dropped'] = dropped
+        self.write_info()
+
+
+class SessionRecorder:
+    """按会话录制日志和分析事件，写入由后台线程完成"""
+
+    def __init__(self, settings=None):
+        """
+        参数:
+            settings (dict, optional): 录制配置，见 DEFAULT_SETTINGS
+        """
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._active = set()        # 正在录制的会话ID（采集线程只读）
+        self._recordings = {}       # 会话ID -> _Recording（只由写入线程访问）
+        self._dropped = {}          # 会话ID -> 丢弃的记录数
+        self._thread = None
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        """
+        更新录制配置，数据段大小和索引间隔只影响之后开始的录制
+
+        参数:
+            settings (dict, optional): globalSettings.recording 配置
+        """
+        settings = settings or {}
+        merged = dict(DEFAULT_SETTINGS)
+        merged.update({key: value for key, value in settings.items() if key in DEFAULT_SETTINGS})
+        self.enabled = bool(merged['enabled'])
+        self.directory = merged['directory']
+        self.settings = {
+            'segmentBytes': max(4096, int(merged['segmentBytes'])),
+            'indexInterval': max(1, int(merged['indexInterval']))
+        }
+        self.fsync_interval = max(0.0, float(merged['fsyncInterval']))
+        self.fsync_bytes = max(1, int(merged['fsyncBytes']))
+        self.max_pending = max(1, int(merged['maxPending']))
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session-recorder', daemon=True)
+                self._thread.start()
+
+    def start(self, session_id, info=None):
+        """
+        开始录制会话（已在录制时无副作用）
+
+        参数:
+            session_id (str): 日志历史会话ID
+            info (dict, optional): 写入 recording.json 的附加信息（平台、设备等）
+        """
+        with self._lock:
+            if session_id in self._active:
+                return
+            self._active.add(session_id)
+            self._dropped[session_id] = 0
+            self._pending.append(('start', session_id, dict(info or {}), self.directory, dict(self.settings)))
+        self._ensure_writer()
+        self._wakeup.set()
+
+    def stop(self, session_id):
+        """结束录制会话，写入线程写完之前的记录后关闭文件"""
+        with self._lock:
+            if session_id not in self._active:
+                return
+            self._active.discard(session_id)
+            self._pending.append(('stop', session_id))
+        self._wakeup.set()
+
+    def is_recording(self, session_id):
+        return session_id in self._active
+
+    def record(self, session_id, record_type, payload):
+        """
+        记录一条数据（采集线程调用，只入队）
+
+        参数:
+            session_id (str): 日志历史会话ID，没有在录制时直接忽略
+            record_type (str): 'log'、'hit' 或 'event'
+            payload (dict): 记录内容
+
+        返回:
+            bool: 是否已入队
+        """
+        if session_id not in self._active:
+            return False
+        if len(self._pending) >= self.max_pending:
+            self._dropped[session_id] = self._dropped.get(session_id, 0) + 1
+            return False
+        self._pending.append(('record', session_id, time.time(), record_type, payload))
+        return True
+
+    def _run(self):
+        """写入线程：批量写入队列中的记录，按时间和字节数批量 fsync"""
+        while True:
+            self._wakeup.wait(WRITER_INTERVAL)
+            self._wakeup.clear()
+            self._drain()
+            with self._lock:
+                if not self._active and not self._pending and not self._recordings:
+                    self._thread = None
+                    return
+
+    def _drain(self):
+        pending = self._pending
+        while pending:
+            item = pending.popleft()
+            kind, session_id = item[0], item[1]
+            try:
+                if kind == 'record':
+                    recording = self._recordings.get(session_id)
+                    if recording:
+                        recording.write(item[2], item[3], item[4])
+                elif kind == 'start':
+                    if session_id not in self._recordings:
+                        self._recordings[session_id] = _Recording(item[3], session_id, item[2], item[4])
+                elif kind == 'stop':
+                    recording = self._recordings.pop(session_id, None)
+                    if recording:
+                        recording.close(self._dropped.pop(session_id, 0))
+            except (OSError, ValueError) as e:
+                print(f'Session recording error ({session_id}): {e}')
+        now = time.monotonic()
+        for recording in self._recordings.values():
+            try:
+                if recording.unsynced_bytes >= self.fsync_bytes or \
+                        (recording.unsynced_bytes and now - recording.last_sync >= self.fsync_interval):
+                    recording.sync()
+                else:
+                    recording.flush()
+            except (OSError, ValueError) as e:
+                print(f'Session recording error ({recording.info["session"]}): {e}')
+
+    def close(self):
+        """结束所有录制并等待写入完成（服务器退出时调用）"""
+        for session_id in list(self._active):
+            self.stop(session_id)
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+
+    def _session_directory(self, session_id):
+        if not session_id or session_id in ('.', '..') or os.path.basename(session_id) != session_id:
+            raise ValueError(f'Invalid recording id: {session_id}')
+        return os.path.join(self.directory, session_id)
+
+    def info(self, session_id):
+        """
+        录制信息，正在录制时包含实时计数
+
+        返回:
+            dict: recording.json 的内容和 recording 状态，录制不存在时返回 None
+        """
+        path = os.path.join(self._session_directory(session_id), 'recording.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        recording = self._recordings.get(session_id)
+        if recording:
+            info = dict(recording.info)
+        info['recording'] = session_id in self._active
+        info['dropped'] = self._dropped.get(session_id, info.get('dropped', 0))
+        return info
+
+    def list(self):
+        """列出录制目录中的所有录制，最近开始的在前"""
+        recordings = []
+        for path in glob.glob(os.path.join(self.directory, '*', 'recording.json')):
+            info = self.info(os.path.basename(os.path.dirname(path)))
+            if info:
+                recordings.append(info)
+        recordings.sort(key=lambda info: info.get('startedAt') or 0, reverse=True)
+        return recordings
+
+    def status(self):
+        """录制器状态"""
+        return {
+            'enabled': self.enabled,
+            'directory': os.path.abspath(self.directory),
+            'active': sorted(self._active),
+            'pending': len(self._pending),
+            'dropped': sum(self._dropped.values())
+        }
+
+    def iter_records(self, session_id, from_seq=None, from_time=None):
+        """
+        按顺序读取录制的记录，通过稀疏索引定位起始位置
+
+        参数:
+            session_id (str): 会话ID
+            from_seq (int, optional): 从该序号开始
+            from_time (float, optional): 从该时间（Unix 时间戳）开始
+
+        产出:
+            dict: 记录
+        """
+        directory = self._session_directory(session_id)
+        segments = sorted(glob.glob(os.path.join(directory, 'segment-*.rec')))
+        indexes = [read_index(segment[:-4] + '.idx') for segment in segments]
+
+        # 起始数据段：第一个索引项不晚于起点的最后一个数据段
+        if from_seq is not None:
+            position, key = 0, from_seq
+        elif from_time is not None:
+            position, key = 1, from_time
+        else:
+            position, key = None, None
+        start_segment, start_offset = 0, 0
+        if position is not None:
+            for i, index in enumerate(indexes):
+                if index and index[0][position] <= key:
+                    start_segment = i
+            index = indexes[start_segment] if indexes else []
+            keys = [entry[position] for entry in index]
+            found = bisect.bisect_right(keys, key) - 1
+            if found >= 0:
+                start_offset = index[found][2]
+
+        for i in range(start_segment, len(segments)):
+            with open(segments[i], 'rb') as f:
+                if i == start_segment:
+                    f.seek(start_offset)
+                for _, record in iter_frames(f):
+                    if from_seq is not None and record['seq'] < from_seq:
+                        continue
+                    if from_time is not None and record['time'] < from_time:
+                        continue
+                    yield record
+
+    def read(self, session_id, from_seq=None, from_time=None, limit=1000, types=None):
+        """
+        分页读取录制的记录
+
+        参数:
+            session_id (str): 会话ID
+            from_seq (int, optional): 从该序号开始
+            from_time (float, optional): 从该时间开始
+            limit (int): 本页最多返回的记录数
+            types (iterable, optional): 只返回这些类型的记录
+
+        返回:
+            dict: {'session', 'records', 'next_seq': 下一页的 from_seq, 'has_more'}，录制不存在时返回 None
+        """
+        if not os.path.isdir(self._session_directory(session_id)):
+            return None
+        types = set(types) if types else None
+        records = []
+        next_seq = from_seq
+        has_more = False
+        for record in self.iter_records(session_id, from_seq, from_time):
+            if len(records) >= limit:
+                has_more = True
+                break
+            next_seq = record['seq'] + 1
+            if types is None or record['type'] in types:
+                records.append(record)
+        return {'session': session_id, 'records': records, 'next_seq': next_seq, 'has_more': has_more}
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+日志流统计模块
+
+在日志进入系统时增量维护统计计数，每秒生成一次紧凑的 stream_stats 快照：
+- 按平台、日志级别、标签统计的行数/秒和字节数/秒
+- 每个行为的命中次数/秒和命中率
+
+所有计数都保存在预分配的列表中，平台、级别、标签、行为在首次出现时分配固定槽位，
+每行日志的统计开销只是几次整数自增。标签和行为槽位用完后新的名称计入 "(other)"。
+行为按名称计数，与命中所在会话绑定的规则集版本无关（热更新前开始的导入、按其他配置回放的会话）。
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+
+LEVELS = ('V', 'D', 'I', 'W', 'E', 'F', '?')
+_LEVEL_INDEX = {level: i for i, level in enumerate(LEVELS)}
+_LEVEL_INDEX['A'] = _LEVEL_INDEX['F']  # logcat 的 Assert 级别按 Fatal 统计
+
+# Android / HarmonyOS: MM-DD HH:MM:SS.mmm PID TID LEVEL TAG: message
+_LOGCAT_PATTERN = re.compile(r'^\d{2}-\d{2}\s+\S+\s+\d+\s+\d+\s+([VDIWEFA])\s+([^:]{1,64}?)\s*:')
+
+OTHER_TAG = '(other)'
+
+
+class _Counters:
+    """一个统计周期内的计数器（预分配）"""
+
+    def __init__(self, max_platforms, max_tags, max_behaviors):
+        self.lines = [0] * max_platforms
+        self.bytes = [0] * max_platforms
+        self.level_lines = [0] * len(LEVELS)
+        self.tag_lines = [0] * max_tags
+        self.tag_bytes = [0] * max_tags
+        self.behavior_hits = [0] * max_behaviors
+
+    def reset(self):
+        for counters in (self.lines, self.bytes, self.level_lines, self.tag_lines, self.tag_bytes, self.behavior_hits):
+            counters[:] = [0] * len(counters)
+
+
+class StreamStats:
+    """增量维护的日志流统计引擎"""
+
+    def __init__(self, max_platforms=16, max_tags=256, max_behaviors=1024, history_seconds=300, top_tags=10):
+        """
+        参数:
+            max_platforms (int): 平台槽位数量
+            max_tags (int): 标签槽位数量（包含 "(other)"）
+            max_behaviors (int): 行为槽位数量（包含 "(other)"），按行为名称计数
+            history_seconds (int): 保留的每秒快照数量
+            top_tags (int): 快照中包含的标签数量（按行数排序）
+        """
+        self.max_platforms = max_platforms
+        self.max_tags = max_tags
+        self.max_behaviors = max_behaviors
+        self.top_tags = top_tags
+        self._platform_index = {}
+        self._platform_names = []
+        self._tag_index = {OTHER_TAG: 0}
+        self._tag_names = [OTHER_TAG]
+        self._behavior_index = {OTHER_TAG: 0}
+        self._behavior_names = [OTHER_TAG]
+        self._current = _Counters(max_platforms, max_tags, max_behaviors)
+        self._spare = _Counters(max_platforms, max_tags, max_behaviors)
+        self._period_start = time.time()
+        self._lock = threading.Lock()
+        self._running = False
+        self.history = deque(maxlen=history_seconds)
+
+    def _platform_slot(self, platform):
+        slot = self._platform_index.get(platform)
+        if slot is None:
+            if len(self._platform_names) >= self.max_platforms:
+                return self.max_platforms - 1
+            slot = len(self._platform_names)
+            self._platform_index[platform] = slot
+            self._platform_names.append(platform)
+        return slot
+
+    def _tag_slot(self, tag):
+        slot = self._tag_index.get(tag)
+        if slot is None:
+            if len(self._tag_names) >= self.max_tags:
+                return 0
+            slot = len(self._tag_names)
+            self._tag_index[tag] = slot
+            self._tag_names.append(tag)
+        return slot
+
+    def _behavior_slot(self, name):
+        slot = self._behavior_index.get(name)
+        if slot is None:
+            if len(self._behavior_names) >= self.max_behaviors:
+                return 0
+            slot = len(self._behavior_names)
+            self._behavior_index[name] = slot
+            self._behavior_names.append(name)
+        return slot
+
+    def record_line(self, platform, message):
+        """
+        统计一行日志
+
+        参数:
+            platform (str): 日志来源平台
+            message (str): 日志内容
+        """
+        size = len(message) if message.isascii() else len(message.encode('utf-8'))
+        match = _LOGCAT_PATTERN.match(message)
+        with self._lock:
+            counters = self._current
+            platform_slot = self._platform_slot(platform)
+            counters.lines[platform_slot] += 1
+            counters.bytes[platform_slot] += size
+            if match:
+                counters.level_lines[_LEVEL_INDEX[match.group(1)]] += 1
+                tag_slot = self._tag_slot(match.group(2))
+            else:
+                counters.level_lines[-1] += 1
+                tag_slot = 0
+            counters.tag_lines[tag_slot] += 1
+            counters.tag_bytes[tag_slot] += size
+
+    def record_hit(self, behavior_name):
+        """统计一次行为命中"""
+        with self._lock:
+            self._current.behavior_hits[self._behavior_slot(behavior_name)] += 1
+
+    def snapshot(self):
+        """
+        结束当前统计周期并生成快照，同时追加到历史记录
+
+        返回:
+            dict: 紧凑的每秒统计快照，只包含非零项
+        """
+        now = time.time()
+        with self._lock:
+            counters = self._current
+            self._current, self._spare = self._spare, counters
+            elapsed = max(now - self._period_start, 1e-6)
+            self._period_start = now
+            platform_names = list(self._platform_names)
+            tag_names = list(self._tag_names)
+            behavior_names = list(self._behavior_names)
+
+        total_lines = sum(counters.lines)
+        total_bytes = sum(counters.bytes)
+        platforms = {
+            name: [round(counters.lines[i] / elapsed, 1), round(counters.bytes[i] / elapsed, 1)]
+            for i, name in enumerate(platform_names) if counters.lines[i]
+        }
+        levels = {
+            level: round(counters.level_lines[i] / elapsed, 1)
+            for i, level in enumerate(LEVELS) if counters.level_lines[i]
+        }
+        busiest = sorted(
+            (i for i in range(len(tag_names)) if counters.tag_lines[i]),
+            key=lambda i: counters.tag_lines[i],
+            reverse=True
+        )[:self.top_tags]
+        tags = [
+            [tag_names[i], round(counters.tag_lines[i] / elapsed, 1), round(counters.tag_bytes[i] / elapsed, 1)]
+            for i in busiest
+        ]
+        total_hits = sum(counters.behavior_hits)
+        behaviors = {}
+        for i, hits in enumerate(counters.behavior_hits):
+            if hits:
+                behaviors[behavior_names[i]] = round(hits / elapsed, 2)
+        counters.reset()
+
+        snapshot = {
+            't': round(now, 3),
+            'lines_per_sec': round(total_lines / elapsed, 1),
+            'bytes_per_sec': round(total_bytes / elapsed, 1),
+            'platforms': platforms,   # {platform: [lines/sec, bytes/sec]}
+            'levels': levels,         # {level: lines/sec}
+            'tags': tags,             # [[tag, lines/sec, bytes/sec], ...]，按行数降序
+            'behaviors': behaviors,   # {behavior_name: hits/sec}
+            'hit_rate': round(total_hits / total_lines, 4) if total_lines else 0.0
+        }
+        self.history.append(snapshot)
+        return snapshot
+
+    def get_history(self, seconds=None):
+        """获取最近 seconds 秒的快照，默认返回全部历史"""
+        history = list(self.history)
+        if seconds:
+            history = history[-seconds:]
+        return history
+
+    def start(self, socketio, emit, interval=1.0):
+        """
+        启动每秒快照线程（重复调用无副作用）
+
+        参数:
+            socketio: Flask-SocketIO 实例，用于创建后台任务和休眠
+            emit (callable): 接收快照的回调，例如发送 stream_stats 事件
+            interval (float): 快照间隔（秒）
+        """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._period_start = time.time()
+
+        def run():
+            while self._running:
+                socketio.sleep(interval)
+                emit(self.snapshot())
+
+        socketio.start_background_task(run)
+
+    def stop(self):
+        """停止快照线程"""
+        self._running = False
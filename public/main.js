@@ -28,8 +28,17 @@ document.addEventListener('DOMContentLoaded', () => {
     const resetEventOrderButton = document.getElementById('reset-event-order');
     
     // 存储所有日志和行为日志的数组，用于导出功能
+    // 完整历史保存在服务器端（/api/logs），浏览器只保留最近 MAX_CLIENT_LOGS 条
+    const MAX_CLIENT_LOGS = 5000;
     let allLogs = [];
     let allBehaviorLogs = [];
+    // 每个历史会话最后收到的游标，用于去重和断线重连后续传
+    const lastCursors = {};
+    let currentSession = null;
+    
+    // 超过该大小的日志文件和压缩文件使用 /import-log/stream 流式导入（压缩文件由服务器解压）
+    const STREAM_IMPORT_THRESHOLD = 1024 * 1024;
+    const COMPRESSED_LOG_PATTERN = /\.(gz|zst|zip)$/i;
     
     // Configuration validation state
     let validationTimeout = null;
@@ -129,6 +138,37 @@ document.addEventListener('DOMContentLoaded', () => {
         // 显示加载中提示
         addLogMessage({ platform: 'system', message: `正在导入日志文件: ${file.name}...` });
         
+        // 大文件和压缩文件直接以请求体流式上传，浏览器不需要把文件读入内存
+        if (file.size >= STREAM_IMPORT_THRESHOLD || COMPRESSED_LOG_PATTERN.test(file.name)) {
+            const params = new URLSearchParams({ filename: file.name, platform: platformSelector.value });
+            fetch(`/import-log/stream?${params}`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                },
+                body: file,
+            })
+            .then(response => {
+                if (!response.ok) {
+                    // 服务器返回的消息包含具体原因，例如压缩包中可选的成员列表
+                    return response.json().catch(() => ({})).then(data => {
+                        throw new Error(data.message || `导入失败: ${response.status} ${response.statusText}`);
+                    });
+                }
+                return response.json();
+            })
+            .then(data => {
+                addLogMessage({ platform: 'system', message: `已创建导入任务 ${data.jobId}: ${file.name}` });
+                document.querySelector('.tab-button[data-tab="log-container"]').click();
+                importLogFileInput.value = '';
+            })
+            .catch(error => {
+                addLogMessage({ platform: 'system', message: `导入日志文件错误: ${error.message}` });
+                importLogFileInput.value = '';
+            });
+            return;
+        }
+        
         const reader = new FileReader();
         reader.onload = (e) => {
             const content = e.target.result;
@@ -152,8 +192,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 return response.json();
             })
             .then(data => {
-                // 显示导入成功消息
-                addLogMessage({ platform: 'system', message: `成功导入日志文件: ${file.name}, 共解析 ${data.lineCount} 行` });
+                // 导入在服务器后台执行，进度通过 import_progress 事件报告
+                addLogMessage({ platform: 'system', message: `已创建导入任务 ${data.jobId}: ${file.name}` });
                 
                 // 切换到日志标签页
                 document.querySelector('.tab-button[data-tab="log-container"]').click();
@@ -171,8 +211,15 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // 重复的configUploadInput事件监听器已删除
 
-    const addLogMessage = (log) => {
+    const addLogMessage = (log, fromReplay = false) => {
         const { platform, message } = log;
+        if (log.cursor && log.session) {
+            // 实时投递跳过已经显示过的记录；回放记录由 log_replay 按游标范围去重
+            if (!fromReplay && log.cursor <= (lastCursors[log.session] || 0)) {
+                return;
+            }
+            lastCursors[log.session] = Math.max(lastCursors[log.session] || 0, log.cursor);
+        }
         const platformClass = platform ? platform.toLowerCase() : 'system';
         const logEntry = document.createElement('div');
         logEntry.className = 'log-entry';
@@ -181,6 +228,10 @@ document.addEventListener('DOMContentLoaded', () => {
             <span class="log-message">${message.replace(/\n/g, '<br>')}</span>
         `;
         logContainer.appendChild(logEntry);
+        // 只保留最近的 DOM 节点，更早的记录可以通过 /api/logs 分页获取
+        while (logContainer.childElementCount > MAX_CLIENT_LOGS) {
+            logContainer.removeChild(logContainer.firstElementChild);
+        }
         if (isAutoScrollEnabled) {
             logContainer.scrollTop = logContainer.scrollHeight; // Auto-scroll
         }
@@ -192,8 +243,47 @@ document.addEventListener('DOMContentLoaded', () => {
             platform: platform || 'System',
             message: message
         });
+        if (allLogs.length > MAX_CLIENT_LOGS) {
+            allLogs.splice(0, allLogs.length - MAX_CLIENT_LOGS);
+        }
     };
 
+    // 正在回放的会话 -> 回放截止游标（收到 history_info 时的最新游标），之后的记录由实时投递补齐
+    const replayTargets = {};
+
+    // 服务器告知当前会话后，从最后收到的游标续传；新标签页只回放最近 MAX_CLIENT_LOGS 条
+    socket.on('history_info', (info) => {
+        currentSession = info.session;
+        const session = (info.sessions || []).find(item => item.session === currentSession);
+        if (!session || !session.latest_cursor) {
+            return;
+        }
+        const known = lastCursors[currentSession] || 0;
+        if (known >= session.latest_cursor) {
+            return;
+        }
+        replayTargets[currentSession] = session.latest_cursor;
+        const cursor = known || Math.max(0, session.latest_cursor - MAX_CLIENT_LOGS);
+        socket.emit('resume', { session: currentSession, cursor });
+    });
+
+    socket.on('log_replay', (page) => {
+        if (page.error) {
+            delete replayTargets[page.session];
+            addLogMessage({ platform: 'system', message: `日志续传失败: ${page.error}` });
+            return;
+        }
+        const target = replayTargets[page.session] || page.latest_cursor;
+        page.records
+            .filter(record => record.cursor <= target)
+            .forEach(record => addLogMessage(record, true));
+        if (page.has_more && page.next_cursor < target) {
+            socket.emit('resume', { session: page.session, cursor: page.next_cursor });
+        } else {
+            delete replayTargets[page.session];
+        }
+    });
+
     socket.on('connect', () => {
         addLogMessage({ platform: 'system', message: 'Connected to log server.' });
     });
@@ -206,8 +296,93 @@ document.addEventListener('DOMContentLoaded', () => {
         addLogMessage(log);
     });
 
+    // 原始日志按批次投递，dropped 表示服务器在压力下丢弃的行数
+    socket.on('log_batch', (batch) => {
+        batch.lines.forEach(line => addLogMessage(line));
+        if (batch.dropped > 0) {
+            addLogMessage({ platform: 'system', message: `日志流量过大，已丢弃 ${batch.dropped} 行原始日志（行为分析不受影响）` });
+        }
+        const suppressed = formatSuppressed(batch.suppressed);
+        if (suppressed) {
+            addLogMessage({ platform: 'system', message: `投递策略已抑制原始日志: ${suppressed}（行为分析不受影响）` });
+        }
+    });
+
+    // 投递策略抑制原因的显示名称
+    const SUPPRESS_REASONS = {
+        rate_limit: '总速率限制',
+        tag_limit: '标签速率限制',
+        sampled: '重复标签采样',
+        behaviors_only: '仅行为模式'
+    };
+
+    function formatSuppressed(suppressed) {
+        return Object.entries(suppressed || {})
+            .filter(([, count]) => count > 0)
+            .map(([reason, count]) => `${SUPPRESS_REASONS[reason] || reason} ${count} 行`)
+            .join(', ');
+    }
+
+    // 投递模式切换（输入速率过高时自动进入仅行为模式）
+    socket.on('delivery_mode', (report) => {
+        const suppressed = formatSuppressed(report.suppressed);
+        if (report.changed) {
+            const mode = report.mode === 'behaviors_only' ? '仅行为模式（暂停原始日志投递）' : '正常模式';
+            addLogMessage({ platform: 'system', message: `日志输入速率 ${report.input_rate} 行/秒，已切换到${mode}` });
+        }
+        if (suppressed) {
+            addLogMessage({ platform: 'system', message: `投递策略已抑制原始日志: ${suppressed}（行为分析不受影响）` });
+        }
+    });
+
+    // 规则集缓存：行为事件只携带规则集版本和行为索引，按版本获取一次完整配置后缓存
+    const rulesetCache = {};
+    // 行为相关事件按到达顺序渲染，避免首次获取规则集时打乱顺序
+    let behaviorRenderQueue = Promise.resolve();
+    // 客户端按分析会话维护的已触发事件序列 {base, events}，由 event_order_violation 的增量拼接而成，
+    // base 为 events[0] 在完整序列中的位置（与服务器一样只保留最近的事件）
+    const currentOrders = {};
+    const ORDER_HISTORY = 1000;
+
+    function fetchRuleset(version) {
+        if (!version) {
+            return Promise.resolve(null);
+        }
+        if (!rulesetCache[version]) {
+            rulesetCache[version] = fetch(`/api/ruleset?version=${encodeURIComponent(version)}`)
+                .then(response => response.ok ? response.json() : null)
+                .then(result => result ? result.config : null)
+                .catch(() => null);
+        }
+        return rulesetCache[version];
+    }
+
+    function withRuleset(version, render) {
+        behaviorRenderQueue = behaviorRenderQueue
+            .then(() => fetchRuleset(version))
+            .then(render)
+            .catch(err => console.error('渲染行为事件失败:', err));
+    }
+
+    // 与服务器 load_config 相同的事件顺序分组规则
+    function getEventOrderGroups(config) {
+        const groups = [];
+        ((config && config.event_order) || []).forEach(item => {
+            groups.push(Array.isArray(item) ? item : [item]);
+        });
+        return groups;
+    }
+
     socket.on('behavior_triggered', (data) => {
-        const { behavior, log, validationResults } = data;
+        withRuleset(data.rulesetVersion, (ruleset) => {
+            const behaviors = (ruleset && ruleset.behaviors) || [];
+            const behavior = data.behavior || behaviors[data.behaviorId] || { name: data.behaviorName, description: '' };
+            renderBehaviorTriggered(behavior, data);
+        });
+    });
+
+    function renderBehaviorTriggered(behavior, data) {
+        const { log, validationResults } = data;
         const behaviorEntry = document.createElement('div');
         
         // 检查是否有验证错误
@@ -254,7 +429,7 @@ document.addEventListener('DOMContentLoaded', () => {
             log: log,
             validationResults: validationResults
         });
-    });
+    }
     
     // 获取并显示当前配置内容
     function fetchAndDisplayConfig() {
@@ -274,9 +449,49 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
     
+    // 配置文件在服务器端热更新后刷新配置显示（新规则集由 /api/ruleset 按版本获取）
+    socket.on('ruleset_updated', () => {
+        fetchAndDisplayConfig();
+    });
+    
     // 处理事件顺序违规事件
     socket.on('event_order_violation', (data) => {
-        const { violation, current_order, expected_order, all_groups } = data;
+        withRuleset(data.rulesetVersion, (ruleset) => {
+            const sessionKey = data.session || 'default';
+            const currentOrder = currentOrders[sessionKey] || (currentOrders[sessionKey] = { base: 0, events: [] });
+            if (data.order_resync || data.order_offset > currentOrder.base + currentOrder.events.length) {
+                // 中途连接或增量被截断导致缺口（或序列被重新编号），从服务器重新同步该会话保留的序列
+                const query = data.session ? `?session=${encodeURIComponent(data.session)}` : '';
+                return fetch(`/api/event-order${query}`)
+                    .then(response => response.json())
+                    .then(result => {
+                        currentOrders[sessionKey] = { base: result.order_base || 0, events: result.current_order || [] };
+                        renderEventOrderViolation(ruleset, data, currentOrders[sessionKey]);
+                    });
+            }
+            if (data.order_offset < currentOrder.base) {
+                // 重置后起始位置回到 0，丢弃本地序列
+                currentOrder.base = data.order_offset;
+                currentOrder.events = [];
+            }
+            // 增量起始位置不超过本地序列末尾时截断后直接拼接
+            currentOrder.events.length = Math.min(currentOrder.events.length, data.order_offset - currentOrder.base);
+            currentOrder.events.push(...data.order_delta);
+            if (currentOrder.events.length > ORDER_HISTORY) {
+                const dropped = currentOrder.events.length - ORDER_HISTORY;
+                currentOrder.events.splice(0, dropped);
+                currentOrder.base += dropped;
+            }
+            renderEventOrderViolation(ruleset, data, currentOrder);
+        });
+    });
+
+    function renderEventOrderViolation(ruleset, data, currentOrder) {
+        const { violation } = data;
+        const all_groups = getEventOrderGroups(ruleset);
+        const expected_order = all_groups[data.group_index] || [];
+        // 更早的事件已丢弃时以省略号开头
+        const current_order = (currentOrder.base > 0 ? ['…'] : []).concat(currentOrder.events);
         const violationEntry = document.createElement('div');
         violationEntry.className = 'log-entry event-order-violation';
         
@@ -320,7 +535,7 @@ document.addEventListener('DOMContentLoaded', () => {
             expected_order: expected_order,
             all_groups: all_groups
         });
-    });
+    }
     
     // 处理事件组完成事件
     socket.on('event_group_completed', (data) => {
@@ -354,12 +569,67 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
     
+    // 导入任务进度：每个任务最多每 IMPORT_PROGRESS_LOG_INTERVAL 毫秒显示一次
+    const IMPORT_PROGRESS_LOG_INTERVAL = 5000;
+    const importProgressLogged = {};
+    socket.on('import_progress', (progress) => {
+        if (progress.status !== 'running' || !progress.lines) {
+            return;
+        }
+        const now = Date.now();
+        if (now - (importProgressLogged[progress.job_id] || 0) < IMPORT_PROGRESS_LOG_INTERVAL) {
+            return;
+        }
+        importProgressLogged[progress.job_id] = now;
+        const percent = progress.percent !== null ? ` (${(progress.percent * 100).toFixed(1)}%)` : '';
+        const eta = progress.eta_seconds !== null ? `, 预计剩余 ${Math.ceil(progress.eta_seconds)} 秒` : '';
+        addLogMessage({
+            platform: 'system',
+            message: `导入任务 ${progress.job_id}: 已处理 ${progress.lines} 行${percent}, ${progress.lines_per_sec} 行/秒${eta}`
+        });
+    });
+    
+    socket.on('import_complete', (job) => {
+        delete importProgressLogged[job.job_id];
+        const statusText = { completed: '已完成', cancelled: '已取消', failed: '失败' }[job.status] || job.status;
+        const error = job.error ? `: ${job.error}` : '';
+        addLogMessage({
+            platform: 'system',
+            message: `导入任务 ${job.job_id} ${statusText}${error} (${job.filename}, ${job.lines} 行, 用时 ${job.elapsed} 秒)`
+        });
+    });
+
+    // 回放任务进度与完成报告（各阶段耗时通过 /api/replay/<id> 获取）
+    const replayProgressLogged = {};
+    socket.on('replay_progress', (progress) => {
+        const now = Date.now();
+        if (now - (replayProgressLogged[progress.replay_id] || 0) < IMPORT_PROGRESS_LOG_INTERVAL) {
+            return;
+        }
+        replayProgressLogged[progress.replay_id] = now;
+        addLogMessage({
+            platform: 'system',
+            message: `回放 ${progress.replay_id}: 已处理 ${progress.lines} 行, ${progress.lines_per_sec} 行/秒`
+        });
+    });
+
+    socket.on('replay_complete', (replay) => {
+        delete replayProgressLogged[replay.replay_id];
+        const statusText = { completed: '已完成', cancelled: '已取消', failed: '失败' }[replay.status] || replay.status;
+        const error = replay.error ? `: ${replay.error}` : '';
+        const analysis = replay.stages.analysis;
+        addLogMessage({
+            platform: 'system',
+            message: `回放 ${replay.replay_id} ${statusText}${error} (${replay.lines} 行, ${replay.lines_per_sec} 行/秒, 分析 p95 ${analysis.p95_ms} ms)`
+        });
+    });
+    
     // 监听最终检查结果事件
     socket.on('final_check_results', (results) => {
         // 创建结果摘要
         let summaryClass = results.status === 'success' ? 'success' : 'warning';
         let summaryMessage = `<div class="check-result ${summaryClass}">
-            <h4>日志文件最终检查结果</h4>
+            <h4>${results.kind === 'es' ? 'ES搜索最终检查结果' : '日志文件最终检查结果'}</h4>
             <p>${results.message}</p>
         </div>`;
         
@@ -1123,6 +1393,7 @@ document.addEventListener('DOMContentLoaded', () => {
 class ElasticsearchSearch {
     constructor() {
         this.searching = false;
+        this.jobId = null;
         this.initializeElements();
         this.initializeEventListeners();
         this.initializeSocketHandlers();
@@ -1166,12 +1437,17 @@ class ElasticsearchSearch {
     initializeSocketHandlers() {
         // 监听搜索进度更新
         if (window.socket) {
+            // 搜索事件只发送到本客户端所在的任务房间，这里再按任务ID过滤一次（兼容广播）
             window.socket.on('es_search_progress', (data) => {
-                this.updateProgress(data);
+                if (!data.job_id || data.job_id === this.jobId) {
+                    this.updateProgress(data);
+                }
             });
             
             window.socket.on('es_search_complete', (data) => {
-                this.handleSearchComplete(data);
+                if (!data.job_id || data.job_id === this.jobId) {
+                    this.handleSearchComplete(data);
+                }
             });
             
             // 监听Elasticsearch日志消息
@@ -1222,7 +1498,8 @@ class ElasticsearchSearch {
             platform: 'elasticsearch',
             env: this.envSelect.value || 'sandbox',
             log_param: (this.logParamInput && this.logParamInput.value.trim()) || '',
-            request_id: requestId
+            request_id: requestId,
+            sid: window.socket ? window.socket.id : undefined
         };
         
         // 转换为ISO格式时间
@@ -1253,7 +1530,8 @@ class ElasticsearchSearch {
             const result = await response.json();
             
             if (result.success) {
-                this.showMessage(`搜索已启动: ${result.message}`, 'success');
+                this.jobId = result.job_id || null;
+                this.showMessage(`搜索已启动: ${result.message}${this.jobId ? ` (任务 ${this.jobId})` : ''}`, 'success');
             } else {
                 this.showMessage(`搜索启动失败: ${result.message}`, 'error');
                 this.setSearchingState(false);
@@ -1267,7 +1545,11 @@ class ElasticsearchSearch {
     async stopSearch() {
         try {
             const response = await fetch('/api/es/search/stop', {
-                method: 'POST'
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ job_id: this.jobId })
             });
             
             const result = await response.json();
@@ -1335,12 +1617,17 @@ class ElasticsearchSearch {
     }
     
     updateProgress(data) {
+        if (data.status === 'queued') {
+            this.showMessage('搜索任务排队中，等待其他搜索完成...', 'info');
+            return;
+        }
         const progress = Math.round(data.progress * 100);
         this.showMessage(`搜索进度: ${progress}% (${data.processed}/${data.total})`, 'info');
     }
     
     handleSearchComplete(data) {
         this.setSearchingState(false);
+        this.jobId = null;
         
         if (data.success) {
             this.showMessage(`搜索完成: ${data.message}`, 'success');
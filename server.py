@@ -18,19 +18,46 @@
 
 import re
 import json
+import atexit
+import io
+import tempfile
 import yaml
 import os
 import subprocess
 import threading
 import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
 from flask import Flask, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
-import jsonschema
-from jsonschema import validate, ValidationError
 
 # 导入Elasticsearch搜索服务
 from ep_py.es_search_service import get_es_search_service
+# 导入分级投递调度器
+from ep_py.delivery import DeliveryDispatcher
+# 导入服务器端日志历史存储
+from ep_py.log_history import LogHistory
+# 导入原始日志投递策略（限速、采样、仅行为模式）
+from ep_py.delivery_policy import DeliveryPolicyRegistry
+# 导入日志流统计引擎
+from ep_py.stream_stats import StreamStats
+# 导入后台导入任务管理
+from ep_py.import_jobs import ImportJobManager
+# 导入行为匹配引擎（预编译的无状态匹配、提取和验证，支持多进程并行）
+from ep_py.behavior_engine import CompiledRuleset, MatchPoolRegistry, iter_parallel_matches, resolve_workers
+# 配置编译流程（预编译的 Schema 验证器，验证和匹配共用同一次正则编译）
+from ep_py.config_compiler import compile_config, compile_config_file, validate_structure
+# 导入分析会话（每个会话独立的规则集绑定、事件追踪和实时收集资源）
+from ep_py.analysis_session import AnalysisSessionRegistry
+# 配置文件监视（热更新规则集）
+from ep_py.config_watcher import ConfigWatcher
+# 实时收集会话录制（只追加的磁盘数据段 + 稀疏索引）
+from ep_py.session_recorder import RECORD_TYPES, SessionRecorder
+# 导入压缩日志和压缩包来源支持
+from ep_py.log_sources import LogSourceError, expand_log_paths, open_log_lines, open_log_source
+# 日志回放（按原始时间、倍速或最大速度重新送入处理流程）
+from ep_py.replay import ReplayJob, ReplayManager, parse_log_time, parse_speed, run_replay
 
 # Elasticsearch搜索服务实例
 es_search_service = None
@@ -39,133 +66,225 @@ es_search_service = None
 app = Flask(__name__, static_folder='public')
 CORS(app)  # 启用跨域资源共享
 socketio = SocketIO(app, cors_allowed_origins="*")  # WebSocket 服务器
+delivery = DeliveryDispatcher(socketio)  # 按客户端分级投递事件，分析事件优先于原始日志
+log_history = LogHistory()  # 按会话保存最近日志，支持游标分页回放
+delivery_policies = DeliveryPolicyRegistry()  # 按会话的原始日志投递策略，不影响行为分析
+stream_stats = StreamStats()  # 日志流统计，每秒发送一次 stream_stats 快照
+import_jobs = ImportJobManager(lambda job: run_import_job(job), delivery.emit)  # 后台导入任务队列
+analysis_sessions = AnalysisSessionRegistry(delivery.emit, on_hit=stream_stats.record_hit)  # 分析会话和当前规则集
+config_watcher = ConfigWatcher(lambda path: hot_reload_config(path))  # 配置文件变化后在后台重新加载
+session_recorder = SessionRecorder()  # 把实时收集的日志和分析事件录制到磁盘，由后台线程写入
+replay_jobs = ReplayManager(lambda job: run_replay_job(job), delivery.emit)  # 录制、历史会话和本地文件的回放任务
+match_pools = MatchPoolRegistry()  # 并行导入的匹配进程池，按规则集长期保留
+
+# 行为配置文件，可以通过环境变量指定其他配置（例如 config_minigame.yaml）
+CONFIG_FILE = os.environ.get('CONFIG_FILE', 'config.yaml')
+SCHEMA_FILE = 'config_schema.json'
+
+# 上传内容超过该大小时写入磁盘临时文件，否则保存在内存中
+IMPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+# 导入过程中每处理该数量的行报告一次进度并检查取消请求
+IMPORT_PROGRESS_LINES = 1000
 
 # 服务器端口配置
 PORT = int(os.environ.get('PORT', 3000))
 
 # 全局变量
-log_process = None          # 主日志进程
-grep_process = None         # grep 过滤进程
-behavior_config = {'behaviors': []}  # 行为配置
-logging_active = False      # 日志流控制标志
-log_threads = []            # 活跃线程列表
+# 行为配置、事件追踪状态和实时收集进程都属于各自的分析会话（analysis_sessions），这里只保留服务器级别的状态
+current_session_id = 'default'  # 最近开始的日志会话ID（实时收集或导入），新客户端从该会话回放历史
+
+# 规则集版本相关变量
+# 行为触发事件只携带行为索引和规则集版本，客户端通过 /api/ruleset 按版本获取并缓存完整配置
+ruleset_history = {}        # 最近的规则集版本 -> 配置，用于解析旧版本事件
+MAX_RULESET_HISTORY = 8     # 保留的规则集版本数量
+import_settings = {}        # 导入配置（globalSettings.imports）
+es_search_settings = {}     # Elasticsearch 搜索任务配置（globalSettings.esSearch）
+config_lock = threading.Lock()  # 串行化规则集发布（配置更新接口和配置文件监视线程）
+
+def start_history_session(prefix):
+    """
+    开始新的日志历史会话并通知所有客户端
+    
+    参数:
+        prefix (str): 会话ID前缀（平台名称或 import）
+    
+    返回:
+        str: 新会话ID
+    """
+    global current_session_id
+    current_session_id = f'{prefix}-{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:6]}'
+    delivery.emit('history_info', {'session': current_session_id, 'sessions': log_history.sessions()})
+    return current_session_id
+
+def publish_log(platform, message, session_id=None):
+    """
+    记录一条原始日志到历史存储并投递给客户端
+    
+    投递的日志数据携带会话ID和游标，客户端据此去重并在重连后续传。
+    
+    参数:
+        platform (str): 日志来源平台
+        message (str): 日志内容
+        session_id (str, optional): 会话ID，默认为当前会话
+    """
+    session_id = session_id or current_session_id
+    cursor = log_history.append(session_id, platform, message)
+    stream_stats.record_line(platform, message)
+    session_recorder.record(session_id, 'log', {'platform': platform, 'message': message, 'cursor': cursor})
+    
+    # 投递策略只决定是否发送原始日志，历史记录和行为分析始终处理每一行
+    admitted, suppressed, report = delivery_policies.get(session_id).admit(message)
+    if report:
+        report['session'] = session_id
+        delivery.emit('delivery_mode', report)
+    if not admitted:
+        return
+    log_data = {'platform': platform, 'message': message, 'session': session_id, 'cursor': cursor}
+    if suppressed:
+        log_data['suppressed'] = suppressed
+    delivery.emit('log', log_data)
 
-# 事件顺序检查相关变量
-triggered_events = []       # 已触发的事件列表，用于顺序检查
-event_order_config = []     # 事件顺序配置（扁平列表）
-event_order_groups = []    # 事件顺序分组配置（二维数组）
+# 实时收集会话录制的分析事件（behavior_triggered 录制为 hit，其余为 event）
+RECORDED_EVENTS = ('behavior_triggered', 'event_order_violation', 'event_group_completed', 'event_group_incomplete')
 
-# 事件组检查相关变量
-event_group_config = []    # 事件组配置（二维数组）
-event_group_status = {}    # 事件组状态，记录每个组中已触发的事件
+def emit_live_event(session, event, data):
+    """
+    发送实时收集会话的事件，会话正在录制时同时录制分析事件
+    
+    参数:
+        session (AnalysisSession): 实时收集会话
+        event (str): 事件名称
+        data (dict): 事件数据
+    """
+    delivery.emit(event, data)
+    if event in RECORDED_EVENTS:
+        session_recorder.record(session.history_session, 'hit' if event == 'behavior_triggered' else 'event',
+                                {'event': event, 'data': data})
+
+def publish_ruleset(config):
+    """
+    编译并发布规则集
+    
+    版本号为配置内容规范化 JSON 的 SHA-1 前 12 位，配置不变时版本号不变。
+    之后创建的分析会话绑定新规则集，实时收集会话切换到新规则集（保留已触发的事件），
+    进行中的导入继续使用开始时的规则集。
+    
+    参数:
+        config (dict or CompiledRuleset): 行为配置或已编译的规则集
+    
+    返回:
+        CompiledRuleset: 编译后的规则集
+    """
+    ruleset = config if isinstance(config, CompiledRuleset) else CompiledRuleset(config)
+    analysis_sessions.publish(ruleset)
+    match_pools.publish(ruleset.version)
+    ruleset_history.pop(ruleset.version, None)
+    ruleset_history[ruleset.version] = ruleset.config
+    while len(ruleset_history) > MAX_RULESET_HISTORY:
+        ruleset_history.pop(next(iter(ruleset_history)))
+    return ruleset
 
 # 配置管理相关函数
+def apply_config(ruleset):
+    """
+    发布规则集并应用其中的全局设置
+    
+    规则集通过一次引用替换发布，实时收集会话在各自的锁内切换：
+    正在分析的一行按旧规则集处理完，之后的日志按新规则集处理，已有的事件状态按行为名称迁移。
+    
+    参数:
+        ruleset (CompiledRuleset): 已编译的规则集
+    """
+    global import_settings, es_search_settings
+    with config_lock:
+        publish_ruleset(ruleset)
+        
+        # 应用分级投递配置（通道权重、批次大小、队列上限）、日志历史容量、导入和配置监视配置
+        global_settings = ruleset.config.get('globalSettings') or {}
+        delivery.configure(global_settings.get('delivery'))
+        delivery_policies.configure((global_settings.get('delivery') or {}).get('policy'))
+        log_history.configure(global_settings.get('history'))
+        session_recorder.configure(global_settings.get('recording'))
+        import_settings = global_settings.get('imports') or {}
+        import_jobs.configure(import_settings)
+        es_search_settings = global_settings.get('esSearch') or {}
+        if es_search_service:
+            es_search_service.configure(es_search_settings)
+        config_watcher.configure(global_settings.get('configWatch'))
+
 def load_config():
     """
     加载行为配置文件
     
-    从 config.yaml 文件中加载行为配置，并进行结构验证。
+    从 CONFIG_FILE（默认 config.yaml）中加载行为配置，并进行结构验证。
     如果加载失败，将使用默认的空配置。
     
-    全局变量:
-        behavior_config: 存储加载的行为配置
-        event_order_config: 存储事件顺序配置（扁平列表）
-        event_order_groups: 存储事件顺序分组配置（二维数组）
-        event_group_config: 存储事件组配置（二维数组）
-        event_group_status: 存储事件组状态
+    加载的配置编译为规则集并发布到 analysis_sessions，
+    实时收集会话按新配置迁移事件顺序和事件组状态。
     
     异常处理:
         - 文件不存在或读取失败
         - YAML 解析错误
-        - 配置结构验证失败
+        - 配置结构验证失败（只打印警告，仍然加载）
     """
-    global behavior_config, event_order_config, event_order_groups, event_group_config, event_group_status
+    config_watcher.watch(CONFIG_FILE)
     try:
-        # 读取 YAML 配置文件
-        with open('config.yaml', 'r', encoding='utf-8') as f:
-            config_data = yaml.safe_load(f) or {}
-        
-        behavior_config = config_data
-        
-        # 处理事件顺序配置，支持分组
-        event_order_raw = config_data.get('event_order', [])
-        event_order_groups = []
-        event_order_config = []
-        
-        # 如果配置是二维数组（分组），则处理分组
-        if event_order_raw and isinstance(event_order_raw, list):
-            for item in event_order_raw:
-                if isinstance(item, list):
-                    # 这是一个分组
-                    event_order_groups.append(item)
-                    # 同时将分组中的事件添加到扁平列表中，用于向后兼容
-                    event_order_config.extend(item)
-                else:
-                    # 单个事件，添加到扁平列表
-                    event_order_config.append(item)
-                    # 同时创建一个只包含这个事件的分组
-                    event_order_groups.append([item])
-        
-        # 处理事件组配置
-        event_group_raw = config_data.get('event_group', [])
-        event_group_config = []
-        event_group_status = {}
-        
-        # 处理事件组配置
-        if event_group_raw and isinstance(event_group_raw, list):
-            for i, group in enumerate(event_group_raw):
-                # 处理新格式的事件组配置（带有name和events字段）
-                if isinstance(group, dict) and 'events' in group:
-                    events = group['events']
-                    event_group_config.append(events)
-                    # 初始化事件组状态，记录每个组中已触发的事件
-                    group_id = f'group_{i}'
-                    # 使用配置中的名称，如果没有则生成一个
-                    if 'name' in group and group['name']:
-                        group_name = group['name']
-                    else:
-                        # 生成事件组名称，使用组内事件名称的组合
-                        group_name = "事件组: " + ", ".join([event[:10] + "..." if len(event) > 10 else event for event in events[:2]])
-                        if len(events) > 2:
-                            group_name += f" 等{len(events)}个事件"
-                    event_group_status[group_id] = {
-                        'events': events,
-                        'triggered': [],
-                        'completed': False,
-                        'name': group_name
-                    }
-                # 处理旧格式的事件组配置（直接是事件列表）
-                elif isinstance(group, list):
-                    event_group_config.append(group)
-                    # 初始化事件组状态，记录每个组中已触发的事件
-                    group_id = f'group_{i}'
-                    # 生成事件组名称，使用组内事件名称的组合
-                    group_name = "事件组: " + ", ".join([event[:10] + "..." if len(event) > 10 else event for event in group[:2]])
-                    if len(group) > 2:
-                        group_name += f" 等{len(group)}个事件"
-                    event_group_status[group_id] = {
-                        'events': group,
-                        'triggered': [],
-                        'completed': False,
-                        'name': group_name
-                    }
-
-        # 验证配置结构
-        validate_config_structure(behavior_config)
+        # 读取、验证并编译配置文件（Schema 验证器和正则表达式都只编译一次）
+        compilation = compile_config_file(CONFIG_FILE, SCHEMA_FILE)
+        if compilation.ruleset is None:
+            raise ValueError(compilation.parse_error)
+        if not compilation.valid:
+            print(f'Warning: {CONFIG_FILE}: {compilation.error_message()}')
+        apply_config(compilation.ruleset)
+        print(f'Loaded {CONFIG_FILE}: ruleset {compilation.ruleset.version}, timings (ms) {compilation.timings}')
     except Exception as e:
-        print(f'Error reading or parsing config.yaml: {e}')
+        print(f'Error reading or parsing {CONFIG_FILE}: {e}')
         # 使用默认空配置
-        behavior_config = {'behaviors': []}
-        event_order_config = []
-        event_order_groups = []
-        event_group_config = []
-        event_group_status = {}
+        publish_ruleset({'behaviors': []})
+
+def hot_reload_config(path):
+    """
+    重新加载发生变化的配置文件（配置文件监视线程和 /reload-config 调用）
+    
+    新配置在调用线程中验证和编译，日志读取线程不会暂停；
+    验证失败时保留当前规则集，只发送错误日志。
+    内容不变（版本号相同）时不发布。
+    
+    参数:
+        path (str): 配置文件路径
+    
+    返回:
+        tuple: (是否发布了新规则集, 错误信息或 None)
+    """
+    compilation = compile_config_file(path, SCHEMA_FILE)
+    if not compilation.valid:
+        message = (f'Configuration reload rejected ({os.path.basename(path)}), '
+                   f'keeping ruleset {analysis_sessions.ruleset.version}: {compilation.error_message()}')
+        delivery.emit('log', {'platform': 'system', 'message': message})
+        return False, compilation.error_message()
+    ruleset = compilation.ruleset
+    if ruleset.version == analysis_sessions.ruleset.version:
+        return False, None
+    previous_version = analysis_sessions.ruleset.version
+    apply_config(ruleset)
+    delivery.emit('ruleset_updated', {
+        'rulesetVersion': ruleset.version,
+        'previousVersion': previous_version,
+        'source': os.path.basename(path),
+        'timings': compilation.timings
+    })
+    delivery.emit('log', {
+        'platform': 'system',
+        'message': f'Configuration reloaded from {os.path.basename(path)}: ruleset {previous_version} -> {ruleset.version}'
+    })
+    return True, None
 
 def validate_config_structure(config):
     """
     验证配置结构是否符合 JSON Schema
     
     使用 config_schema.json 文件中定义的 JSON Schema 来验证配置结构的有效性。
+    Schema 只在首次使用和文件修改后读取并编译，之后直接使用预编译的验证器。
     
     参数:
         config (dict): 需要验证的配置字典
@@ -180,269 +299,7 @@ def validate_config_structure(config):
         - FileNotFoundError: Schema 文件不存在
         - 其他异常: 通用错误处理
     """
-    try:
-        # 读取 JSON Schema 文件
-        with open('config_schema.json', 'r', encoding='utf-8') as f:
-            schema = json.load(f)
-        # 使用 jsonschema 库验证配置
-        validate(instance=config, schema=schema)
-        return True, None
-    except ValidationError as e:
-        return False, f"Configuration validation error: {e.message}"
-    except FileNotFoundError:
-        print("Warning: config_schema.json not found, skipping schema validation")
-        return True, None
-    except Exception as e:
-        return False, f"Schema validation error: {str(e)}"
-
-def validate_data_by_type(data, data_type, validation_rules=None):
-    """
-    根据指定类型和规则验证数据
-    
-    支持多种数据类型的验证，包括 JSON、数字、布尔值和文本。
-    可以应用额外的验证规则，如 JSON Schema、数值范围、字符串长度等。
-    
-    参数:
-        data: 需要验证的原始数据
-        data_type (str): 数据类型 ('json', 'number', 'boolean', 'text')
-        validation_rules (dict, optional): 额外的验证规则
-    
-    返回:
-        tuple: (是否有效, 解析后的数据, 错误信息)
-            - (True, parsed_data, None): 验证通过
-            - (False, None, error_message): 验证失败
-    
-    支持的验证规则:
-        - jsonSchema: JSON 数据的 Schema 验证
-        - numberRange: 数值范围验证 (min, max)
-        - stringLength: 字符串长度验证 (min, max)
-    """
-    try:
-        if data_type == 'json':
-            # JSON 数据类型处理
-            if isinstance(data, str):
-                parsed_data = json.loads(data)  # 解析 JSON 字符串
-            else:
-                parsed_data = data
-            
-            # 应用 JSON Schema 验证（如果提供）
-            if validation_rules and 'jsonSchema' in validation_rules:
-                socketio.emit('log', {
-                    'platform': 'system',
-                    'message': f'开始进行JSON Schema验证: {json.dumps(parsed_data, ensure_ascii=False)[:100]}...'
-                })
-                
-                # 检查是否有module字段，并记录其类型
-                if 'properties' in parsed_data and 'module' in parsed_data['properties']:
-                    module_value = parsed_data['properties']['module']
-                    module_type = type(module_value).__name__
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'JSON Schema验证前检查: module字段值={module_value}, 类型={module_type}'
-                    })
-                    
-                    # 检查schema中module字段的定义
-                    if 'properties' in validation_rules['jsonSchema'] and \
-                       'properties' in validation_rules['jsonSchema']['properties'] and \
-                       'module' in validation_rules['jsonSchema']['properties']['properties']['properties']:
-                        module_schema = validation_rules['jsonSchema']['properties']['properties']['properties']['module']
-                        socketio.emit('log', {
-                            'platform': 'system',
-                            'message': f'Schema中module字段定义: {json.dumps(module_schema, ensure_ascii=False)}'
-                        })
-                
-                try:
-                    validate(instance=parsed_data, schema=validation_rules['jsonSchema'])
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'JSON Schema验证通过'
-                    })
-                except ValidationError as e:
-                    error_path = '.'.join(str(p) for p in e.path)
-                    error_message = f'JSON Schema验证失败: 路径 {error_path}, 错误: {e.message}'
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': error_message
-                    })
-                    return False, None, error_message
-            return True, parsed_data, None
-            
-        elif data_type == 'number':
-            # 数字类型处理
-            if isinstance(data, str):
-                num_data = float(data)  # 字符串转浮点数
-            else:
-                num_data = float(data)  # 确保为浮点数类型
-            
-            # 应用数值范围验证（如果提供）
-            if validation_rules and 'numberRange' in validation_rules:
-                range_rules = validation_rules['numberRange']
-                # 检查最小值
-                if 'min' in range_rules and num_data < range_rules['min']:
-                    return False, None, f"Number {num_data} is below minimum {range_rules['min']}"
-                # 检查最大值
-                if 'max' in range_rules and num_data > range_rules['max']:
-                    return False, None, f"Number {num_data} is above maximum {range_rules['max']}"
-            return True, num_data, None
-            
-        elif data_type == 'boolean':
-            # 布尔类型处理
-            if isinstance(data, str):
-                # 字符串转布尔值，支持多种表示方式
-                bool_data = data.lower() in ('true', '1', 'yes', 'on')
-            else:
-                bool_data = bool(data)  # 直接转换为布尔值
-            return True, bool_data, None
-            
-        elif data_type == 'text':
-            # 文本类型处理
-            str_data = str(data)  # 转换为字符串
-            # 应用字符串长度验证（如果提供）
-            if validation_rules and 'stringLength' in validation_rules:
-                length_rules = validation_rules['stringLength']
-                # 检查最小长度
-                if 'min' in length_rules and len(str_data) < length_rules['min']:
-                    return False, None, f"String length {len(str_data)} is below minimum {length_rules['min']}"
-                # 检查最大长度
-                if 'max' in length_rules and len(str_data) > length_rules['max']:
-                    return False, None, f"String length {len(str_data)} is above maximum {length_rules['max']}"
-            return True, str_data, None
-            
-        else:
-            # 未知类型，直接返回原数据
-            return True, data, None
-            
-    except json.JSONDecodeError as e:
-        return False, None, f"Invalid JSON format: {str(e)}"
-    except ValueError as e:
-        return False, None, f"Invalid {data_type} format: {str(e)}"
-    except ValidationError as e:
-        return False, None, f"JSON schema validation failed: {e.message}"
-    except Exception as e:
-        return False, None, f"Validation error: {str(e)}"
-
-def extract_data_from_log(log_message, extractors):
-    """
-    使用提取器从日志消息中提取结构化数据
-    
-    遍历所有配置的提取器，使用正则表达式匹配日志消息，
-    提取指定的数据字段并进行类型验证。
-    
-    参数:
-        log_message (str): 待解析的日志消息
-        extractors (list): 提取器配置列表
-    
-    返回:
-        dict: 提取的数据字典，包含每个提取器的结果
-    
-    提取器配置格式:
-        {
-            'name': '提取器名称',
-            'pattern': '正则表达式模式',
-            'dataType': '数据类型 (text/json/number/boolean)'
-        }
-    """
-    extracted_data = {}
-    
-    for extractor in extractors:
-        try:
-            # 编译正则表达式模式（忽略大小写）
-            pattern = re.compile(extractor['pattern'], re.IGNORECASE)
-            match = pattern.search(log_message)
-            
-            if match:
-                # 提取原始数据：优先使用第一个捕获组，否则使用整个匹配
-                raw_data = match.group(1) if match.groups() else match.group(0)
-                data_type = extractor.get('dataType', 'text')  # 默认为文本类型
-                
-                # 对于JSON类型，尝试从日志中提取JSON部分
-                if data_type == 'json':
-                    try:
-                        # 尝试解析JSON字符串
-                        json_obj = json.loads(raw_data)
-                        raw_data = json.dumps(json_obj)  # 规范化JSON字符串
-                        
-                        # 调试输出：检查JSON对象中的module字段类型
-                        if 'properties' in json_obj and 'module' in json_obj['properties']:
-                            module_value = json_obj['properties']['module']
-                            module_type = type(module_value).__name__
-                            socketio.emit('log', {
-                                'platform': 'system',
-                                'message': f'检测到module字段: 值={module_value}, 类型={module_type}'
-                            })
-                    except json.JSONDecodeError:
-                        # 如果直接解析失败，尝试使用正则表达式提取JSON部分
-                        json_pattern = re.compile(r'({[^{}]*(?:{[^{}]*}[^{}]*)*}|\[[^\[\]]*(?:\[[^\[\]]*\][^\[\]]*)*\])')
-                        json_match = json_pattern.search(raw_data)
-                        if json_match:
-                            try:
-                                json_str = json_match.group(0)
-                                json_obj = json.loads(json_str)
-                                raw_data = json.dumps(json_obj)  # 规范化JSON字符串
-                                
-                                # 调试输出：检查JSON对象中的module字段类型
-                                if 'properties' in json_obj and 'module' in json_obj['properties']:
-                                    module_value = json_obj['properties']['module']
-                                    module_type = type(module_value).__name__
-                                    socketio.emit('log', {
-                                        'platform': 'system',
-                                        'message': f'检测到module字段: 值={module_value}, 类型={module_type}'
-                                    })
-                            except json.JSONDecodeError as e:
-                                socketio.emit('log', {
-                                    'platform': 'system',
-                                    'message': f'Failed to parse JSON in extractor "{extractor.get("name", "unknown")}": {str(e)}'
-                                })
-                
-                # 验证提取的数据类型
-                socketio.emit('log', {
-                    'platform': 'system',
-                    'message': f'开始验证数据类型: {data_type}'
-                })
-                
-                # 检查是否有验证规则
-                if 'validation' in extractor:
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'发现验证规则: {json.dumps(extractor["validation"], ensure_ascii=False)[:100]}...'
-                    })
-                
-                is_valid, parsed_data, error = validate_data_by_type(raw_data, data_type, extractor.get('validation'))
-                
-                if is_valid:
-                    # 验证成功，存储解析后的数据
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'数据验证成功: {extractor["name"]}'
-                    })
-                    extracted_data[extractor['name']] = {
-                        'value': parsed_data,
-                        'type': data_type,
-                        'raw': raw_data
-                    }
-                else:
-                    # 验证失败，存储错误信息
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'数据验证失败: {extractor["name"]}, 错误: {error}'
-                    })
-                    extracted_data[extractor['name']] = {
-                        'value': None,
-                        'type': data_type,
-                        'raw': raw_data,
-                        'error': error
-                    }
-        except re.error as e:
-            # 正则表达式错误，发送系统日志
-            socketio.emit('log', {
-                'platform': 'system',
-                'message': f'Invalid regex pattern in extractor "{extractor.get("name", "unknown")}": {extractor["pattern"]} - {str(e)}'
-            })
-    
-    return extracted_data
-
-# Initialize configuration
-load_config()
+    return validate_structure(config, SCHEMA_FILE)
 
 # 静态文件服务
 @app.route('/')
@@ -475,20 +332,22 @@ def import_log():
     """
     导入日志文件进行解析
     
-    接收前端上传的日志文件内容，按行解析并应用当前配置的行为模式，
-    将解析结果通过WebSocket发送到前端。
+    接收前端上传的日志文件内容并创建后台导入任务，立即返回任务ID。
+    任务按行解析并应用当前配置的行为模式，通过 import_progress 事件报告进度，
+    结束时发送 import_complete 事件和带有任务ID的最终检查结果。
     
     请求体:
         JSON: {
             'filename': str,  # 文件名
             'content': str,   # 文件内容
-            'platform': str   # 平台类型 ('android', 'ios', 'harmonyos')
+            'platform': str,  # 平台类型 ('android', 'ios', 'harmonyos')
+            'parallel': bool  # 可选，是否使用多进程并行分析，默认取 globalSettings.imports.parallel
         }
     
     返回:
         JSON: {
-            'success': bool,   # 操作是否成功
-            'lineCount': int,  # 解析的日志行数
+            'success': bool,   # 任务是否创建成功
+            'jobId': str,      # 导入任务ID
             'message': str     # 结果消息
         }
     """
@@ -502,48 +361,368 @@ def import_log():
             }), 400
             
         filename = data.get('filename', 'imported_log.txt')
-        content = data.get('content')
+        content = data.get('content').encode('utf-8')
         platform = data.get('platform')
         
-        # 通知前端开始导入
-        socketio.emit('log', {'platform': 'system', 'message': f'开始导入日志文件: {filename}'})
-        
-        # 按行处理日志内容
-        lines = content.splitlines()
-        line_count = 0
+        parallel = bool(data.get('parallel', import_settings.get('parallel', False)))
+        job = import_jobs.submit(filename, platform, io.BytesIO(content), total_bytes=len(content),
+                                 options={'parallel': parallel})
+        return jsonify({
+            'success': True,
+            'jobId': job.id,
+            'message': f'Import job {job.id} queued for {filename}'
+        }), 202
         
-        for line in lines:
-            if line.strip():
-                line_count += 1
-                # 发送日志到前端
-                socketio.emit('log', {'platform': platform, 'message': line.strip()})
-                # 分析行为模式
-                analyze_log_behavior(line.strip(), platform)
+    except Exception as e:
+        error_message = f'导入日志文件失败: {str(e)}'
+        delivery.emit('log', {'platform': 'system', 'message': error_message})
+        return jsonify({
+            'success': False,
+            'message': error_message
+        }), 500
+
+@app.route('/import-log/stream', methods=['POST'])
+def import_log_stream():
+    """
+    流式导入日志文件
+    
+    适用于大文件：请求体按块写入临时文件（较小的内容保存在内存中）后创建后台导入任务，
+    任务增量切分为行，边读边发送和分析，内存占用只与块大小有关。
+    支持 gzip、zstd 压缩的日志和 zip 压缩包（例如 Android bugreport），按文件头自动识别并流式解压。
+    
+    请求:
+        - 原始请求体（Content-Type: application/octet-stream，可使用分块传输编码），
+          文件名和平台通过查询参数传递
+        - 或 multipart/form-data，文件字段名为 'file'，其余参数可放在表单字段中
+    
+    查询参数 / 表单字段:
+        filename (str): 文件名
+        platform (str): 平台类型 ('android', 'ios', 'harmonyos')
+        parallel (str): 可选，'1'/'true' 使用多进程并行分析，默认取 globalSettings.imports.parallel
+        member (str): 可选，zip 压缩包中要导入的成员名称或通配符（例如 logcat.txt），默认自动选择
+    
+    返回:
+        JSON: {
+            'success': bool,
+            'jobId': str,       # 导入任务ID
+            'byteCount': int,   # 接收的字节数
+            'message': str
+        }
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify({'success': False, 'message': 'Missing file field in multipart request.'}), 400
+            stream = upload.stream
+            filename = request.form.get('filename') or upload.filename or 'imported_log.txt'
+            platform = request.form.get('platform') or request.args.get('platform')
+            parallel = request.form.get('parallel') or request.args.get('parallel')
+            member = request.form.get('member') or request.args.get('member')
+        else:
+            stream = request.stream
+            filename = request.args.get('filename', 'imported_log.txt')
+            platform = request.args.get('platform')
+            parallel = request.args.get('parallel')
+            member = request.args.get('member')
         
-        # 执行最终检查
-        final_check_results = perform_final_check(lines, platform)
+        if not platform:
+            return jsonify({'success': False, 'message': 'Invalid request data. Missing platform.'}), 400
+        if parallel is None:
+            parallel = import_settings.get('parallel', False)
+        else:
+            parallel = parallel.lower() in ('1', 'true', 'yes', 'on')
         
-        # 通知前端导入完成
-        socketio.emit('log', {'platform': 'system', 'message': f'日志文件导入完成: {filename}, 共 {line_count} 行'})
+        # 请求结束后请求体不可再读，先转存到临时文件，由后台任务读取
+        spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY)
+        byte_count = 0
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            spool.write(chunk)
+            byte_count += len(chunk)
+        spool.seek(0)
         
-        # 发送最终检查结果
-        if final_check_results:
-            socketio.emit('log', {'platform': 'system', 'message': f'最终检查结果: {final_check_results["message"]}'})            
+        # 提前检查压缩格式和压缩包成员，出错时直接返回，不创建任务
+        try:
+            open_log_source(spool, member)
+        except (LogSourceError, OSError) as e:
+            spool.close()
+            return jsonify({'success': False, 'message': f'无法读取日志文件: {e}'}), 400
+        spool.seek(0)
         
+        job = import_jobs.submit(filename, platform, spool, total_bytes=byte_count,
+                                 options={'parallel': parallel, 'member': member})
         return jsonify({
             'success': True,
-            'lineCount': line_count,
-            'message': f'Successfully imported {line_count} lines from {filename}'
-        })
+            'jobId': job.id,
+            'byteCount': byte_count,
+            'message': f'Import job {job.id} queued for {filename}'
+        }), 202
         
     except Exception as e:
         error_message = f'导入日志文件失败: {str(e)}'
-        socketio.emit('log', {'platform': 'system', 'message': error_message})
+        delivery.emit('log', {'platform': 'system', 'message': error_message})
         return jsonify({
             'success': False,
             'message': error_message
         }), 500
 
+@app.route('/api/import/paths', methods=['POST'])
+def import_paths():
+    """
+    导入服务器本地的日志文件
+    
+    CI 等流程已经把设备日志放在服务器上时，不需要再通过浏览器上传。
+    每个文件创建一个导入任务，整体作为一个批次，同时运行的任务数量受 globalSettings.imports.maxConcurrent 限制；
+    未压缩的文件通过 mmap 扫描，压缩文件流式解压。只允许导入 globalSettings.imports.allowedRoots
+    （默认为服务器工作目录）下的文件。
+    
+    请求体:
+        JSON: {
+            'paths': list,        # 文件、目录或通配符模式（支持 **）
+            'platform': str,      # 平台类型 ('android', 'ios', 'harmonyos')
+            'recursive': bool,    # 可选，目录是否包含子目录，默认 False
+            'parallel': bool,     # 可选，是否使用多进程并行分析
+            'member': str,        # 可选，zip 压缩包中要导入的成员
+            'resetTracking': bool # 可选，每个文件开始前重置事件顺序和事件组状态，使每个文件独立检查，默认 True
+        }
+    
+    返回:
+        JSON: {
+            'success': bool,
+            'batchId': str,       # 批次ID，通过 /api/import/batches/<batchId> 获取每个文件的报告和汇总
+            'jobs': list,         # [{'jobId': str, 'path': str}, ...]
+            'errors': list        # 无法导入的路径及原因
+        }
+    """
+    data = request.get_json(silent=True) or {}
+    patterns = data.get('paths')
+    platform = data.get('platform')
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not patterns or not platform:
+        return jsonify({'success': False, 'message': 'Invalid request data. Missing paths or platform.'}), 400
+    
+    files, errors = resolve_import_paths(patterns, bool(data.get('recursive', False)))
+    if not files:
+        return jsonify({'success': False, 'message': 'No importable files found.', 'errors': errors}), 400
+    
+    options = {
+        'parallel': bool(data.get('parallel', import_settings.get('parallel', False))),
+        'member': data.get('member'),
+        'reset_tracking': bool(data.get('resetTracking', True))
+    }
+    shared_session = None
+    if not options['reset_tracking']:
+        # 跨文件连续追踪：提交时创建批次共享的分析会话，批次内的文件按提交顺序逐个导入，
+        # 批次全部结束（包括排队中被取消）时结束该会话
+        shared_session = analysis_sessions.create('import', platform)
+        options['analysis_session_id'] = shared_session.id
+    batch_id, jobs = import_jobs.submit_batch([
+        {'filename': path, 'platform': platform, 'options': dict(options, path=path)}
+        for path in files
+    ], sequential=shared_session is not None,
+        on_complete=(lambda report: analysis_sessions.finish(shared_session)) if shared_session else None)
+    delivery.emit('log', {'platform': 'system', 'message': f'已创建本地文件导入批次 {batch_id}: {len(jobs)} 个文件'})
+    return jsonify({
+        'success': True,
+        'batchId': batch_id,
+        'jobs': [{'jobId': job.id, 'path': job.filename} for job in jobs],
+        'errors': errors
+    }), 202
+
+@app.route('/api/import/batches/<batch_id>', methods=['GET'])
+def get_import_batch(batch_id):
+    """
+    获取导入批次的状态：每个文件的报告（任务状态、进度、最终检查结果）和汇总
+    """
+    report = import_jobs.batch(batch_id)
+    if report is None:
+        return jsonify({'success': False, 'message': f'Import batch {batch_id} not found.'}), 404
+    return jsonify(dict(report, success=True))
+
+def resolve_import_paths(patterns, recursive=False):
+    """
+    把文件、目录和通配符模式展开为允许导入的文件列表
+    
+    参数:
+        patterns (list): 文件、目录或通配符模式
+        recursive (bool): 目录是否包含子目录
+    
+    返回:
+        tuple: (文件绝对路径列表（去重，保持顺序）, 错误列表 [{'path': str, 'error': str}, ...])
+    """
+    roots = [os.path.realpath(root) for root in (import_settings.get('allowedRoots') or [os.getcwd()])]
+    
+    def allowed(path):
+        return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+    
+    matches, unmatched = expand_log_paths(patterns, recursive)
+    errors = [{'path': pattern, 'error': 'No matching files'} for pattern in unmatched]
+    files = []
+    seen = set()
+    for match in matches:
+        path = os.path.realpath(match)
+        if not allowed(path):
+            errors.append({'path': match, 'error': 'Path is outside of the allowed import roots'})
+        elif not os.path.isfile(path):
+            errors.append({'path': match, 'error': 'File not found'})
+        elif path not in seen:
+            seen.add(path)
+            files.append(path)
+    return files, errors
+
+@app.route('/api/import/jobs', methods=['GET'])
+def list_import_jobs():
+    """
+    列出导入任务（排队中、运行中和最近结束的任务）
+    
+    返回:
+        JSON: {'success': bool, 'jobs': list, 'maxConcurrent': int}
+    """
+    return jsonify({'success': True, 'jobs': import_jobs.list(), 'maxConcurrent': import_jobs.max_concurrent})
+
+@app.route('/api/import/jobs/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    """
+    获取单个导入任务的状态、进度和最终检查结果
+    """
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'Import job {job_id} not found.'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/import/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_import_job(job_id):
+    """
+    取消导入任务：排队中的任务不再执行，运行中的任务在下一次进度检查时停止
+    """
+    if not import_jobs.cancel(job_id):
+        job = import_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': f'Import job {job_id} not found.'}), 404
+        return jsonify({'success': False, 'message': f'Import job {job_id} already {job.status}.'}), 409
+    return jsonify({'success': True, 'message': f'Import job {job_id} cancellation requested.'})
+
+def run_import_job(job):
+    """
+    执行导入任务（在后台任务线程中运行）
+    
+    每个导入任务在独立的分析会话中分析（绑定任务开始时的规则集），不影响实时收集和其他导入。
+    批次导入指定 resetTracking=False 时，同一批次的文件共享提交时创建的分析会话（options['analysis_session_id']），
+    任务按提交顺序逐个运行，事件顺序和事件组跨文件连续追踪。
+    
+    参数:
+        job (ImportJob): 导入任务，source 为二进制类文件对象（纯文本、gzip、zstd 或 zip 压缩包），
+                         或者 options['path'] 为服务器本地文件路径
+    
+    返回:
+        dict: 最终检查结果
+    """
+    path = job.options.get('path')
+    if path:
+        # 服务器本地文件：导入时才打开，排队中的任务不占用文件句柄
+        job.source = open(path, 'rb')
+        job.total_bytes = os.fstat(job.source.fileno()).st_size
+    
+    # 压缩数据按读取的原始字节计算进度，与 total_bytes 一致；未压缩的本地文件直接在 mmap 映射区上扫描
+    lines, bytes_read, source_info = open_log_lines(job.source, job.options.get('member'), use_mmap=bool(path))
+    job.options['source'] = source_info
+    if source_info['member']:
+        # 压缩包只读取选中成员的数据，进度按成员的压缩大小计算
+        job.total_bytes = source_info['member_compressed_size']
+    
+    shared_session_id = job.options.get('analysis_session_id')
+    session = analysis_sessions.get(shared_session_id) if shared_session_id else None
+    shared = session is not None
+    if session is None:
+        session = analysis_sessions.create('import', job.platform)
+    job.analysis_session_id = session.id
+    job.session_id = session.history_session = start_history_session('import')
+    mode = f'并行模式, {resolve_workers(import_settings.get("parallelWorkers", 0))} 个进程' if job.options.get('parallel') else '顺序模式'
+    if source_info['format'] != 'plain':
+        mode += f', {source_info["format"]}'
+        if source_info['member']:
+            mode += f': {source_info["member"]}'
+    delivery.emit('log', {'platform': 'system', 'message': f'开始导入日志文件: {job.filename} (任务 {job.id}, {mode})'})
+    
+    try:
+        line_count, error_count = import_lines(
+            lines,
+            session,
+            on_progress=lambda count: import_jobs.report(job, count, bytes_read()),
+            parallel=job.options.get('parallel', False)
+        )
+    except Exception:
+        delivery.emit('log', {'platform': 'system', 'message': f'导入任务 {job.id} 已停止: {job.filename}, 已处理 {job.lines} 行'})
+        raise
+    finally:
+        # 批次共享的会话由批次结束回调统一结束
+        if not shared:
+            analysis_sessions.finish(session)
+    job.lines = line_count
+    job.bytes = bytes_read()
+    
+    final_check_results = perform_final_check(session, error_count=error_count, job_id=job.id)
+    
+    delivery.emit('log', {'platform': 'system', 'message': f'日志文件导入完成: {job.filename}, 共 {line_count} 行'})
+    if final_check_results:
+        delivery.emit('log', {'platform': 'system', 'message': f'最终检查结果: {final_check_results["message"]}'})
+    return final_check_results
+
+def import_lines(lines, session, on_progress=None, parallel=False):
+    """
+    逐行发送并分析导入的日志
+    
+    并行模式下，行为匹配、数据提取和验证在进程池中按块并行计算，
+    主线程按原始顺序发送日志并回放命中结果，事件顺序和事件组检查的结果与顺序模式完全一致。
+    
+    参数:
+        lines (iterable): 日志行，可以是列表或逐行产出的生成器
+        session (AnalysisSession): 分析会话，日志写入其当前的日志历史会话
+        on_progress (callable, optional): 每处理 IMPORT_PROGRESS_LINES 行调用一次 on_progress(非空行数)，
+                                          抛出异常时停止导入
+        parallel (bool): 是否使用多进程并行匹配（工作进程数量由 globalSettings.imports.parallelWorkers 决定）
+    
+    返回:
+        tuple: (非空行数, 可能的错误行数)
+    """
+    stripped = (line.strip() for line in lines)
+    stripped = (line for line in stripped if line)
+    pool = None
+    if parallel:
+        # 复用会话规则集的长期进程池，工作进程只在该规则集第一次并行导入时启动
+        workers = import_settings.get('parallelWorkers', 0)
+        pool = match_pools.acquire(session.ruleset, workers)
+        analyzed = iter_parallel_matches(stripped, session.ruleset.config, workers, pool=pool)
+    else:
+        analyzed = ((line, None) for line in stripped)
+    
+    line_count = 0
+    error_count = 0
+    broken = False
+    try:
+        for line, results in analyzed:
+            line_count += 1
+            # 发送日志到前端
+            publish_log(session.platform, line, session.history_session)
+            # 分析行为模式（并行模式下回放工作进程的匹配结果）
+            if session.analyze(line, results):
+                error_count += 1
+            if on_progress and line_count % IMPORT_PROGRESS_LINES == 0:
+                on_progress(line_count)
+    except BrokenProcessPool:
+        broken = True
+        raise
+    finally:
+        # 提前结束（取消或出错）时关闭生成器，取消尚未开始的块；损坏的进程池不再复用
+        analyzed.close()
+        if pool is not None:
+            match_pools.release(pool, discard=broken)
+    return line_count, error_count
+
 # API 端点
 @app.route('/config', methods=['GET'])
 def get_config():
@@ -555,7 +734,103 @@ def get_config():
     返回:
         JSON: 当前配置的 JSON 格式数据
     """
-    return jsonify(behavior_config)
+    return jsonify(analysis_sessions.ruleset.config)
+
+@app.route('/api/ruleset', methods=['GET'])
+def get_ruleset():
+    """
+    按版本获取规则集
+    
+    behavior_triggered 和 event_order_violation 事件只携带规则集版本和行为索引，
+    客户端通过此接口获取对应版本的完整配置并按版本缓存。
+    
+    查询参数:
+        version (str, optional): 规则集版本，为空时返回当前版本
+    
+    返回:
+        JSON: {'version': str, 'config': dict}
+        - 404: 指定版本已不在服务器缓存中
+    """
+    current_version = analysis_sessions.ruleset.version
+    version = request.args.get('version') or current_version
+    config = ruleset_history.get(version)
+    if config is None:
+        return jsonify({'error': f'Unknown ruleset version: {version}', 'current': current_version}), 404
+    return jsonify({'version': version, 'config': config})
+
+def resolve_analysis_session(session_id=None):
+    """
+    获取分析会话：指定ID时按ID查找，否则为最近的未结束会话
+
+    返回:
+        AnalysisSession or None: 会话不存在时返回 None
+    """
+    if session_id:
+        return analysis_sessions.get(session_id)
+    return analysis_sessions.current()
+
+@app.route('/api/event-order', methods=['GET'])
+def get_event_order():
+    """
+    获取会话保留的已触发事件序列
+    
+    客户端在 event_order_violation 增量出现缺口（例如中途连接、增量被截断）或带有 order_resync 时调用此接口重新同步。
+    会话只保留最近的事件（见 event_tracker.ORDER_HISTORY），order_base 为 current_order 第一个事件在完整序列中的位置。
+    
+    查询参数:
+        session (str, optional): 分析会话ID（事件中的 session 字段），默认为最近的会话
+    
+    返回:
+        JSON: {'session': str, 'rulesetVersion': str, 'order_base': int, 'current_order': list}
+        - 404: 会话不存在
+    """
+    session = resolve_analysis_session(request.args.get('session'))
+    if session is None:
+        return jsonify({'error': 'Analysis session not found.'}), 404
+    order_base, current_order = session.event_order()
+    return jsonify({'session': session.id, 'rulesetVersion': session.ruleset.version,
+                    'order_base': order_base, 'current_order': current_order})
+
+@app.route('/api/final-check', methods=['GET'])
+def get_final_check():
+    """
+    获取会话当前的最终检查结果
+
+    结果由会话的事件追踪在分析过程中增量维护，可以在实时收集或导入进行中随时查询，
+    统计范围为会话开始（或上次重置事件追踪）以来分析的所有日志。
+
+    查询参数:
+        session (str, optional): 分析会话ID，默认为最近的会话
+
+    返回:
+        JSON: {'session': str, 'rulesetVersion': str, 'lines': int, 'errors': int, 'results': dict}
+        - 404: 会话不存在
+    """
+    session = resolve_analysis_session(request.args.get('session'))
+    if session is None:
+        return jsonify({'error': 'Analysis session not found.'}), 404
+    return jsonify({
+        'session': session.id,
+        'rulesetVersion': session.ruleset.version,
+        'lines': session.tracker.line_count,
+        'errors': session.tracker.error_count,
+        'results': session.final_check()
+    })
+
+@app.route('/api/analysis/sessions', methods=['GET'])
+def list_analysis_sessions():
+    """
+    列出分析会话（实时收集、导入、ES 搜索），按创建顺序排列
+
+    查询参数:
+        kind (str, optional): 只列出指定类型的会话（live、import、es）
+
+    返回:
+        JSON: {'rulesetVersion': str, 'sessions': list}
+    """
+    sessions = analysis_sessions.list(request.args.get('kind'))
+    return jsonify({'rulesetVersion': analysis_sessions.ruleset.version,
+                    'sessions': [session.to_dict() for session in sessions]})
 
 @app.route('/config', methods=['POST'])
 def update_config():
@@ -578,7 +853,6 @@ def update_config():
         - JSON Schema 验证
         - 正则表达式模式验证
     """
-    global behavior_config
     try:
         new_config = request.get_json()
         
@@ -586,68 +860,80 @@ def update_config():
         if not new_config or 'behaviors' not in new_config or not isinstance(new_config['behaviors'], list):
             return jsonify({'error': 'Invalid configuration format. Must contain "behaviors" array.'}), 400
         
-        # 使用 JSON Schema 验证配置结构
-        is_valid, error_message = validate_config_structure(new_config)
-        if not is_valid:
-            return jsonify({'error': error_message}), 400
+        # 使用预编译的 JSON Schema 验证配置结构，并编译每个行为和提取器的正则表达式模式
+        compilation = compile_config(new_config, SCHEMA_FILE)
+        if compilation.schema_error:
+            return jsonify({'error': compilation.schema_error, 'timings': compilation.timings}), 400
         
-        # 验证每个行为的正则表达式模式
-        validation_errors = []
-        for i, behavior in enumerate(new_config['behaviors']):
-            # 验证主模式
-            try:
-                re.compile(behavior['pattern'])
-            except re.error as e:
-                validation_errors.append(f"Behavior {i+1} '{behavior.get('name', 'unknown')}': Invalid regex pattern '{behavior['pattern']}' - {str(e)}")
-            
-            # 验证提取器模式（如果存在）
-            if 'extractors' in behavior:
-                for j, extractor in enumerate(behavior['extractors']):
-                    try:
-                        re.compile(extractor['pattern'])
-                    except re.error as e:
-                        validation_errors.append(f"Behavior {i+1} '{behavior.get('name', 'unknown')}', Extractor {j+1} '{extractor.get('name', 'unknown')}': Invalid regex pattern '{extractor['pattern']}' - {str(e)}")
-        
-        if validation_errors:
-            return jsonify({'error': 'Regex validation errors', 'details': validation_errors}), 400
+        if compilation.pattern_errors:
+            return jsonify({'error': 'Regex validation errors', 'details': compilation.pattern_errors,
+                            'timings': compilation.timings}), 400
         
-        # 保存到配置文件
-        with open('config.yaml', 'w', encoding='utf-8') as f:
+        # 保存到配置文件（记录为已加载，配置文件监视不会再次加载）
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             yaml.dump(new_config, f, default_flow_style=False, allow_unicode=True, indent=2)
+        config_watcher.mark_loaded(CONFIG_FILE)
         
-        # 更新内存中的配置
-        behavior_config = new_config
+        # 发布验证时编译的规则集（实时收集会话立即切换，进行中的导入不受影响）
+        apply_config(compilation.ruleset)
         
-        socketio.emit('log', {'platform': 'system', 'message': 'Configuration updated successfully.'})
-        return jsonify({'message': 'Configuration updated successfully.'}), 200
+        delivery.emit('log', {'platform': 'system', 'message': 'Configuration updated successfully.'})
+        return jsonify({'message': 'Configuration updated successfully.', 'rulesetVersion': compilation.ruleset.version,
+                        'timings': compilation.timings}), 200
     except json.JSONDecodeError as e:
         error_msg = f'Invalid JSON format: {str(e)}'
-        socketio.emit('log', {'platform': 'system', 'message': f'Error updating configuration: {error_msg}'})
+        delivery.emit('log', {'platform': 'system', 'message': f'Error updating configuration: {error_msg}'})
         return jsonify({'error': error_msg}), 400
     except Exception as e:
         error_msg = f'Error updating configuration: {str(e)}'
-        socketio.emit('log', {'platform': 'system', 'message': error_msg})
+        delivery.emit('log', {'platform': 'system', 'message': error_msg})
         return jsonify({'error': error_msg}), 500
 
+@app.route('/api/config/validate', methods=['POST'])
+def validate_config():
+    """
+    验证配置但不保存和发布
+    
+    执行与 POST /config 相同的验证和编译流程，返回所有错误和各阶段耗时。
+    
+    请求体:
+        JSON: 待验证的配置数据
+    
+    返回:
+        JSON: {'valid': bool, 'parseError', 'schemaError', 'patternErrors': list,
+               'rulesetVersion': str, 'behaviors': int, 'timings': {阶段: 毫秒}}
+    """
+    new_config = request.get_json(silent=True)
+    if not isinstance(new_config, dict) or not isinstance(new_config.get('behaviors'), list):
+        return jsonify({'valid': False, 'parseError': 'Invalid configuration format. Must contain "behaviors" array.',
+                        'schemaError': None, 'patternErrors': [], 'rulesetVersion': None,
+                        'behaviors': 0, 'timings': {}}), 400
+    return jsonify(compile_config(new_config, SCHEMA_FILE).to_dict())
+
 @app.route('/reload-config', methods=['POST'])
 def reload_config():
     """
     重新加载配置
     
     从配置文件重新读取配置信息，用于在外部修改配置文件后
-    刷新应用程序的配置状态。
+    刷新应用程序的配置状态。配置文件监视开启时修改会自动加载，不需要调用本接口。
+    新配置验证失败时保留当前规则集。
     
     返回:
         str: 操作结果消息
         - 成功: 'Configuration reloaded.' (HTTP 200)
+        - 配置无效: 错误信息 (HTTP 400)
         - 失败: 'Error reloading configuration.' (HTTP 500)
     """
     try:
-        load_config()  # 重新加载配置文件
-        socketio.emit('log', {'platform': 'system', 'message': 'Configuration reloaded successfully.'})
+        config_watcher.mark_loaded(CONFIG_FILE)
+        _, error = hot_reload_config(CONFIG_FILE)  # 重新加载配置文件
+        if error:
+            return f'Configuration rejected: {error}', 400
+        delivery.emit('log', {'platform': 'system', 'message': 'Configuration reloaded successfully.'})
         return 'Configuration reloaded.', 200
     except Exception as e:
-        socketio.emit('log', {'platform': 'system', 'message': f'Error reloading configuration: {str(e)}'})
+        delivery.emit('log', {'platform': 'system', 'message': f'Error reloading configuration: {str(e)}'})
         return 'Error reloading configuration.', 500
 
 @app.route('/reset-event-order', methods=['POST'])
@@ -659,22 +945,36 @@ def reset_event_order():
     重置所有事件组的状态。
     用于手动重置事件顺序和事件组状态，而不影响其他日志收集功能。
     
+    请求参数（JSON 或查询参数）:
+        session (str, optional): 要重置的分析会话ID，默认重置所有实时收集会话
+                                 （没有实时收集会话时重置最近的会话）
+    
     返回:
         str: 操作结果消息
         - 成功: 'Event tracking reset.' (HTTP 200)
+        - 404: 指定的会话不存在
     """
-    global triggered_events, event_group_status
-    triggered_events = []
-    
-    # 重置所有事件组状态
-    for group_id in event_group_status:
-        event_group_status[group_id]['triggered'] = []
-        event_group_status[group_id]['completed'] = False
-    
-    socketio.emit('log', {'platform': 'system', 'message': 'Event tracking has been reset.'})
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session') or request.args.get('session')
+    if session_id:
+        session = analysis_sessions.get(session_id)
+        if session is None:
+            return f'Analysis session {session_id} not found.', 404
+        sessions = [session]
+    else:
+        sessions = [session for session in analysis_sessions.list('live') if session.status != 'finished']
+        if not sessions and analysis_sessions.current():
+            sessions = [analysis_sessions.current()]
+    for session in sessions:
+        reset_event_tracking(session)
     return 'Event tracking reset.', 200
 
-def perform_final_check(log_lines, platform):
+def reset_event_tracking(session):
+    """清空会话已触发的事件列表和所有事件组状态，并通知客户端"""
+    session.reset()
+    delivery.emit('log', {'platform': 'system', 'message': f'Event tracking has been reset. (会话 {session.id})'})
+
+def perform_final_check(session, error_count=None, job_id=None, replay_id=None):
     """
     对导入的日志文件进行最终检查
     
@@ -684,317 +984,22 @@ def perform_final_check(log_lines, platform):
     3. 事件顺序是否符合预期
     4. 事件组是否完整
     
+    检查所需的统计已在分析过程中由会话的事件追踪增量维护，不需要保留或重新扫描日志行。
+    
     参数:
-        log_lines (list): 所有日志行
-        platform (str): 日志来源平台
+        session (AnalysisSession): 分析会话
+        error_count (int, optional): 导入过程中统计的错误行数，默认使用会话的统计
+        job_id (str, optional): 导入任务ID，包含在结果中以便客户端关联到对应的导入任务
+        replay_id (str, optional): 回放任务ID，同上
         
     返回:
-        dict: 检查结果，包含状态和消息
+        dict: 检查结果，包含状态、消息和会话ID
     """
-    results = {
-        'status': 'success',
-        'message': '最终检查通过，未发现问题',
-        'details': []
-    }
-    
-    # 检查必要事件是否都已触发
-    required_events = []
-    for behavior in behavior_config.get('behaviors', []):
-        if behavior.get('required', False) and behavior.get('name'):
-            required_events.append(behavior.get('name'))
-    
-    missing_events = [event for event in required_events if event not in triggered_events]
-    if missing_events:
-        results['status'] = 'warning'
-        warning_msg = f'缺少必要事件: {", ".join(missing_events)}'
-        results['message'] = warning_msg
-        results['details'].append({
-            'type': 'missing_required_events',
-            'events': missing_events
-        })
-        socketio.emit('log', {'platform': 'system', 'message': f'警告: {warning_msg}'})
-    
-    # 检查是否存在关键错误
-    error_count = 0
-    for line in log_lines:
-        if '[ERROR]' in line or 'Exception' in line or 'Error:' in line:
-            error_count += 1
-    
-    if error_count > 0:
-        if results['status'] == 'success':
-            results['status'] = 'warning'
-            results['message'] = f'发现 {error_count} 个可能的错误'
-        else:
-            results['message'] += f'，并且发现 {error_count} 个可能的错误'
-        
-        results['details'].append({
-            'type': 'error_logs',
-            'count': error_count
-        })
-    
-    # 检查事件顺序违规
-    order_violations = []
-    for i, group in enumerate(event_order_groups):
-        # 找出在当前组中已触发的事件
-        triggered_in_group = [event for event in triggered_events if event in group]
-        
-        # 检查顺序
-        for j in range(len(triggered_in_group) - 1):
-            current_event = triggered_in_group[j]
-            next_event = triggered_in_group[j + 1]
-            
-            # 在原始组中的索引
-            current_index = group.index(current_event)
-            next_index = group.index(next_event)
-            
-            if current_index > next_index:
-                order_violations.append({
-                    'group': i,
-                    'events': [current_event, next_event],
-                    'message': f'事件 "{next_event}" 应该在 "{current_event}" 之前触发'
-                })
-    
-    if order_violations:
-        if results['status'] == 'success':
-            results['status'] = 'warning'
-            results['message'] = f'发现 {len(order_violations)} 个事件顺序违规'
-        else:
-            results['message'] += f'，并且发现 {len(order_violations)} 个事件顺序违规'
-        
-        results['details'].append({
-            'type': 'order_violations',
-            'violations': order_violations
-        })
-    
-    # 检查事件组完整性
-    incomplete_groups = []
-    for group_id, group_info in event_group_status.items():
-        if not group_info['completed'] and len(group_info['triggered']) > 0:
-            missing = [event for event in group_info['events'] if event not in group_info['triggered']]
-            incomplete_groups.append({
-                'group_id': group_id,
-                'group_name': group_info.get('name', f'事件组 {group_id}'),
-                'missing': missing,
-                'triggered': group_info['triggered']
-            })
-    
-    if incomplete_groups:
-        if results['status'] == 'success':
-            results['status'] = 'warning'
-            results['message'] = f'发现 {len(incomplete_groups)} 个不完整的事件组'
-        else:
-            results['message'] += f'，并且发现 {len(incomplete_groups)} 个不完整的事件组'
-        
-        results['details'].append({
-            'type': 'incomplete_groups',
-            'groups': incomplete_groups
-        })
-    
-    # 发送最终检查结果事件
-    socketio.emit('final_check_results', results)
-    
-    return results
-
+    # 检查必要事件、错误行、事件顺序和事件组完整性，通过会话的 emit（投递调度器）发送结果；
+    # ES 搜索使用同一份报告（见 ElasticsearchSearchService）
+    return session.report_final_check(error_count, job_id=job_id, replay_id=replay_id)
 
-def analyze_log_behavior(log_message, platform):
-    """
-    分析日志消息是否匹配配置的行为模式
-    
-    遍历所有配置的行为模式，使用正则表达式检查日志消息是否匹配。
-    如果匹配成功，则提取相关数据并触发行为事件。
-    同时检查事件触发顺序是否符合配置的预期顺序。
-    
-    参数:
-        log_message (str): 待分析的日志消息
-        platform (str): 日志来源平台
-    
-    行为匹配流程:
-        1. 遍历所有配置的行为模式
-        2. 跳过已禁用的行为
-        3. 使用正则表达式匹配日志消息
-        4. 如果匹配成功，提取数据并验证
-        5. 检查事件触发顺序
-        6. 发送行为触发事件
-    """
-    for behavior in behavior_config.get('behaviors', []):
-        # Skip disabled behaviors
-        if not behavior.get('enabled', True):
-            continue
-            
-        try:
-            pattern = re.compile(behavior['pattern'], re.IGNORECASE)
-            match = pattern.search(log_message)
-            
-            if match:
-                # Extract structured data if extractors are defined
-                extracted_data = {}
-                if 'extractors' in behavior:
-                    extracted_data = extract_data_from_log(log_message, behavior['extractors'])
-                
-                # Validate extracted data if validation rules are defined
-                validation_results = {}
-                if 'validation' in behavior and extracted_data:
-                    data_type = behavior.get('dataType', 'text')
-                    validation_rules = behavior['validation']
-                    
-                    # Get the main data to validate (first extractor or matched text)
-                    main_data = None
-                    if extracted_data:
-                        first_extractor = list(extracted_data.values())[0]
-                        main_data = first_extractor.get('raw')
-                    else:
-                        main_data = match.group(1) if match.groups() else match.group(0)
-                    
-                    if main_data:
-                        is_valid, parsed_data, error = validate_data_by_type(main_data, data_type, validation_rules)
-                        validation_results = {
-                            'isValid': is_valid,
-                            'parsedData': parsed_data,
-                            'error': error,
-                            'dataType': data_type
-                        }
-                
-                # 检查事件顺序和事件组
-                global triggered_events, event_order_config, event_order_groups, event_group_config, event_group_status
-                behavior_name = behavior.get('name', '')
-                
-                if behavior_name:
-                    # 将当前事件添加到已触发事件列表（用于事件顺序检查）
-                    if behavior_name in event_order_config:
-                        triggered_events.append(behavior_name)
-                    
-                    # 检查事件顺序是否符合预期
-                    event_order_violation = None
-                    
-                    # 如果当前行为在事件顺序配置中，则进行顺序检查
-                    if behavior_name in event_order_config:
-                        # 找出当前事件所在的分组
-                        for group in event_order_groups:
-                            if behavior_name in group:
-                                # 只在当前分组内检查顺序
-                                group_triggered_events = [event for event in triggered_events if event in group]
-                                
-                                # 在当前分组中的位置
-                                current_index_in_group = group.index(behavior_name)
-                                
-                                # 检查前面的事件是否都已触发
-                                for j in range(current_index_in_group):
-                                    expected_event = group[j]
-                                    if expected_event not in group_triggered_events:
-                                        event_order_violation = {
-                                            'current_event': behavior_name,
-                                            'missing_event': expected_event,
-                                            'message': f'事件 "{behavior_name}" 在 "{expected_event}" 之前触发，违反了预期顺序',
-                                            'group': group
-                                        }
-                                        break
-                                
-                                # 如果在当前分组中发现违规，不再检查其他分组
-                                if event_order_violation:
-                                    break
-                        
-                        # 如果检测到顺序违规，发送违规事件
-                        if event_order_violation:
-                            # 找出违规事件所在的分组
-                            violation_group = event_order_violation.get('group', [])
-                            
-                            # 为违规分组生成名称
-                            group_index = -1
-                            for i, group in enumerate(event_order_groups):
-                                if group == violation_group:
-                                    group_index = i
-                                    break
-                            
-                            group_name = "顺序组: " + ", ".join([event[:10] + "..." if len(event) > 10 else event for event in violation_group[:2]])
-                            if len(violation_group) > 2:
-                                group_name += f" 等{len(violation_group)}个事件"
-                            
-                            socketio.emit('event_order_violation', {
-                                'violation': event_order_violation,
-                                'current_order': triggered_events,
-                                'expected_order': violation_group,  # 只发送违规所在的分组
-                                'all_groups': event_order_groups,   # 发送所有分组信息
-                                'group_name': group_name,           # 添加分组名称
-                                'group_index': group_index          # 添加分组索引
-                            })
-                            
-                            # 同时发送系统日志
-                            socketio.emit('log', {
-                                'platform': 'system',
-                                'message': f'事件顺序违规: {event_order_violation["message"]} (在{group_name})'
-                            })
-                    
-                    # 检查事件组
-                    # 遍历所有事件组，检查当前事件是否属于某个组
-                    for group_id, group_info in event_group_status.items():
-                        events = group_info['events']
-                        triggered = group_info['triggered']
-                        completed = group_info['completed']
-                        
-                        # 如果事件组已完成，跳过检查
-                        if completed:
-                            continue
-                        
-                        # 如果当前事件在该组中且尚未被触发
-                        if behavior_name in events and behavior_name not in triggered:
-                            # 将当前事件添加到已触发事件列表
-                            triggered.append(behavior_name)
-                            
-                            # 检查该组是否所有事件都已触发
-                            if set(triggered) == set(events):
-                                # 标记该组为已完成
-                                event_group_status[group_id]['completed'] = True
-                                
-                                # 获取事件组名称
-                                group_name = group_info.get('name', f'事件组 {group_id}')
-                                
-                                # 发送事件组完成通知
-                                socketio.emit('event_group_completed', {
-                                    'group_id': group_id,
-                                    'group_name': group_name,
-                                    'events': events,
-                                    'message': f'{group_name} 已完成，所有事件均已触发'
-                                })
-                                
-                                # 同时发送系统日志
-                                socketio.emit('log', {
-                                    'platform': 'system',
-                                    'message': f'事件组完成: {group_name} 中的所有事件 ({", ".join(events)}) 均已触发'
-                                })
-                
-                # Emit behavior triggered event with enhanced data
-                # 创建行为触发事件数据
-                behavior_data = {
-                    'behavior': behavior,
-                    'log': log_message,
-                    'extractedData': extracted_data,
-                    'validationResults': validation_results,
-                    'platform': platform,
-                    'timestamp': threading.current_thread().ident  # Simple timestamp substitute
-                }
-                
-                # 如果有验证错误，在日志消息中添加错误信息
-                if validation_results and not validation_results.get('isValid', True) and validation_results.get('error'):
-                    error_message = validation_results.get('error')
-                    behavior_data['log'] = f"{log_message}\n\n[JSON Schema验证失败]: {error_message}"
-                
-                # 发送行为触发事件
-                socketio.emit('behavior_triggered', behavior_data)
-                
-                # Log validation errors if any
-                if validation_results.get('error'):
-                    socketio.emit('log', {
-                        'platform': 'system',
-                        'message': f'Validation error in behavior "{behavior.get("name", "unknown")}": {validation_results["error"]}'
-                    })
-                    
-        except re.error as e:
-            socketio.emit('log', {
-                'platform': 'system', 
-                'message': f'Invalid regex pattern in behavior "{behavior.get("name", "unknown")}": {behavior["pattern"]} - {str(e)}'
-            })
-
-def read_log_stream(process, platform, tag=None):
+def read_log_stream(process, session, tag=None):
     """
     读取日志流并发送给客户端，支持多行日志合并
     
@@ -1003,7 +1008,7 @@ def read_log_stream(process, platform, tag=None):
     
     参数:
         process: 日志进程对象，包含 stdout 流
-        platform (str): 日志来源平台名称
+        session (AnalysisSession): 实时收集会话，提供平台、日志历史会话和收集状态
         tag (str, optional): 标签过滤器（当前未使用，保留用于扩展）
     
     功能:
@@ -1017,12 +1022,12 @@ def read_log_stream(process, platform, tag=None):
     日志格式:
         Android: MM-DD HH:MM:SS.mmm PID TID LEVEL TAG: message
     """
-    global logging_active
-    
     # 匹配 Android 日志格式的正则表达式
     # 格式: MM-DD HH:MM:SS.mmm PID TID LEVEL TAG: message
     android_log_pattern = re.compile(r'^\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.\d{3}\s+\d+\s+\d+\s+[VDIWEF]\s+\w+:')
     
+    platform = session.platform
+    session_id = session.history_session  # 本次收集对应的历史会话
     log_buffer = ""  # 日志缓冲区，用于合并多行日志
     last_log_time = time.time()  # 最后一次日志时间
     timeout_seconds = 2.0  # 不完整日志的超时时间
@@ -1037,13 +1042,13 @@ def read_log_stream(process, platform, tag=None):
         nonlocal log_buffer
         if log_buffer.strip():
             # 发送日志到前端
-            socketio.emit('log', {'platform': platform, 'message': log_buffer.strip()})
+            publish_log(platform, log_buffer.strip(), session_id)
             # 分析行为模式
-            analyze_log_behavior(log_buffer.strip(), platform)
+            session.analyze(log_buffer.strip())
             log_buffer = ""  # 清空缓冲区
     
     try:
-        while logging_active and process.poll() is None:
+        while session.active and process.poll() is None:
             # Use select to check if data is available with timeout
             import select
             ready, _, _ = select.select([process.stdout], [], [], 0.1)  # 100ms timeout
@@ -1061,7 +1066,7 @@ def read_log_stream(process, platform, tag=None):
                 continue
             
             # Check again if logging is still active before processing
-            if not logging_active:
+            if not session.active:
                 break
                 
             # 使用 'replace' 而不是 'ignore' 来确保所有字符都能被正确处理，包括表情符号
@@ -1086,8 +1091,8 @@ def read_log_stream(process, platform, tag=None):
                     log_buffer += "\n" + log_message
                 else:
                     # If no buffer exists, treat as standalone message
-                    socketio.emit('log', {'platform': platform, 'message': log_message})
-                    analyze_log_behavior(log_message, platform)
+                    publish_log(platform, log_message, session_id)
+                    session.analyze(log_message)
                 last_log_time = current_time
                 
         # Send any remaining buffered log
@@ -1095,8 +1100,8 @@ def read_log_stream(process, platform, tag=None):
             send_buffered_log()
             
     except Exception as e:
-        if logging_active:  # Only emit error if logging is still active
-            socketio.emit('log', {'platform': 'system', 'message': f'Error reading log stream: {str(e)}'})
+        if session.active:  # Only emit error if logging is still active
+            delivery.emit('log', {'platform': 'system', 'message': f'Error reading log stream: {str(e)}'})
     finally:
         # Send any remaining buffered log before terminating
         if log_buffer:
@@ -1185,19 +1190,19 @@ def get_command_path(command):
 
 @app.route('/start-log', methods=['POST'])
 def start_log():
-    # 不应该在这里重置triggered_events，否则会导致event_order功能失效
-    # global triggered_events
-    # triggered_events = []
     """
     启动指定平台的日志收集
     
     根据请求的平台类型启动相应的日志收集进程。支持 Android、iOS 和 HarmonyOS 平台。
-    在启动新的日志收集前，会先停止现有的日志收集进程。
+    每个设备（平台 + 设备序列号）对应一个实时收集分析会话，不同设备可以同时收集。
+    同一设备再次开始收集时沿用原来的会话，不重置已触发的事件，否则会导致 event_order 功能失效。
     
     请求体:
         JSON: {
             'platform': str,  # 平台类型 ('android', 'ios', 'harmonyos')
-            'tag': str        # 可选的标签过滤器
+            'tag': str,       # 可选的标签过滤器
+            'device': str,    # 可选的设备序列号（adb -s / idevicesyslog -u / hdc -t），未指定时使用默认设备
+            'record': bool    # 可选，是否把日志和分析事件录制到磁盘，默认使用 globalSettings.recording.enabled
         }
     
     返回:
@@ -1214,19 +1219,20 @@ def start_log():
         - 对应平台的工具必须已安装并在 PATH 中可用
         - 设备必须已连接并可被工具识别
     """
-    global log_process, grep_process, logging_active
-    
     # 解析请求数据
     data = request.get_json()
     platform = data.get('platform')
     tag = data.get('tag', '').strip()
+    device = (data.get('device') or '').strip()
+    key = f'{platform}:{device or "default"}'
     
     # 确保标签是UTF-8编码，以支持表情符号
     if tag and isinstance(tag, str):
         tag = tag.encode('utf-8').decode('utf-8')
     
-    # 检查是否已有日志进程在运行
-    if log_process and log_process.poll() is None:
+    # 检查该设备是否已有日志进程在运行
+    session = analysis_sessions.find('live', key)
+    if session and session.log_process and session.log_process.poll() is None:
         return 'A logging process is already running.', 400
     
     # 初始化命令配置
@@ -1237,7 +1243,7 @@ def start_log():
     if platform == 'android':
         # Android 平台：使用 adb logcat
         command_name = 'adb'
-        command = [get_command_path('adb'), 'logcat']
+        command = [get_command_path('adb')] + (['-s', device] if device else []) + ['logcat']
     elif platform == 'ios':
         # iOS 平台：使用 idevicesyslog
         # 注意：需要安装 libimobiledevice
@@ -1248,11 +1254,13 @@ def start_log():
             command = ['/opt/homebrew/bin/idevicesyslog']
         else:
             command = [get_command_path('idevicesyslog')]
+        if device:
+            command += ['-u', device]
     elif platform == 'harmonyos':
         # HarmonyOS 平台：使用 hdc hilog
         # 注意：支持本地工具目录和系统安装的 hdc
         command_name = 'hdc'
-        command = [get_command_path('hdc'), 'hilog']
+        command = [get_command_path('hdc')] + (['-t', device] if device else []) + ['hilog']
     else:
         # 不支持的平台
         return 'Invalid platform specified.', 400
@@ -1267,15 +1275,34 @@ def start_log():
             install_guide = 'Please download HarmonyOS SDK and add hdc to your PATH, or place hdc executable in the tools/ directory. Download from: https://developer.harmonyos.com/cn/develop/deveco-studio'
         
         error_message = f'Command "{command_name}" not found. {install_guide}'
-        socketio.emit('log', {'platform': 'system', 'message': error_message})
+        delivery.emit('log', {'platform': 'system', 'message': error_message})
         return error_message, 400
     
+    if session is None:
+        session = analysis_sessions.create('live', platform, key=key)
+        session.emit = lambda event, event_data, session=session: emit_live_event(session, event, event_data)
+    
     try:
         # 设置日志收集活跃标志
-        logging_active = True
+        session.active = True
+        
+        # 为本次收集开始新的日志历史会话，上一次收集的录制到此结束
+        if session.history_session:
+            session_recorder.stop(session.history_session)
+        session.history_session = start_history_session(platform)
+        record = data.get('record')
+        if session_recorder.enabled if record is None else bool(record):
+            session_recorder.start(session.history_session, {
+                'platform': platform,
+                'device': device or None,
+                'analysisSession': session.id,
+                'rulesetVersion': session.ruleset.version
+            })
+            delivery.emit('log', {'platform': 'system',
+                                  'message': f'Recording session {session.history_session} to {session_recorder.directory}'})
         
         # 启动主日志进程
-        log_process = subprocess.Popen(
+        log_process = session.log_process = subprocess.Popen(
             command,
             stdout=subprocess.PIPE,  # 捕获标准输出
             stderr=subprocess.PIPE,  # 捕获标准错误
@@ -1283,16 +1310,16 @@ def start_log():
             bufsize=1  # 行缓冲
         )
         
-        socketio.emit('log', {'platform': 'system', 'message': f'Starting {platform} log collection...'})
+        delivery.emit('log', {'platform': 'system', 'message': f'Starting {platform} log collection... (会话 {session.id})'})
         
         # 如果请求标签过滤，通过 grep 管道处理
         if tag:
-            socketio.emit('log', {'platform': 'system', 'message': f'Applying tag filter: "{tag}"'})
+            delivery.emit('log', {'platform': 'system', 'message': f'Applying tag filter: "{tag}"'})
             
             # 使用二进制模式处理标签，确保表情符号等Unicode字符能被正确处理
             tag_bytes = tag.encode('utf-8') if isinstance(tag, str) else tag
             
-            grep_process = subprocess.Popen(
+            grep_process = session.grep_process = subprocess.Popen(
                 ['grep', '--line-buffered', '-F', '-e', tag_bytes],  # 行缓冲模式，固定字符串匹配，使用-e参数传递二进制标签
                 stdin=log_process.stdout,   # 从日志进程的输出读取
                 stdout=subprocess.PIPE,     # 捕获过滤后的输出
@@ -1305,63 +1332,63 @@ def start_log():
             # 启动线程读取 grep 进程输出
             log_thread = threading.Thread(
                 target=read_log_stream,
-                args=(grep_process, platform, tag)
+                args=(grep_process, session, tag)
             )
-            log_threads.append(log_thread)
+            session.threads.append(log_thread)
             
             # 启动线程处理 grep 标准错误
             def read_grep_stderr():
                 try:
-                    while logging_active:
+                    while session.active:
                         line = grep_process.stderr.readline()
                         if not line:
                             if grep_process.poll() is not None:
                                 break
                             continue
-                        if not logging_active:
+                        if not session.active:
                             break
                         error_message = line.decode('utf-8', errors='ignore').strip()
                         if error_message:
-                            socketio.emit('log', {'platform': 'system', 'message': f'Grep ERROR: {error_message}'})
+                            delivery.emit('log', {'platform': 'system', 'message': f'Grep ERROR: {error_message}'})
                 except Exception as e:
-                    if logging_active:
-                        socketio.emit('log', {'platform': 'system', 'message': f'Error reading grep stderr: {str(e)}'})
+                    if session.active:
+                        delivery.emit('log', {'platform': 'system', 'message': f'Error reading grep stderr: {str(e)}'})
             
             grep_stderr_thread = threading.Thread(target=read_grep_stderr)
-            log_threads.append(grep_stderr_thread)
+            session.threads.append(grep_stderr_thread)
             grep_stderr_thread.start()
         else:
             # 启动线程直接从主进程读取
             log_thread = threading.Thread(
                 target=read_log_stream,
-                args=(log_process, platform, tag)
+                args=(log_process, session, tag)
             )
-            log_threads.append(log_thread)
+            session.threads.append(log_thread)
         
         log_thread.start()
         
         # 启动线程处理标准错误
         def read_stderr():
             try:
-                while logging_active and log_process.poll() is None:
+                while session.active and log_process.poll() is None:
                     line = log_process.stderr.readline()
                     if not line:
                         continue
-                    if not logging_active:
+                    if not session.active:
                         break
                     error_message = line.decode('utf-8', errors='ignore').strip()
                     if error_message:
-                        socketio.emit('log', {'platform': 'system', 'message': f'ERROR: {error_message}'})
+                        delivery.emit('log', {'platform': 'system', 'message': f'ERROR: {error_message}'})
             except Exception as e:
-                if logging_active:
-                    socketio.emit('log', {'platform': 'system', 'message': f'Error reading stderr: {str(e)}'})
+                if session.active:
+                    delivery.emit('log', {'platform': 'system', 'message': f'Error reading stderr: {str(e)}'})
         
         stderr_thread = threading.Thread(target=read_stderr)
-        log_threads.append(stderr_thread)
+        session.threads.append(stderr_thread)
         stderr_thread.start()
         
         # 通知前端日志收集已激活
-        socketio.emit('logging_status', {'active': True})
+        delivery.emit('logging_status', {'active': True, 'session': session.id})
         
         return f'{platform} logging started.', 200
         
@@ -1376,8 +1403,9 @@ def start_log():
         else:
             install_guide = 'Please ensure the required command is installed and accessible.'
         
+        session.active = False
         error_message = f'Failed to start {platform} logging. {install_guide} Error: {str(e)}'
-        socketio.emit('log', {'platform': 'system', 'message': error_message})
+        delivery.emit('log', {'platform': 'system', 'message': error_message})
         return error_message, 500
 
 @app.route('/stop-log', methods=['POST'])
@@ -1385,63 +1413,83 @@ def stop_log():
     """
     停止日志收集并触发最终事件组检查
     
-    终止当前运行的日志收集进程，包括主日志进程和可能的 grep 过滤进程。
+    终止实时收集会话的日志收集进程，包括主日志进程和可能的 grep 过滤进程。
     同时清理相关的线程资源，并通知前端日志收集已停止。
     在停止日志收集时，会触发最终的事件组检查，确保所有已配置的事件组状态都被正确评估。
+    会话本身保留，同一设备再次开始收集时继续追踪事件。
+    
+    请求体（可选）:
+        JSON: {
+            'session': str,   # 要停止的实时收集会话ID
+            'platform': str,  # 或者按平台和设备序列号指定
+            'device': str
+        }
+        未指定时停止所有正在收集的会话。
     
     返回:
         str: 操作结果消息
         - 成功: 'Logging processes stopped successfully.' (HTTP 200)
         - 失败: 'No logging process was running.' (HTTP 200)
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('session'):
+        session = analysis_sessions.get(data['session'])
+        sessions = [session] if session and session.kind == 'live' else []
+    elif data.get('platform'):
+        session = analysis_sessions.find('live', f'{data["platform"]}:{(data.get("device") or "").strip() or "default"}')
+        sessions = [session] if session else []
+    else:
+        sessions = [session for session in analysis_sessions.list('live') if session.active or session.log_process]
+    
+    stopped_processes = []
+    for session in sessions:
+        stopped_processes.extend(stop_live_session(session))
+    
+    # 根据停止的进程数量返回相应的消息
+    if stopped_processes:
+        message = f"Stopped: {', '.join(stopped_processes)}"
+        delivery.emit('log', {'platform': 'system', 'message': message})
+        return 'Logging processes stopped successfully.', 200
+    else:
+        delivery.emit('log', {'platform': 'system', 'message': 'No active logging processes found.'})
+        return 'No logging process was running.', 200
+
+def stop_live_session(session):
+    """
+    停止一个实时收集会话的进程和线程
     
     清理流程:
-        1. 设置日志收集状态为非活跃
+        1. 设置会话的收集状态为非活跃
         2. 立即通知前端状态变更
         3. 触发最终事件组检查
-        4. 等待所有相关线程结束
+        4. 等待会话的所有线程结束
         5. 终止 grep 过滤进程（如果存在）
         6. 终止主日志收集进程
-        7. 清理进程和线程资源
-    """
-    global log_process, grep_process, logging_active, log_threads, event_group_config, event_group_status
     
+    参数:
+        session (AnalysisSession): 实时收集会话
+    
+    返回:
+        list: 已停止的进程和线程描述
+    """
     # 设置日志收集状态为非活跃，停止日志流处理
-    logging_active = False
+    session.active = False
     
     # 立即向前端发送状态更新
-    socketio.emit('logging_status', {'active': False})
+    delivery.emit('logging_status', {
+        'active': any(item.active for item in analysis_sessions.list('live')),
+        'session': session.id
+    })
     
     # 触发最终事件组检查
     # 检查所有未完成的事件组，发送状态通知
-    for group_id, group_info in event_group_status.items():
-        if not group_info['completed']:
-            events = group_info['events']
-            triggered = group_info['triggered']
-            missing_events = [event for event in events if event not in triggered]
-            
-            # 获取事件组名称
-            group_name = group_info.get('name', f'事件组 {group_id}')
-            
-            # 发送事件组未完成通知
-            socketio.emit('event_group_incomplete', {
-                'group_id': group_id,
-                'group_name': group_name,
-                'events': events,
-                'triggered': triggered,
-                'missing_events': missing_events,
-                'message': f'{group_name} 未完成，缺少事件: {", ".join(missing_events)}'
-            })
-            
-            # 同时发送系统日志
-            socketio.emit('log', {
-                'platform': 'system',
-                'message': f'{group_name} 未完成，缺少事件: {", ".join(missing_events)}'
-            })
+    for event, data in session.incomplete_group_notices():
+        session.emit(event, data)
     
     stopped_processes = []
     
     # 等待所有日志处理线程结束
-    for thread in log_threads:
+    for thread in session.threads:
         if thread.is_alive():
             try:
                 thread.join(timeout=1)  # 最多等待1秒让每个线程结束
@@ -1450,51 +1498,34 @@ def stop_log():
                 else:
                     stopped_processes.append('thread')
             except Exception as e:
-                socketio.emit('log', {'platform': 'system', 'message': f'Error stopping thread: {str(e)}'})
+                delivery.emit('log', {'platform': 'system', 'message': f'Error stopping thread: {str(e)}'})
     
     # 清空线程列表
-    log_threads.clear()
+    session.threads.clear()
     
-    # 首先停止 grep 过滤进程（如果存在）
-    if grep_process and grep_process.poll() is None:
-        try:
-            grep_process.terminate()  # 发送终止信号
+    # 首先停止 grep 过滤进程，然后停止主日志收集进程
+    for attribute, label in (('grep_process', 'grep filter'), ('log_process', 'log collection')):
+        process = getattr(session, attribute)
+        if process and process.poll() is None:
             try:
-                grep_process.wait(timeout=2)  # 等待进程优雅退出
-                stopped_processes.append('grep filter')
-            except subprocess.TimeoutExpired:
-                grep_process.kill()  # 强制杀死进程
-                grep_process.wait()
-                stopped_processes.append('grep filter (force killed)')
-        except Exception as e:
-            socketio.emit('log', {'platform': 'system', 'message': f'Error stopping grep process: {str(e)}'})
-        finally:
-            grep_process = None
-    
-    # 停止主日志收集进程
-    if log_process and log_process.poll() is None:
-        try:
-            log_process.terminate()  # 发送终止信号
-            try:
-                log_process.wait(timeout=2)  # 等待进程优雅退出
-                stopped_processes.append('log collection')
-            except subprocess.TimeoutExpired:
-                log_process.kill()  # 强制杀死进程
-                log_process.wait()
-                stopped_processes.append('log collection (force killed)')
-        except Exception as e:
-            socketio.emit('log', {'platform': 'system', 'message': f'Error stopping log process: {str(e)}'})
-        finally:
-            log_process = None
+                process.terminate()  # 发送终止信号
+                try:
+                    process.wait(timeout=2)  # 等待进程优雅退出
+                    stopped_processes.append(label)
+                except subprocess.TimeoutExpired:
+                    process.kill()  # 强制杀死进程
+                    process.wait()
+                    stopped_processes.append(f'{label} (force killed)')
+            except Exception as e:
+                delivery.emit('log', {'platform': 'system', 'message': f'Error stopping {label} process: {str(e)}'})
+        setattr(session, attribute, None)
     
-    # 根据停止的进程数量返回相应的消息
-    if stopped_processes:
-        message = f"Stopped: {', '.join(stopped_processes)}"
-        socketio.emit('log', {'platform': 'system', 'message': message})
-        return 'Logging processes stopped successfully.', 200
-    else:
-        socketio.emit('log', {'platform': 'system', 'message': 'No active logging processes found.'})
-        return 'No logging process was running.', 200
+    # 结束录制（写入线程写完队列中的记录后关闭文件）
+    if session_recorder.is_recording(session.history_session):
+        session_recorder.stop(session.history_session)
+        stopped_processes.append('recording')
+    
+    return stopped_processes
 
 # WebSocket events
 @socketio.on('connect')
@@ -1513,9 +1544,316 @@ def handle_connect():
         - 'logging_status': 包含当前日志收集是否活跃的状态信息
     """
     print(f'Client connected: {request.sid}')  # 记录客户端连接，包含唯一会话ID
+    # 为新客户端建立分级投递队列
+    delivery.start()
+    delivery.add_client(request.sid)
+    stream_stats.start(socketio, lambda snapshot: delivery.emit('stream_stats', snapshot))
+    config_watcher.start(socketio)
     # 向新连接的客户端发送当前日志收集状态
-    emit('logging_status', {'active': logging_active})
+    emit('logging_status', {'active': any(session.active for session in analysis_sessions.list('live'))})
     emit('log', {'platform': 'system', 'message': 'Connected to log server.'})
+    # 告知客户端当前会话和可回放的历史范围，客户端据此发送 resume 续传
+    emit('history_info', {'session': current_session_id, 'sessions': log_history.sessions()})
+
+@socketio.on('resume')
+def handle_resume(data):
+    """
+    处理客户端的续传请求
+    
+    客户端发送最后收到的游标，服务器返回该游标之后的一页历史记录。
+    客户端在 has_more 为真时使用 next_cursor 继续请求下一页。
+    
+    请求数据:
+        {'session': str, 'cursor': int, 'limit': int, 'filter': str}
+    
+    发送事件:
+        - 'log_replay': 与 /api/logs 相同格式的分页结果；
+                        cursor 或 limit 不是整数时为 {'session', 'error', 'records': [], 'has_more': False}
+    """
+    data = data or {}
+    session_id = data.get('session') or current_session_id
+    try:
+        cursor = int(data.get('cursor') or 0)
+        limit = max(1, min(int(data.get('limit') or 500), 5000))
+    except (TypeError, ValueError):
+        emit('log_replay', {'session': session_id, 'error': 'cursor and limit must be integers',
+                            'records': [], 'has_more': False})
+        return
+    page = log_history.fetch(
+        session_id,
+        cursor=cursor,
+        limit=limit,
+        text_filter=data.get('filter')
+    )
+    emit('log_replay', page)
+
+@app.route('/api/logs', methods=['GET'])
+def get_logs():
+    """
+    分页获取服务器端保存的日志历史
+    
+    查询参数:
+        session (str, optional): 会话ID，默认为当前会话
+        cursor (int, optional): 返回游标大于该值的记录，默认为 0（从最早记录开始）
+        limit (int, optional): 每页记录数，默认 500，最大 5000
+        filter (str, optional): 只返回包含该文本的记录（不区分大小写）
+    
+    返回:
+        JSON: {
+            'session': str,
+            'records': list,       # [{'cursor', 'session', 'platform', 'message', 'time'}]
+            'next_cursor': int,    # 下一页使用的游标
+            'has_more': bool,
+            'oldest_cursor': int,
+            'latest_cursor': int,
+            'truncated': bool      # 请求的游标已被覆盖
+        }
+    """
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = max(1, min(int(request.args.get('limit', 500)), 5000))
+    except ValueError:
+        return jsonify({'error': 'cursor and limit must be integers'}), 400
+    page = log_history.fetch(
+        request.args.get('session') or current_session_id,
+        cursor=cursor,
+        limit=limit,
+        text_filter=request.args.get('filter')
+    )
+    return jsonify(page)
+
+@app.route('/api/logs/sessions', methods=['GET'])
+def get_log_sessions():
+    """
+    列出服务器端保存的日志历史会话
+    
+    返回:
+        JSON: {'current': str, 'sessions': list}
+    """
+    return jsonify({'current': current_session_id, 'sessions': log_history.sessions()})
+
+@app.route('/api/recordings', methods=['GET'])
+def list_recordings():
+    """
+    列出磁盘上的会话录制
+    
+    返回:
+        JSON: {'status': {'enabled', 'directory', 'active', 'pending', 'dropped'}, 'recordings': list}
+    """
+    return jsonify({'status': session_recorder.status(), 'recordings': session_recorder.list()})
+
+@app.route('/api/recordings/<recording_id>', methods=['GET'])
+def get_recording(recording_id):
+    """
+    分页读取会话录制的记录，通过稀疏索引按序号或时间定位
+    
+    查询参数:
+        seq (int, optional): 从该序号开始
+        time (float, optional): 从该时间（Unix 时间戳）开始，同时指定时以 seq 为准
+        limit (int, optional): 每页记录数，默认 1000，最大 10000
+        types (str, optional): 逗号分隔的记录类型（log、hit、event），默认全部
+    
+    返回:
+        JSON: {'session', 'info', 'records': list, 'next_seq': int, 'has_more': bool}
+        - 404: 录制不存在
+    """
+    try:
+        from_seq = int(request.args['seq']) if request.args.get('seq') else None
+        from_time = float(request.args['time']) if request.args.get('time') and from_seq is None else None
+        limit = max(1, min(int(request.args.get('limit', 1000)), 10000))
+        types = [item for item in (request.args.get('types') or '').split(',') if item]
+        if any(item not in RECORD_TYPES for item in types):
+            raise ValueError(f'types must be a subset of {", ".join(RECORD_TYPES)}')
+        page = session_recorder.read(recording_id, from_seq, from_time, limit, types)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if page is None:
+        return jsonify({'error': f'Recording {recording_id} not found'}), 404
+    page['info'] = session_recorder.info(recording_id)
+    return jsonify(page)
+
+@app.route('/api/replay', methods=['POST'])
+def start_replay():
+    """
+    回放录制的会话、日志历史会话或服务器本地日志文件
+    
+    日志重新经过完整的处理流程（历史记录、投递和行为分析），在独立的分析会话中分析，
+    结束后执行与导入相同的最终检查。可以指定另一份配置文件，用于回归测试新规则集。
+    
+    请求体:
+        JSON: {
+            'recording': str,     # 录制ID（三种来源必须且只能指定一个）
+            'session': str,       # 日志历史会话ID（例如导入的日志）
+            'path': str,          # 服务器本地日志文件，限制与 /api/import/paths 相同
+            'member': str,        # 可选，zip 压缩包中要回放的成员
+            'fromSeq': int,       # 可选，录制从该序号开始
+            'fromTime': float,    # 可选，录制从该时间（Unix 时间戳）开始
+            'platform': str,      # 平台类型，录制默认使用录制信息中的平台
+            'speed': str|float,   # 'original'（默认）、'max' 或倍数
+            'maxGap': float,      # 可选，相邻两行的最大间隔（秒），压缩长时间的空闲
+            'config': str         # 可选，使用该配置文件编译的规则集分析（路径限制同 path）
+        }
+    
+    返回:
+        JSON: {'success': bool, 'replay': dict}
+        - 400: 参数无效或配置无效（附带验证报告）
+        - 404: 录制或历史会话不存在
+    """
+    data = request.get_json(silent=True) or {}
+    sources = [key for key in ('recording', 'session', 'path') if data.get(key)]
+    if len(sources) != 1:
+        return jsonify({'success': False, 'message': 'Exactly one of recording, session or path is required.'}), 400
+    source = {sources[0]: data[sources[0]]}
+    platform = data.get('platform')
+    try:
+        speed = parse_speed(data.get('speed'))
+        max_gap = float(data['maxGap']) if data.get('maxGap') is not None else None
+        if max_gap is not None and max_gap < 0:
+            raise ValueError('maxGap must not be negative')
+        options = {
+            'from_seq': int(data['fromSeq']) if data.get('fromSeq') is not None else None,
+            'from_time': float(data['fromTime']) if data.get('fromTime') is not None else None,
+            'member': data.get('member')
+        }
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if 'recording' in source:
+        info = session_recorder.info(source['recording'])
+        if info is None:
+            return jsonify({'success': False, 'message': f'Recording {source["recording"]} not found.'}), 404
+        platform = platform or info.get('platform')
+    elif 'session' in source:
+        if log_history.session_info(source['session']) is None:
+            return jsonify({'success': False, 'message': f'Log session {source["session"]} not found.'}), 404
+    else:
+        files, errors = resolve_import_paths([source['path']])
+        if len(files) != 1:
+            message = errors[0]['error'] if errors else 'Path must match exactly one file.'
+            return jsonify({'success': False, 'message': message, 'errors': errors}), 400
+        source['path'] = files[0]
+    if not platform:
+        return jsonify({'success': False, 'message': 'Invalid request data. Missing platform.'}), 400
+    
+    if data.get('config'):
+        files, errors = resolve_import_paths([data['config']])
+        if len(files) != 1:
+            message = errors[0]['error'] if errors else 'Config must match exactly one file.'
+            return jsonify({'success': False, 'message': message, 'errors': errors}), 400
+        compilation = compile_config_file(files[0], SCHEMA_FILE)
+        if not compilation.valid:
+            return jsonify({'success': False, 'message': compilation.error_message(),
+                            'report': compilation.to_dict()}), 400
+        options['ruleset'] = compilation.ruleset
+        source['config'] = files[0]
+    
+    job = replay_jobs.submit(ReplayJob(source, platform, speed, max_gap, options))
+    delivery.emit('log', {'platform': 'system', 'message': f'已创建回放任务 {job.id}: {source}'})
+    return jsonify({'success': True, 'replay': job.to_dict()}), 202
+
+@app.route('/api/replay', methods=['GET'])
+def list_replays():
+    """
+    列出回放任务（运行中和最近结束的任务）
+    
+    返回:
+        JSON: {'success': bool, 'replays': list}
+    """
+    return jsonify({'success': True, 'replays': replay_jobs.list()})
+
+@app.route('/api/replay/<replay_id>', methods=['GET'])
+def get_replay(replay_id):
+    """
+    获取回放任务的状态、速率、各阶段耗时和最终检查结果
+    """
+    job = replay_jobs.get(replay_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'Replay {replay_id} not found.'}), 404
+    return jsonify({'success': True, 'replay': job.to_dict()})
+
+@app.route('/api/replay/<replay_id>/cancel', methods=['POST'])
+def cancel_replay(replay_id):
+    """
+    取消回放任务：等待中的回放立即停止，其余在下一次检查时停止
+    """
+    if not replay_jobs.cancel(replay_id):
+        job = replay_jobs.get(replay_id)
+        if job is None:
+            return jsonify({'success': False, 'message': f'Replay {replay_id} not found.'}), 404
+        return jsonify({'success': False, 'message': f'Replay {replay_id} already {job.status}.'}), 409
+    return jsonify({'success': True, 'message': f'Replay {replay_id} cancellation requested.'})
+
+def iter_replay_records(job):
+    """
+    读取回放来源
+    
+    录制使用采集时间计算间隔；历史会话和本地文件使用日志行自带的时间戳。
+    
+    参数:
+        job (ReplayJob): 回放任务
+    
+    产出:
+        tuple: (日志时间或 None, 平台或 None, 日志行)
+    """
+    source = job.source
+    if 'recording' in source:
+        for record in session_recorder.iter_records(source['recording'], job.options.get('from_seq'),
+                                                    job.options.get('from_time')):
+            if record['type'] == 'log':
+                yield record['time'], record.get('platform'), record['message']
+    elif 'session' in source:
+        cursor = 0
+        while True:
+            page = log_history.fetch(source['session'], cursor, limit=5000)
+            for record in page['records']:
+                yield parse_log_time(record['message']), record['platform'], record['message']
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+    else:
+        with open(source['path'], 'rb') as f:
+            lines, _, _ = open_log_lines(f, job.options.get('member'), use_mmap=True)
+            for line in lines:
+                yield parse_log_time(line), None, line
+
+def run_replay_job(job):
+    """
+    执行回放任务（在回放线程中运行）
+    
+    回放在独立的分析会话中分析（绑定指定配置的规则集，默认为当前规则集），
+    日志写入新的日志历史会话，不影响实时收集和导入。
+    
+    参数:
+        job (ReplayJob): 回放任务
+    
+    返回:
+        dict: 最终检查结果
+    """
+    session = analysis_sessions.create('replay', job.platform, ruleset=job.options.get('ruleset'))
+    job.analysis_session_id = session.id
+    job.ruleset_version = session.ruleset.version
+    job.session_id = session.history_session = start_history_session('replay')
+    speed = f'{job.speed}x' if job.speed else 'max'
+    delivery.emit('log', {'platform': 'system', 'message': f'开始回放 {job.id} (速度 {speed}, 规则集 {job.ruleset_version})'})
+    
+    try:
+        run_replay(
+            job,
+            iter_replay_records(job),
+            publish=lambda platform, line: publish_log(platform, line, session.history_session),
+            analyze=session.analyze,
+            on_progress=lambda: replay_jobs.report(job)
+        )
+    except Exception:
+        delivery.emit('log', {'platform': 'system', 'message': f'回放 {job.id} 已停止, 已处理 {job.lines} 行'})
+        raise
+    finally:
+        analysis_sessions.finish(session)
+    
+    final_check_results = perform_final_check(session, error_count=job.error_lines, replay_id=job.id)
+    progress = job.progress()
+    delivery.emit('log', {'platform': 'system', 'message': f'回放完成 {job.id}: {progress["lines"]} 行, {progress["lines_per_sec"]} 行/秒'})
+    return final_check_results
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -1533,6 +1871,76 @@ def handle_disconnect():
         其他连接的客户端仍然可以继续接收日志数据。
     """
     print(f'Client disconnected: {request.sid}')  # 记录客户端断开连接，包含唯一会话ID
+    delivery.remove_client(request.sid)
+
+@app.route('/api/delivery/stats', methods=['GET'])
+def delivery_stats():
+    """
+    获取分级投递统计
+    
+    返回每个投递通道（analysis/system/raw）的权重、待发送数量、丢弃数量，
+    以及从分析完成到实际发送的延迟统计（平均值、P50、P95、最大值）。
+    
+    返回:
+        JSON: 投递统计信息
+    """
+    return jsonify(delivery.get_stats())
+
+@app.route('/api/stream-stats', methods=['GET'])
+def get_stream_stats():
+    """
+    获取日志流统计的历史快照
+    
+    每个快照包含一秒内按平台、级别、标签统计的行数/秒和字节数/秒，
+    以及每个行为的命中次数/秒和整体命中率。实时快照通过 stream_stats 事件每秒推送。
+    
+    查询参数:
+        seconds (int, optional): 只返回最近 N 秒的快照，默认返回全部（最多 300 秒）
+    
+    返回:
+        JSON: {'history': list}
+    """
+    seconds = request.args.get('seconds', type=int)
+    return jsonify({'history': stream_stats.get_history(seconds)})
+
+@app.route('/api/delivery/policy', methods=['GET'])
+def get_delivery_policy():
+    """
+    获取各会话的原始日志投递策略状态
+    
+    返回:
+        JSON: {'defaults': dict, 'sessions': {session_id: {'settings', 'mode', 'input_rate', 'admitted', 'suppressed'}}}
+    """
+    return jsonify({'defaults': delivery_policies.defaults, 'sessions': delivery_policies.status()})
+
+@app.route('/api/delivery/policy', methods=['POST'])
+def update_delivery_policy():
+    """
+    为单个会话设置原始日志投递策略
+    
+    请求体:
+        JSON: {
+            'session': str,                     # 会话ID，默认为当前会话
+            'maxLinesPerSecond': int,           # 每秒最多投递行数，0 表示不限
+            'perTagLinesPerSecond': int,        # 每个标签每秒最多投递行数
+            'perTagBurst': int,                 # 标签令牌桶容量
+            'sampleRepeatedTagsAfter': int,     # 同一标签每秒超过该行数后开始采样
+            'sampleRate': int,                  # 采样时每 N 行投递 1 行
+            'behaviorsOnlyAbove': int,          # 输入速率超过该值时自动切换到仅行为模式
+            'behaviorsOnlyRecoverBelow': int    # 速率低于该值时恢复正常投递
+        }
+    
+    返回:
+        JSON: 该会话的策略状态
+        - 400: 包含未知的配置项或配置值不是非负整数
+    """
+    data = request.get_json() or {}
+    session_id = data.pop('session', None) or current_session_id
+    try:
+        policy = delivery_policies.override(session_id, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'session': session_id, 'policy': policy})
 
 # 初始化Elasticsearch搜索服务
 def initialize_es_search_service():
@@ -1541,8 +1949,9 @@ def initialize_es_search_service():
     try:
         # 从环境变量获取环境配置，默认为sandbox
         es_env = os.environ.get('ES_ENV', 'sandbox')
-        es_search_service = get_es_search_service(env=es_env)
+        es_search_service = get_es_search_service(env=es_env, sessions=analysis_sessions)
         if es_search_service:
+            es_search_service.configure(es_search_settings)
             print(f"Elasticsearch搜索服务初始化成功，环境: {es_env}")
         else:
             print("Elasticsearch搜索服务初始化失败")
@@ -1555,21 +1964,31 @@ def es_search():
     """
     Elasticsearch日志搜索接口
     
-    接收前端发送的搜索参数，执行Elasticsearch日志搜索和行为分析。
+    接收前端发送的搜索参数，创建搜索任务执行Elasticsearch日志搜索和行为分析。
+    多个用户的搜索作为独立任务并行执行（同时运行的数量受 globalSettings.esSearch.maxConcurrent 限制，
+    超过上限时排队），每个任务有自己的进度、取消和结果通道。
     
     请求体:
         JSON: {
             'index_name': str,      # 索引名称
-            'user_id': str,         # 用户ID
+            'user_key': str,        # 属性键 (如 userId)
+            'user_value': str,      # 属性值，/.../ 或包含正则字符时按正则匹配
+            'user_id': str,         # 兼容旧参数，等同于 user_key='userId'
             'start_time': str,      # 开始时间 (ISO格式)
             'end_time': str,        # 结束时间 (ISO格式)
-            'platform': str         # 平台类型 (elasticsearch)
+            'platform': str,        # 平台类型 (elasticsearch)
+            'query_template': dict, # 可选，查询模板
+            'log_param': str,       # 可选，日志匹配参数
+            'sid': str              # 可选，客户端的 Socket.IO sid：该客户端加入任务房间，任务事件只发送到房间；
+                                    # 未提供时任务事件发送给所有客户端
         }
     
     返回:
         JSON: {
             'success': bool,        # 搜索是否成功启动
-            'message': str          # 状态消息
+            'message': str,         # 状态消息
+            'job_id': str,          # 任务ID，用于查询状态和停止搜索
+            'room': str             # 任务事件的房间，其他客户端可以通过 es_search_join 事件订阅
         }
     
     异常处理:
@@ -1583,8 +2002,12 @@ def es_search():
         if not data:
             return jsonify({'success': False, 'message': '请求数据格式错误'}), 400
         
+        # 兼容旧参数 user_id
+        if data.get('user_id') and not data.get('user_key'):
+            data['user_key'], data['user_value'] = 'userId', data['user_id']
+        
         # 验证必需参数
-        required_fields = ['index_name', 'user_id', 'start_time', 'end_time', 'platform']
+        required_fields = ['index_name', 'user_key', 'user_value', 'start_time', 'end_time', 'platform']
         for field in required_fields:
             if not data.get(field):
                 return jsonify({'success': False, 'message': f'缺少必需参数: {field}'}), 400
@@ -1595,7 +2018,8 @@ def es_search():
         
         # 提取参数
         index_name = data['index_name'].strip()
-        user_id = data['user_id'].strip()
+        user_key = data['user_key'].strip()
+        user_value = data['user_value'].strip()
         start_time = data['start_time']
         end_time = data['end_time']
         platform = data.get('platform', 'elasticsearch')
@@ -1608,28 +2032,36 @@ def es_search():
         except ValueError:
             return jsonify({'success': False, 'message': '时间格式错误，请使用ISO格式'}), 400
         
-        # 发送开始搜索的系统消息
-        socketio.emit('log', {
-            'platform': 'system',
-            'message': f'开始Elasticsearch搜索: 索引={index_name}, 用户ID={user_id}'
-        })
-        
-        # 执行搜索
-        result = es_search_service.search_logs(
+        # 创建任务，请求方先加入任务房间再启动，不会错过任务开始时的事件
+        sid = data.get('sid')
+        job = es_search_service.create_job(
             index_name=index_name,
-            user_id=user_id,
+            user_key=user_key,
+            user_value=user_value,
             start_time=start_time,
             end_time=end_time,
             platform=platform,
-            socketio=socketio
+            socketio=delivery,
+            query_template=data.get('query_template'),
+            log_param=data.get('log_param'),
+            room=bool(sid)
         )
+        if sid and not delivery.join_room(sid, job.room):
+            return jsonify({'success': False, 'message': f'客户端 {sid} 未连接'}), 400
+        
+        # 发送开始搜索的系统消息
+        job.emit('log', {
+            'platform': 'system',
+            'message': f'已创建Elasticsearch搜索任务 {job.id}: 索引={index_name}, {user_key}={user_value}'
+        })
+        es_search_service.start_job(job)
         
-        return jsonify(result)
+        return jsonify({'success': True, 'message': '搜索任务已启动', 'job_id': job.id, 'room': job.room})
         
     except Exception as e:
         error_message = f'Elasticsearch搜索请求处理失败: {str(e)}'
         print(f"[ES Search Error] {error_message}")
-        socketio.emit('log', {
+        delivery.emit('log', {
             'platform': 'system',
             'message': error_message
         })
@@ -1639,49 +2071,50 @@ def es_search():
 @app.route('/api/es/search/status', methods=['GET'])
 def es_search_status():
     """
-    获取Elasticsearch搜索状态
+    获取Elasticsearch搜索任务状态
     
-    返回当前搜索任务的状态信息，包括是否正在搜索、进度等。
+    查询参数:
+        job_id (str, optional): 任务ID，未提供时返回所有任务（排队中、运行中和最近结束的任务）
     
     返回:
-        JSON: {
-            'searching': bool,     # 是否正在搜索
+        JSON: 指定任务时为任务状态 {
+            'job_id': str,
+            'status': str,         # queued、running、completed、cancelled、failed
+            'searching': bool,     # 是否正在搜索（排队中或运行中）
             'progress': float,     # 搜索进度 (0-1)
             'processed': int,      # 已处理数量
-            'total': int           # 总数
-        }
+            'total': int,          # 总数
+            ...
+        }，否则为 {'jobs': list, 'maxConcurrent': int, 'cache': dict}（cache 为查询结果缓存的状态）
     
     异常处理:
-        - 服务未初始化时返回默认状态
+        - 404: 任务不存在
+        - 服务未初始化时返回空状态
     """
-    try:
-        if not es_search_service:
-            return jsonify({
-                'searching': False,
-                'progress': 0,
-                'processed': 0,
-                'total': 0
-            })
-        
-        status = es_search_service.get_search_status()
-        return jsonify(status)
-        
-    except Exception as e:
-        print(f"[ES Status Error] 获取搜索状态失败: {e}")
-        return jsonify({
-            'searching': False,
-            'progress': 0,
-            'processed': 0,
-            'total': 0
-        }), 500
+    job_id = request.args.get('job_id')
+    if not es_search_service:
+        if job_id:
+            return jsonify({'success': False, 'message': 'Elasticsearch搜索服务未初始化'}), 404
+        return jsonify({'jobs': [], 'maxConcurrent': 0, 'cache': None})
+    
+    if not job_id:
+        return jsonify({'jobs': es_search_service.list(), 'maxConcurrent': es_search_service.max_concurrent,
+                        'cache': es_search_service.cache.status()})
+    status = es_search_service.get_search_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'message': f'搜索任务 {job_id} 不存在'}), 404
+    return jsonify(status)
 
 
 @app.route('/api/es/search/stop', methods=['POST'])
 def es_search_stop():
     """
-    停止Elasticsearch搜索
+    停止Elasticsearch搜索任务
+    
+    只停止指定的任务，其他用户的搜索不受影响。
     
-    停止当前正在进行的Elasticsearch搜索任务。
+    请求体:
+        JSON: {'job_id': str}
     
     返回:
         JSON: {
@@ -1690,26 +2123,69 @@ def es_search_stop():
         }
     
     异常处理:
+        - 400: 缺少任务ID
+        - 404: 任务不存在
+        - 409: 任务已结束
         - 服务未初始化错误
     """
     try:
         if not es_search_service:
             return jsonify({'success': False, 'message': 'Elasticsearch搜索服务未初始化'})
         
-        es_search_service.stop_search()
+        job_id = (request.get_json(silent=True) or {}).get('job_id') or request.args.get('job_id')
+        if not job_id:
+            return jsonify({'success': False, 'message': '缺少必需参数: job_id'}), 400
         
-        socketio.emit('log', {
-            'platform': 'system',
-            'message': 'Elasticsearch搜索已停止'
-        })
+        if not es_search_service.stop_search(job_id):
+            job = es_search_service.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'搜索任务 {job_id} 不存在'}), 404
+            return jsonify({'success': False, 'message': f'搜索任务 {job_id} 已结束 ({job.status})'}), 409
         
-        return jsonify({'success': True, 'message': '搜索已停止'})
+        return jsonify({'success': True, 'message': f'搜索任务 {job_id} 已停止'})
         
     except Exception as e:
         error_message = f'停止搜索失败: {str(e)}'
         print(f"[ES Stop Error] {error_message}")
         return jsonify({'success': False, 'message': error_message}), 500
 
+@socketio.on('es_search_join')
+def handle_es_search_join(data):
+    """
+    订阅搜索任务的事件（原始日志、进度、行为触发和完成报告）
+    
+    参数:
+        data (dict): {'job_id': str}
+    """
+    job = es_search_service.get((data or {}).get('job_id')) if es_search_service else None
+    if job is None or job.room is None:
+        emit('es_search_complete', {'success': False, 'job_id': (data or {}).get('job_id'), 'message': '搜索任务不存在'})
+        return
+    delivery.join_room(request.sid, job.room)
+    emit('es_search_progress', job.progress())
+
+@socketio.on('es_search_leave')
+def handle_es_search_leave(data):
+    """取消订阅搜索任务的事件"""
+    job = es_search_service.get((data or {}).get('job_id')) if es_search_service else None
+    if job is not None and job.room is not None:
+        delivery.leave_room(request.sid, job.room)
+
+def init_server():
+    """
+    加载配置并注册退出清理
+
+    并行导入的工作进程以 spawn 方式启动，会以 __mp_main__ 重新导入本模块，
+    只在主进程中执行初始化，工作进程不会重复加载配置或注册退出清理。
+    """
+    atexit.register(session_recorder.close)
+    atexit.register(match_pools.shutdown)
+    load_config()
+
+# 直接运行和 WSGI 服务器（server:app）导入时初始化，spawn 工作进程重新导入主模块时（__mp_main__）跳过
+if __name__ != '__mp_main__':
+    init_server()
+
 if __name__ == '__main__':
     """
     主程序入口
@@ -1729,5 +2205,8 @@ if __name__ == '__main__':
     # 初始化Elasticsearch搜索服务
     initialize_es_search_service()
     
+    # 监视配置文件，修改后自动热更新规则集
+    config_watcher.start(socketio)
+    
     print(f'Log viewer server running on http://localhost:{PORT}')
     socketio.run(app, host='0.0.0.0', port=PORT, debug=False)
\ No newline at end of file
@@ -48,7 +48,7 @@ def disconnect():
 @sio.on('behavior_triggered')
 def on_behavior_triggered(data):
     print("\n检测到行为触发:")
-    print(f"行为名称: {data['behavior']['name']}")
+    print(f"行为名称: {data['behaviorName']} (行为 {data['behaviorId']}, 规则集 {data['rulesetVersion']})")
     print(f"提取的数据: {json.dumps(data['extractedData'], ensure_ascii=False, indent=2)}")
     print(f"验证结果: {json.dumps(data['validationResults'], ensure_ascii=False, indent=2)}")
 
@@ -45,11 +45,17 @@ def connect():
 def disconnect():
     print("已断开连接")
 
-# 接收日志事件处理
+# 接收日志事件处理：系统消息通过 log 单条发送，原始日志行通过 log_batch 批量发送
 @sio.on('log')
 def on_log(data):
-    platform = data.get('platform', 'unknown')
-    message = data.get('message', '')
+    check_log_message(data.get('platform', 'unknown'), data.get('message', ''))
+
+@sio.on('log_batch')
+def on_log_batch(batch):
+    for line in batch.get('lines', []):
+        check_log_message(line.get('platform', 'unknown'), line.get('message', ''))
+
+def check_log_message(platform, message):
     print(f"收到日志 [{platform}]: {message}")
     
     # 捕获服务器端的验证错误日志
@@ -110,8 +116,10 @@ def on_log(data):
 
 @sio.on('behavior_triggered')
 def on_behavior_triggered(data):
+    # 行为触发事件只携带行为引用（规则集版本 + 行为索引）和名称
+    behavior_name = data['behaviorName']
     print("\n检测到行为触发:")
-    print(f"行为名称: {data['behavior']['name']}")
+    print(f"行为名称: {behavior_name} (行为 {data['behaviorId']}, 规则集 {data['rulesetVersion']})")
     
     # 打印提取的数据
     print("\n提取的数据:")
@@ -129,12 +137,12 @@ def on_behavior_triggered(data):
             schema_validation_errors.append({
                 'type': 'json_schema_validation_error',
                 'error': data['validationResults'].get('error', '未知错误'),
-                'behavior_name': data['behavior']['name']
+                'behavior_name': behavior_name
             })
             test_results.append({
                 'type': 'json_schema_validation_error',
                 'error': data['validationResults'].get('error', '未知错误'),
-                'behavior_name': data['behavior']['name']
+                'behavior_name': behavior_name
             })
             
     # 检查是否有验证错误消息
@@ -144,12 +152,12 @@ def on_behavior_triggered(data):
         schema_validation_errors.append({
             'type': 'validation_error_message',
             'message': data['validationErrorMessage'],
-            'behavior_name': data['behavior']['name']
+            'behavior_name': behavior_name
         })
         test_results.append({
             'type': 'validation_error_message',
             'message': data['validationErrorMessage'],
-            'behavior_name': data['behavior']['name']
+            'behavior_name': behavior_name
         })
     
     # 特别检查module字段的类型
@@ -181,7 +189,7 @@ def on_behavior_triggered(data):
                     # 记录测试结果
                     test_result = {
                         'type': 'behavior_validation',
-                        'behavior_name': data['behavior']['name'],
+                        'behavior_name': behavior_name,
                         'module_value': module_value,
                         'module_type': module_type,
                         'is_valid': is_valid,